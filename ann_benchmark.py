@@ -0,0 +1,101 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex, build_ivf
+from quantization import QuantizedStore, quantize_store
+from vector_store import VectorStore, write_vector_store
+
+def clustered_vectors(count, dimension, clusters=None, spread=0.35, seed=0):
+    """Synthetic embeddings: Gaussian blobs around random centres, like topics in real code."""
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(1, count // 500)
+    centres = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(clusters, size=count)
+    return centres[labels] + spread * rng.standard_normal((count, dimension)).astype(np.float32)
+
+def recall_at_k(found, expected):
+    """Mean fraction of the exact top-k ids present in the approximate top-k."""
+    return float(np.mean([len(set(row) & set(truth)) / len(truth) for row, truth in zip(found, expected)]))
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def benchmark(store_path, directory, nlist, nprobes, query_count, k, batch_size, codecs=(), pq_m=None, rerank=None,
+              seed=0):
+    """Build an IVF index and quantized codes of the store at `store_path` and measure them against exact search.
+
+    Returns (nlist, {build step: seconds}, [(mode, recall, QPS, resident bytes)]).
+    """
+    store = VectorStore(store_path)
+    rng = np.random.default_rng(seed + 1)
+    # Queries are perturbed store rows, so every query has true neighbours
+    rows = rng.choice(len(store), query_count, replace=False)
+    queries = np.asarray(store.vectors[np.sort(rows)], dtype=np.float32)
+    queries += 0.1 * rng.standard_normal(queries.shape).astype(np.float32) * np.abs(queries).mean()
+
+    index_path = os.path.join(directory, 'index.ivf')
+    builds = {'ivf': timed(build_ivf, store, index_path, nlist)[1]}
+    index = IVFIndex(index_path)
+    vector_bytes = index.vectors.nbytes
+
+    def run(search, **kwargs):
+        ids = []
+        start = time.perf_counter()
+        for offset in range(0, len(queries), batch_size):
+            ids.append(search(queries[offset:offset + batch_size], k, **kwargs)[0])
+        return np.concatenate(ids), len(queries) / (time.perf_counter() - start)
+
+    expected, exact_qps = run(index.exact_search)
+    results = [(f"exact {index.header['dtype']}", 1.0, exact_qps, vector_bytes)]
+    for nprobe in nprobes:
+        found, qps = run(index.search, nprobe=nprobe)
+        results.append((f'ivf nprobe={nprobe}', recall_at_k(found, expected), qps,
+                        vector_bytes + index.centroids.nbytes))
+    # The codes are written into the index directory, which is a vector store of its own
+    for codec in codecs:
+        builds[codec] = timed(quantize_store, index, codec, **({'m': pq_m} if codec == 'pq' and pq_m else {}))[1]
+        quantized = QuantizedStore(index_path)
+        found, qps = run(quantized.search, rerank=rerank)
+        name = f"pq m={quantized.codec.m}" if codec == 'pq' else codec
+        results.append((name, recall_at_k(found, expected), qps, quantized.memory_bytes()))
+    return index.header['index']['nlist'], builds, results
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure recall@k, QPS and build time of the IVF index.')
+    parser.add_argument('--store', help='Existing vector store to benchmark (default: synthetic vectors).')
+    parser.add_argument('--size', type=int, default=100_000, help='Number of synthetic vectors.')
+    parser.add_argument('--dimension', type=int, default=256, help='Dimension of synthetic vectors.')
+    parser.add_argument('--nlist', type=int, default=None, help='Number of inverted lists (default: 4 * sqrt(n)).')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32, 64],
+                        help='nprobe values to measure.')
+    parser.add_argument('--queries', type=int, default=500, help='Number of queries.')
+    parser.add_argument('--batch-size', type=int, default=32, help='Queries per search call.')
+    parser.add_argument('-k', type=int, default=10, help='Neighbours per query (recall@k).')
+    parser.add_argument('--codecs', nargs='*', default=['int8', 'pq'], help='Quantization codecs to measure.')
+    parser.add_argument('--pq-m', type=int, default=None, help='PQ subspaces (default: dimension / 8).')
+    parser.add_argument('--rerank', type=int, default=None, help='Candidates re-ranked with float vectors.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store_path = args.store
+        if store_path is None:
+            store_path = os.path.join(directory, 'store')
+            vectors = clustered_vectors(args.size, args.dimension)
+            write_vector_store(store_path, [f'{row:x}' for row in range(len(vectors))], [vectors], len(vectors),
+                               args.dimension)
+        nlist, builds, results = benchmark(store_path, directory, args.nlist, args.nprobe, args.queries, args.k,
+                                           args.batch_size, args.codecs, args.pq_m, args.rerank)
+
+    print(f'nlist={nlist}; build: ' + ', '.join(f'{step} {seconds:.2f}s' for step, seconds in builds.items()))
+    print(f'{"mode":<16} {f"recall@{args.k}":>10} {"QPS":>10} {"memory MiB":>11}')
+    for mode, recall, qps, resident in results:
+        print(f'{mode:<16} {recall:>10.3f} {qps:>10.0f} {resident / 2**20:>11.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+import tracing
+from bm25_index import BM25Index
+from metadata_index import MetadataIndex
+from vector_store import VectorStore, normalize_rows, top_k, write_vector_store
+
+CENTROIDS_FILE = 'ivf-centroids.npy'
+OFFSETS_FILE = 'ivf-offsets.npy'
+
+# Lists probed per query unless a search asks otherwise
+DEFAULT_NPROBE = int(os.getenv('ANN_NPROBE', '16'))
+
+def default_nlist(count):
+    """About 4 * sqrt(n) lists, the usual starting point for IVF."""
+    return max(1, min(count, int(4 * np.sqrt(count))))
+
+def assign(vectors, centroids, block_rows=65536):
+    """Return the index of the best-scoring centroid for each row of `vectors`."""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_rows):
+        block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+def train_centroids(vectors, nlist, metric, iterations=10, sample_size=None, seed=0):
+    """Run k-means on a sample of `vectors` and return (nlist, dimension) float32 centroids.
+
+    Scores are inner products, so for the cosine metric the centroids are re-normalized after
+    every update (spherical k-means). Empty lists are re-seeded from random sample rows.
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), sample_size or 64 * nlist)
+    rows = np.sort(rng.choice(len(vectors), sample_size, replace=False))
+    sample = np.asarray(vectors[rows], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for iteration in range(iterations):
+        labels = assign(sample, centroids)
+        counts = np.bincount(labels, minlength=nlist)
+        empty = counts == 0
+        # Sum each list's rows as contiguous runs of the label-sorted sample
+        order = np.argsort(labels, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[~empty]
+        centroids = np.zeros_like(centroids)
+        centroids[~empty] = np.add.reduceat(sample[order], starts, axis=0) / counts[~empty, None]
+        centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        if metric == 'cosine':
+            centroids = normalize_rows(centroids)
+    return centroids.astype(np.float32)
+
+@tracing.traced('ann.build')
+def build_ivf(store, path, nlist=None, iterations=10, sample_size=None, seed=0, block_rows=65536):
+    """Build an IVF-flat index of the vector store `store` at `path`.
+
+    The index is itself a vector store whose rows are sorted by inverted list, so each list is
+    a contiguous slice of the memory-mapped matrix; it adds the centroids and list offsets.
+    Metadata and BM25 indexes of `store` are carried over with their rows renumbered.
+    """
+    nlist = min(nlist or default_nlist(len(store)), len(store))
+    centroids = train_centroids(store.vectors, nlist, store.metric, iterations, sample_size, seed)
+    labels = assign(store.vectors, centroids, block_rows)
+    order = np.argsort(labels, kind='stable')
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+
+    def blocks():
+        for start in range(0, len(order), block_rows):
+            yield np.asarray(store.vectors[order[start:start + block_rows]], dtype=np.float32)
+
+    header = {key: value for key, value in store.header.items()
+              if key not in ('version', 'count', 'dimension', 'dtype', 'metric')}
+    write_vector_store(path, store.ids[order], blocks(), len(store), store.dimension, dtype=store.header['dtype'],
+                       metric=store.metric, **dict(header, index={'type': 'ivf', 'nlist': nlist}))
+    np.save(os.path.join(path, CENTROIDS_FILE), centroids)
+    np.save(os.path.join(path, OFFSETS_FILE), offsets)
+    if MetadataIndex.exists(store.path):
+        MetadataIndex(store.path).remap(path, order)
+    if BM25Index.exists(store.path):
+        BM25Index(store.path).remap(path, order)
+
+class IVFIndex(VectorStore):
+    """IVF-flat index over a memory-mapped vector store.
+
+    search() only scores the `nprobe` lists whose centroids are closest to each query;
+    exact_search() still scans everything.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        if self.header.get('index', {}).get('type') != 'ivf':
+            raise ValueError(f'{path} is not an IVF index.')
+        self.centroids = np.load(os.path.join(path, CENTROIDS_FILE))
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE))
+
+    def exact_search(self, queries, k=10, rows=None):
+        return super().search(queries, k, rows)
+
+    @tracing.traced('ann.search')
+    def search(self, queries, k=10, nprobe=None, rows=None):
+        """Return (ids, scores) of the approximate `k` best rows for each query, best first.
+
+        Queries probing the same list are scored together with one matrix product per list.
+        With `rows` (sorted row numbers) only those rows of each probed list are scored; when
+        `rows` is no larger than what the probes would scan anyway, it is searched exactly, as
+        are filtered queries whose probed lists hold fewer than `k` of the allowed rows.
+        Unfiltered queries whose probed lists hold fewer than `k` rows are padded with -inf.
+        """
+        nprobe = min(nprobe or DEFAULT_NPROBE, len(self.centroids))
+        if rows is not None and len(rows) * len(self.centroids) <= len(self) * nprobe:
+            return self.exact_search(queries, k, rows)
+        queries = self.prepare_queries(queries)
+        probes = top_k(queries @ self.centroids.T, nprobe)
+        # Group (query, list) pairs by list
+        pairs = np.argsort(probes, axis=None, kind='stable')
+        lists = probes.ravel()[pairs]
+        query_of_pair = pairs // probes.shape[1]
+        boundaries = np.flatnonzero(np.diff(lists)) + 1
+        candidate_scores = [[] for _ in queries]
+        candidate_rows = [[] for _ in queries]
+        for group in np.split(np.arange(len(lists)), boundaries):
+            list_id = lists[group[0]]
+            low, high = self.offsets[list_id], self.offsets[list_id + 1]
+            if low == high:
+                continue
+            members = query_of_pair[group]
+            selection = slice(low, high)
+            if rows is not None:
+                selection = rows[np.searchsorted(rows, low):np.searchsorted(rows, high)]
+                if not len(selection):
+                    continue
+            scores = queries[members] @ np.asarray(self.vectors[selection], dtype=np.float32).T
+            columns = top_k(scores, k)
+            scores = np.take_along_axis(scores, columns, axis=1)
+            row_numbers = columns + low if rows is None else selection[columns]
+            for position, query in enumerate(members):
+                candidate_scores[query].append(scores[position])
+                candidate_rows[query].append(row_numbers[position])
+
+        k = min(k, len(self) if rows is None else len(rows))
+        result_rows = np.zeros((len(queries), k), dtype=np.int64)
+        result_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for query in range(len(queries)):
+            if not candidate_scores[query]:
+                continue
+            scores = np.concatenate(candidate_scores[query])
+            candidates = np.concatenate(candidate_rows[query])
+            best = top_k(scores[None, :], k)[0]
+            best = best[np.argsort(-scores[best], kind='stable')]
+            result_rows[query, :len(best)] = candidates[best]
+            result_scores[query, :len(best)] = scores[best]
+        result_ids = self.ids_of(result_rows)
+        # Filtered queries whose probed lists held fewer than k allowed rows are searched exactly
+        short = np.isneginf(result_scores).any(axis=1)
+        if rows is not None and short.any():
+            result_ids[short], result_scores[short] = self.exact_search(queries[short], k, rows)
+        return result_ids, result_scores
+
+def default_index_path(store_path):
+    return store_path.rstrip(os.sep) + '.ivf'
+
+def main():
+    parser = argparse.ArgumentParser(description='Build an IVF-flat index from a vector store.')
+    parser.add_argument('store', help='Vector store directory (see vector_store.py build).')
+    parser.add_argument('--output', help='Index directory (default: the store path with an .ivf suffix).')
+    parser.add_argument('--nlist', type=int, default=None, help='Number of inverted lists (default: 4 * sqrt(n)).')
+    parser.add_argument('--iterations', type=int, default=10, help='k-means iterations.')
+    args = parser.parse_args()
+
+    store = VectorStore(args.store)
+    start = time.perf_counter()
+    build_ivf(store, args.output or default_index_path(args.store), args.nlist, args.iterations)
+    print(f'Indexed {len(store)} vectors in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from array import array
+
+import numpy as np
+
+import tracing
+from vector_store import HEADER_FILE, top_k
+
+VOCABULARY_FILE = 'bm25-vocabulary.npy'
+OFFSETS_FILE = 'bm25-offsets.npy'
+POSTINGS_FILE = 'bm25-postings.npy'
+IMPACTS_FILE = 'bm25-impacts.npy'
+MAX_IMPACTS_FILE = 'bm25-max-impacts.npy'
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion constant and how deep each ranking is read before fusing
+RRF_K = 60
+FUSION_DEPTH = int(os.getenv('FUSION_DEPTH', '50'))
+
+# Letters of any script, so non-ASCII identifiers ('größe_berechnen', 'Société') stay whole
+IDENTIFIER_PATTERN = re.compile(r'[^\W\d]\w*|\d+')
+# snake_case parts are split on underscores; this splits ASCII CamelCase
+PART_PATTERN = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+
+def identifier_parts(identifier):
+    """Return the snake_case and CamelCase parts of an identifier.
+
+    ASCII identifiers use PART_PATTERN; others are split on case and digit changes with the
+    Unicode-aware str methods, which re character classes cannot express.
+    """
+    if identifier.isascii():
+        return PART_PATTERN.findall(identifier)
+    parts = []
+    for word in identifier.split('_'):
+        start = 0
+        for position in range(1, len(word)):
+            previous, current, following = word[position - 1], word[position], word[position + 1:position + 2]
+            if (previous.isdigit() != current.isdigit() or (previous.islower() and current.isupper())
+                    or (previous.isupper() and current.isupper() and following.islower())):
+                parts.append(word[start:position])
+                start = position
+        if word:
+            parts.append(word[start:])
+    return parts
+
+def tokenize(text):
+    """Yield lexical tokens: every identifier whole, plus its snake_case and CamelCase parts.
+
+    '_compute_amount_total' gives 'compute_amount_total', 'compute', 'amount', 'total', so
+    exact identifiers match precisely while their parts still match loosely.
+    """
+    for identifier in IDENTIFIER_PATTERN.findall(text):
+        whole = identifier.strip('_').lower()
+        if not whole:
+            continue
+        yield whole
+        parts = identifier_parts(identifier)
+        if len(parts) > 1:
+            for part in parts:
+                yield part.lower()
+
+def write_bm25_index(path, documents, count, k1=BM25_K1, b=BM25_B):
+    """Write a BM25 index of `documents`, (row, text) pairs for a store of `count` rows, into `path`.
+
+    Postings are sorted by row and hold precomputed BM25 impacts (the full per-term score of a
+    document), so a query is a gather and a sum per term with nothing left to compute; the
+    largest impact of each term bounds what it can add. Returns the vocabulary size.
+    """
+    vocabulary = {}
+    term_ids, rows, frequencies = array('i'), array('i'), array('i')
+    lengths = np.zeros(count, dtype=np.float32)
+    for row, text in documents:
+        counts = {}
+        length = 0
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+            length += 1
+        lengths[row] = length
+        for token, frequency in counts.items():
+            term_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+            rows.append(row)
+            frequencies.append(frequency)
+
+    term_ids = np.frombuffer(term_ids, dtype=np.int32)
+    rows = np.frombuffer(rows, dtype=np.int32)
+    frequencies = np.frombuffer(frequencies, dtype=np.int32).astype(np.float32)
+
+    # Renumber terms in sorted order so lookups can binary-search the vocabulary
+    terms = np.array([term.encode() for term in vocabulary], dtype='S') if vocabulary else np.empty(0, dtype='S1')
+    term_order = np.argsort(terms, kind='stable')
+    rank = np.empty(len(terms), dtype=np.int32)
+    rank[term_order] = np.arange(len(terms), dtype=np.int32)
+    term_ids = rank[term_ids]
+    order = np.lexsort((rows, term_ids))
+    term_ids, rows, frequencies = term_ids[order], rows[order], frequencies[order]
+
+    document_frequency = np.bincount(term_ids, minlength=len(terms))
+    idf = np.log(1 + (count - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+    norms = k1 * (1 - b + b * lengths / max(lengths.mean() if count else 0, 1))
+    impacts = idf[term_ids] * frequencies * (k1 + 1) / (frequencies + norms[rows])
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(document_frequency, out=offsets[1:])
+
+    impacts = impacts.astype(np.float32)
+    write_postings(path, terms[term_order], offsets, rows, impacts)
+    with open(os.path.join(path, HEADER_FILE)) as file:
+        header = json.load(file)
+    header['bm25'] = {'documents': count, 'terms': len(terms), 'k1': k1, 'b': b}
+    with open(os.path.join(path, HEADER_FILE), 'w') as file:
+        json.dump(header, file, indent=2)
+    return len(terms)
+
+def write_postings(path, vocabulary, offsets, rows, impacts):
+    max_impacts = np.maximum.reduceat(impacts, offsets[:-1]) if len(impacts) else np.empty(0, dtype=np.float32)
+    np.save(os.path.join(path, VOCABULARY_FILE), vocabulary)
+    np.save(os.path.join(path, OFFSETS_FILE), offsets)
+    np.save(os.path.join(path, POSTINGS_FILE), rows)
+    np.save(os.path.join(path, IMPACTS_FILE), impacts)
+    np.save(os.path.join(path, MAX_IMPACTS_FILE), max_impacts)
+
+def build_bm25_index(records, store):
+    """Build the BM25 index of vector store `store` from the chunk texts of a record store.
+
+    Returns the vocabulary size.
+    """
+    row_of_hash = {digest.decode(): row for row, digest in enumerate(store.ids)}
+    documents = ((row_of_hash[digest], text) for digest, text in records.iter_chunks() if digest in row_of_hash)
+    return write_bm25_index(store.path, documents, len(store))
+
+class BM25Index:
+    """Memory-mapped BM25 index over the rows of a vector store."""
+
+    def __init__(self, path):
+        self.path = path
+        self.vocabulary = np.load(os.path.join(path, VOCABULARY_FILE), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode='r')
+        self.postings = np.load(os.path.join(path, POSTINGS_FILE), mmap_mode='r')
+        self.impacts = np.load(os.path.join(path, IMPACTS_FILE), mmap_mode='r')
+        self.max_impacts = np.load(os.path.join(path, MAX_IMPACTS_FILE), mmap_mode='r')
+        with open(os.path.join(path, HEADER_FILE)) as file:
+            self.documents = json.load(file)['bm25']['documents']
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(os.path.join(path, VOCABULARY_FILE))
+
+    def term_position(self, token):
+        key = token.encode()
+        position = int(np.searchsorted(self.vocabulary, key))
+        if position < len(self.vocabulary) and self.vocabulary[position] == key:
+            return position
+        return None
+
+    @tracing.traced('bm25.search')
+    def search(self, query, k=10, rows=None):
+        """Return (row numbers, scores) of the `k` best rows for the query text, best first.
+
+        `rows`, sorted row numbers from metadata_index, restricts the candidates. Terms are
+        scored highest impact first (MaxScore): once the k-th best score beats everything the
+        remaining terms could add, no other row can enter the top k, and the remaining, usually
+        very common, terms only add to the rows already found.
+        """
+        terms = [position for position in map(self.term_position, set(tokenize(query))) if position is not None]
+        terms.sort(key=lambda position: -self.max_impacts[position])
+        # remaining[i] is the most terms i+1.. can add to a row
+        remaining = np.append(np.cumsum([self.max_impacts[position] for position in terms[::-1]])[::-1], 0)[1:]
+        scores = np.zeros(self.documents, dtype=np.float32)
+        candidates = found = np.empty(0, dtype=np.int64)
+        for term, position in enumerate(terms):
+            low, high = self.offsets[position], self.offsets[position + 1]
+            postings = self.postings[low:high]
+            if len(candidates) and len(postings) > 16 * len(candidates):
+                # Postings are sorted by row, so a few candidates are cheaper to find by binary search
+                positions = np.minimum(np.searchsorted(postings, candidates), len(postings) - 1)
+                hit = postings[positions] == candidates
+                scores[candidates[hit]] += self.impacts[low:high][positions[hit]]
+                continue
+            # Rows outside the candidates may collect some of this, but are never ranked
+            np.add.at(scores, postings, self.impacts[low:high])
+            if len(candidates):
+                continue
+            found = np.flatnonzero(scores > 0) if rows is None else rows[scores[rows] > 0]
+            if remaining[term] and len(found) >= k and np.partition(scores[found], -k)[-k] > remaining[term]:
+                candidates = found
+        best = found[top_k(scores[found][None, :], k)[0]] if len(found) else found
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return best, scores[best]
+
+    def remap(self, path, order):
+        """Write this index for a copy of the store whose row i is old row order[i]."""
+        new_row = np.empty(len(order), dtype=np.int32)
+        new_row[order] = np.arange(len(order), dtype=np.int32)
+        rows = new_row[self.postings]
+        term_ids = np.repeat(np.arange(len(self.vocabulary)), np.diff(self.offsets))
+        order = np.lexsort((rows, term_ids))
+        write_postings(path, self.vocabulary, self.offsets, rows[order], np.asarray(self.impacts)[order])
+
+def reciprocal_rank_fusion(rankings, k=10, constant=RRF_K):
+    """Fuse ranked id lists: each id scores the sum of 1 / (constant + rank) over the lists.
+
+    Returns [(id, fused score)], best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (constant + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])[:k]
+
+def hybrid_search(store, lexical, query, query_vector, k=10, rows=None, depth=None):
+    """Search `store` by vector and `lexical` by BM25 and fuse both rankings with RRF.
+
+    Returns [(id, fused score)], best first; ids are the store's chunk hashes.
+    """
+    depth = max(depth or FUSION_DEPTH, k)
+    vector_ids, vector_scores = store.search(query_vector, depth, rows=rows)
+    lexical_rows, lexical_scores = lexical.search(query, depth, rows=rows)
+    rankings = [
+        [digest for digest, score in zip(vector_ids[0], vector_scores[0]) if np.isfinite(score)],
+        list(store.ids[lexical_rows]),
+    ]
+    return reciprocal_rank_fusion(rankings, k)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the BM25 index of a vector store.')
+    parser.add_argument('index', help='Path of the index file written by index_update.')
+    parser.add_argument('store', help='Vector store directory (see vector_store.py build).')
+    args = parser.parse_args()
+
+    from code_index import RecordStore
+    from vector_store import VectorStore
+    records = RecordStore(args.index)
+    start = time.perf_counter()
+    try:
+        terms = build_bm25_index(records, VectorStore(args.store))
+    finally:
+        records.close()
+    print(f'Indexed {terms} terms in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
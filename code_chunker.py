@@ -0,0 +1,276 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import re
+import sys
+import textwrap
+from multiprocessing import Pool
+from xml.parsers import expat
+
+from odoo_scanner import LANGUAGES, iter_source_files
+from odoo_xml import CONTAINER_TAGS
+
+# Chunk size limits, in tokens as counted by count_tokens()
+TOKEN_BUDGET = int(os.getenv('CHUNK_TOKEN_BUDGET', '512'))
+OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '64'))
+# Files cut into plain line windows (scripts, stylesheets, unparseable files) larger than this
+# are vendored or generated, and are not chunked
+TEXT_MAX_BYTES = int(os.getenv('CHUNK_TEXT_MAX_BYTES', str(1024 * 1024)))
+
+# Other CSV files load data, whose rows the scanner already indexes as records
+CHUNKED_CSV = {'ir.model.access.csv'}
+
+# Words and single punctuation characters; close enough to BPE counts for sizing chunks
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+def count_tokens(text):
+    return len(TOKEN_PATTERN.findall(text))
+
+def normalize(text):
+    """Return `text` dedented, without trailing whitespace and without blank lines."""
+    lines = (line.rstrip() for line in textwrap.dedent(text).splitlines())
+    return '\n'.join(line for line in lines if line)
+
+def content_hash(text):
+    return hashlib.sha256(normalize(text).encode()).hexdigest()
+
+class Chunker:
+    """Cut the lines of one file into chunks along the spans it is given.
+
+    Spans are (kind, name, first line, last line). A span within the budget becomes one chunk;
+    a larger span is cut into line windows where each window repeats the last OVERLAP_TOKENS
+    worth of lines of the previous one. `lines` may be a window of the file that starts after
+    `offset` lines, as kept while streaming.
+    """
+
+    def __init__(self, lines, base, budget, overlap):
+        self.lines = lines
+        self.offset = 0
+        self.base = base
+        self.budget = budget
+        self.overlap = overlap
+        self.chunks = []
+
+    @property
+    def last_line(self):
+        return self.offset + len(self.lines)
+
+    def drop(self, line):
+        """Forget the lines before `line`; no span added later may start before it."""
+        if line - 1 > self.offset:
+            del self.lines[:line - 1 - self.offset]
+            self.offset = line - 1
+
+    def text(self, first, last):
+        return ''.join(self.lines[first - 1 - self.offset:last - self.offset])
+
+    def tokens(self, first, last):
+        return count_tokens(self.text(first, last))
+
+    def add(self, kind, name, first, last, **fields):
+        if self.tokens(first, last) <= self.budget:
+            self.emit(kind, name, first, last, **fields)
+            return
+        counts = [count_tokens(line) for line in self.lines[first - 1 - self.offset:last - self.offset]]
+        start = first
+        while start <= last:
+            end, total = start, counts[start - first]
+            while end < last and total + counts[end + 1 - first] <= self.budget:
+                end += 1
+                total += counts[end - first]
+            self.emit(kind, name, start, end, part=True, **fields)
+            if end == last:
+                break
+            # Step back over up to `overlap` tokens of lines, but always move forward
+            next_start, carried = end + 1, 0
+            while next_start - 1 > start and carried + counts[next_start - 1 - first] <= self.overlap:
+                next_start -= 1
+                carried += counts[next_start - first]
+            start = next_start
+
+    def emit(self, kind, name, first, last, part=False, **fields):
+        text = self.text(first, last)
+        if not text.strip():
+            return
+        self.chunks.append(dict(self.base, type='chunk', kind=kind, name=name, line=first, end_line=last,
+                                part=part, tokens=count_tokens(text), hash=content_hash(text), text=text,
+                                **fields))
+
+def node_start(node):
+    """First line of a statement, including its decorators."""
+    return min([node.lineno] + [decorator.lineno for decorator in getattr(node, 'decorator_list', [])])
+
+def python_spans(chunker, tree, module_name):
+    """Add chunks for a module: classes, methods and functions, and blocks of other statements."""
+    def blocks(body, kind, name, first_line, **fields):
+        # Consecutive non-definition statements are packed into blocks under the budget
+        start = end = None
+        for node in body:
+            if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                if start is None and first_line is not None and first_line < node_start(node):
+                    start, end = first_line, node_start(node) - 1
+                first_line = None
+                if start is not None:
+                    chunker.add(kind, name, start, end, **fields)
+                    start = None
+                    kind = 'fields' if kind == 'class' else kind
+                yield node
+                continue
+            if start is None:
+                start = first_line if first_line is not None else node_start(node)
+                first_line = None
+            elif chunker.tokens(start, node.end_lineno) > chunker.budget:
+                chunker.add(kind, name, start, end, **fields)
+                start = node_start(node)
+                kind = 'fields' if kind == 'class' else kind
+            end = node.end_lineno
+        if start is not None:
+            chunker.add(kind, name, start, end, **fields)
+
+    def definition(node, class_name):
+        qualname = f'{class_name}.{node.name}' if class_name else node.name
+        first = node_start(node)
+        if isinstance(node, ast.ClassDef):
+            if chunker.tokens(first, node.end_lineno) <= chunker.budget:
+                chunker.add('class', qualname, first, node.end_lineno, class_name=class_name)
+                return
+            # The class header travels with the attributes and fields that follow it
+            for child in blocks(node.body, 'class', qualname, first, class_name=qualname):
+                definition(child, qualname)
+        else:
+            chunker.add('method' if class_name else 'function', qualname, first, node.end_lineno,
+                        class_name=class_name)
+
+    for node in blocks(tree.body, 'module', module_name, None):
+        definition(node, None)
+
+def xml_spans(chunker, file):
+    """Add one chunk per top-level data element (record, template, menuitem...) of an XML file.
+
+    The binary `file` is fed to the parser line by line, and only the lines of the element
+    being read are kept, so memory does not grow with the size of the file.
+    """
+    parser = expat.ParserCreate()
+    stack = []
+    state = {'open': None, 'closed': None}
+
+    def close():
+        # An element ends where the next parser event begins
+        if state['closed']:
+            tag, name, line = state['closed']
+            chunker.add('xml_record', name or tag, line, parser.CurrentLineNumber, tag=tag)
+            state['closed'] = None
+        if not state['open']:
+            chunker.drop(parser.CurrentLineNumber)
+
+    def start(tag, attributes):
+        close()
+        if stack and stack[-1] in CONTAINER_TAGS and tag not in CONTAINER_TAGS:
+            state['open'] = (tag, attributes.get('id') or attributes.get('model'), parser.CurrentLineNumber)
+        stack.append(tag)
+
+    def end(tag):
+        close()
+        stack.pop()
+        if stack and stack[-1] in CONTAINER_TAGS and tag not in CONTAINER_TAGS:
+            state['closed'], state['open'] = state['open'], None
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = lambda data: close()
+    parser.CommentHandler = lambda data: close()
+    for line in file:
+        chunker.lines.append(line.decode('utf-8', errors='replace'))
+        parser.Parse(line, False)
+    parser.Parse(b'', True)
+    if state['closed']:
+        tag, name, line = state['closed']
+        chunker.add('xml_record', name or tag, line, chunker.last_line, tag=tag)
+
+def text_spans(chunker, file, name):
+    """Add line windows over the whole of `file`, unless it is larger than TEXT_MAX_BYTES."""
+    chunker.chunks = []
+    if os.fstat(file.fileno()).st_size > TEXT_MAX_BYTES:
+        return
+    file.seek(0)
+    chunker.lines = file.read().decode('utf-8', errors='replace').splitlines(keepends=True)
+    chunker.offset = 0
+    chunker.add('text', name, 1, len(chunker.lines))
+
+def chunk_file(job, budget=None, overlap=None):
+    """Chunk one file and return its chunk records. `job` is (root, relative path, addon).
+
+    XML files are streamed record by record; CSV files other than access rules are skipped.
+    """
+    root, path, addon = job
+    budget = budget or TOKEN_BUDGET
+    overlap = OVERLAP_TOKENS if overlap is None else overlap
+    language = LANGUAGES[os.path.splitext(path)[1]]
+    name = os.path.basename(path)
+    if language == 'csv' and name not in CHUNKED_CSV:
+        return []
+    chunker = Chunker([], {'path': path, 'module': addon, 'language': language}, budget, overlap)
+    try:
+        with open(os.path.join(root, path), 'rb') as file:
+            try:
+                if language == 'python':
+                    source = file.read()
+                    chunker.lines = source.decode('utf-8', errors='replace').splitlines(keepends=True)
+                    python_spans(chunker, ast.parse(source, filename=path), path)
+                elif language == 'xml':
+                    xml_spans(chunker, file)
+                else:
+                    text_spans(chunker, file, name)
+            except (SyntaxError, ValueError, expat.ExpatError):
+                # Unparseable files are still searchable, as plain line windows
+                text_spans(chunker, file, name)
+    except OSError:
+        return []
+    return chunker.chunks
+
+def dedup_stats(hashes):
+    """Return {'chunks', 'unique', 'ratio'} for an iterable of chunk hashes.
+
+    `ratio` is chunks per unique chunk; 1.0 means nothing was deduplicated.
+    """
+    chunks = 0
+    unique = set()
+    for digest in hashes:
+        chunks += 1
+        unique.add(digest)
+    return {'chunks': chunks, 'unique': len(unique), 'ratio': chunks / len(unique) if unique else 1.0}
+
+def iter_chunked_files(root, workers=None, chunksize=32):
+    """Yield the chunk list of every source file below `root`, chunking files on a process pool."""
+    jobs = ((root, path, addon) for path, addon in iter_source_files(root))
+    with Pool(workers) as pool:
+        yield from pool.imap_unordered(chunk_file, jobs, chunksize=chunksize)
+
+def main():
+    parser = argparse.ArgumentParser(description='Split an Odoo checkout into deduplicated chunks for embedding.')
+    parser.add_argument('root', help='Path to the Odoo checkout or addons directory.')
+    parser.add_argument('-o', '--output', default='-', help="Output file for unique chunks, or '-' for stdout.")
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: CPU count).')
+    args = parser.parse_args()
+
+    seen = set()
+    hashes = []
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        for chunks in iter_chunked_files(args.root, workers=args.workers):
+            for chunk in chunks:
+                hashes.append(chunk['hash'])
+                if chunk['hash'] not in seen:
+                    seen.add(chunk['hash'])
+                    output.write(json.dumps(chunk) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    stats = dedup_stats(hashes)
+    print(f"{stats['chunks']} chunks, {stats['unique']} unique (dedup ratio {stats['ratio']:.2f}x, "
+          f"{1 - 1 / stats['ratio']:.0%} saved)", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+from code_chunker import chunk_file, dedup_stats
+from odoo_scanner import LANGUAGES, iter_scanned_files, scan_file
+
+# File name of the index inside a repository's .git directory
+INDEX_FILE_NAME = 'odoo-index.sqlite3'
+
+# Commit header of the history walk: a record separator, then unit-separated fields
+COMMIT_FORMAT = '%x1e%H%x1f%an%x1f%ae%x1f%aI%x1f%s'
+COMMIT_FIELDS = ('hash', 'author', 'email', 'date', 'message')
+
+class RecordStore:
+    """SQLite store of scanner and chunk records, grouped by file path.
+
+    Chunk texts are stored once per content hash in a separate table, however many files
+    contain them; chunk records only carry the hash. Records are never updated in place. When a file changes or disappears its live records get
+    a tombstone (the commit they were dropped in), so downstream indexes can tell exactly which
+    records to remove. compact() deletes tombstoned rows once they have been consumed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                type TEXT NOT NULL,
+                data TEXT NOT NULL,
+                indexed_in TEXT,
+                deleted_in TEXT
+            );
+            CREATE INDEX IF NOT EXISTS records_live_path ON records (path) WHERE deleted_in IS NULL;
+            CREATE INDEX IF NOT EXISTS records_chunk_hash ON records (json_extract(data, '$.hash'))
+                WHERE type = 'chunk';
+            CREATE TABLE IF NOT EXISTS chunks (
+                hash TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                tokens INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        ''')
+
+    def get_state(self, key, default=None):
+        row = self.connection.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+        self.connection.execute('INSERT OR REPLACE INTO state VALUES (?, ?)', (key, value))
+
+    def tombstone(self, path, commit):
+        """Mark the live records of `path` as deleted in `commit`. Returns the number of records."""
+        cursor = self.connection.execute(
+            'UPDATE records SET deleted_in = ? WHERE path = ? AND deleted_in IS NULL', (commit, path))
+        return cursor.rowcount
+
+    def replace_file(self, path, records, commit):
+        """Tombstone the live records of `path` and store `records` in their place."""
+        self.tombstone(path, commit)
+        records = list(records)
+        chunk_texts = {}
+        for index, record in enumerate(records):
+            if record['type'] == 'chunk' and 'text' in record:
+                chunk_texts[record['hash']] = (record['text'], record['tokens'])
+                records[index] = {key: value for key, value in record.items() if key != 'text'}
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO chunks VALUES (?, ?, ?)',
+            [(digest, text, tokens) for digest, (text, tokens) in chunk_texts.items()])
+        self.connection.executemany(
+            'INSERT INTO records (path, type, data, indexed_in) VALUES (?, ?, ?, ?)',
+            [(path, record['type'], json.dumps(record, default=str), commit) for record in records])
+
+    def iter_records(self, path=None, record_type=None):
+        """Yield (id, record) for live records, optionally limited to one path or record type."""
+        query = 'SELECT id, data FROM records WHERE deleted_in IS NULL'
+        arguments = []
+        if path is not None:
+            query += ' AND path = ?'
+            arguments.append(path)
+        if record_type is not None:
+            query += ' AND type = ?'
+            arguments.append(record_type)
+        for record_id, data in self.connection.execute(query + ' ORDER BY id', arguments):
+            yield record_id, json.loads(data)
+
+    def iter_tombstones(self, since=None):
+        """Yield (id, path) for tombstoned records, optionally only those with an id above `since`."""
+        query = 'SELECT id, path FROM records WHERE deleted_in IS NOT NULL'
+        arguments = []
+        if since is not None:
+            query += ' AND id > ?'
+            arguments.append(since)
+        yield from self.connection.execute(query + ' ORDER BY id', arguments)
+
+    def chunk_text(self, digest):
+        row = self.connection.execute('SELECT text FROM chunks WHERE hash = ?', (digest,)).fetchone()
+        return row[0] if row else None
+
+    def chunk_hashes(self):
+        """Return the hashes of all stored chunk texts, sorted."""
+        return [digest for digest, in self.connection.execute('SELECT hash FROM chunks ORDER BY hash')]
+
+    def iter_chunk_records(self, digest):
+        """Yield the live chunk records with content hash `digest`."""
+        for data, in self.connection.execute(
+                "SELECT data FROM records WHERE type = 'chunk' AND json_extract(data, '$.hash') = ? "
+                "AND deleted_in IS NULL ORDER BY id", (digest,)):
+            yield json.loads(data)
+
+    def chunk_records(self, digests):
+        """Return {hash: [live chunk records]} for many content hashes in one query."""
+        digests = list(dict.fromkeys(digests))
+        records = {digest: [] for digest in digests}
+        if digests:
+            for data, in self.connection.execute(
+                    "SELECT data FROM records WHERE type = 'chunk' AND json_extract(data, '$.hash') IN "
+                    f"({', '.join('?' * len(digests))}) AND deleted_in IS NULL ORDER BY id", digests):
+                record = json.loads(data)
+                records[record['hash']].append(record)
+        return records
+
+    def iter_chunks(self):
+        """Yield (hash, text) for every stored chunk text."""
+        yield from self.connection.execute('SELECT hash, text FROM chunks ORDER BY hash')
+
+    def dedup_stats(self):
+        """Return the dedup statistics of the live chunk records (see code_chunker.dedup_stats)."""
+        return dedup_stats(digest for digest, in self.connection.execute(
+            "SELECT json_extract(data, '$.hash') FROM records WHERE type = 'chunk' AND deleted_in IS NULL"))
+
+    def compact(self):
+        """Delete tombstoned records and chunk texts no live record refers to."""
+        self.connection.execute('DELETE FROM records WHERE deleted_in IS NOT NULL')
+        self.connection.execute('''
+            DELETE FROM chunks WHERE hash NOT IN (
+                SELECT json_extract(data, '$.hash') FROM records WHERE type = 'chunk')
+        ''')
+        self.commit()
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+def index_file(job):
+    """Scan and chunk one file. `job` is (root, relative path, addon)."""
+    return scan_file(job) + chunk_file(job)
+
+def default_index_path(repo):
+    return os.path.join(repo.git_dir, INDEX_FILE_NAME)
+
+def diff_paths(repo, old_commit, new_commit):
+    """Return the added, modified, deleted and renamed paths between two commits.
+
+    `renamed` is a list of (old path, new path) pairs; everything else is a list of paths.
+    """
+    changes = {'added': [], 'modified': [], 'deleted': [], 'renamed': []}
+    fields = repo.git.diff('--name-status', '-M', '-z', '--no-color', old_commit, new_commit).split('\0')
+    position = 0
+    while position < len(fields) and fields[position]:
+        status = fields[position]
+        if status[0] in 'RC':
+            old_path, new_path = fields[position + 1], fields[position + 2]
+            if status[0] == 'R':
+                changes['renamed'].append((old_path, new_path))
+            else:
+                changes['added'].append(new_path)
+            position += 3
+            continue
+        path = fields[position + 1]
+        if status[0] == 'A':
+            changes['added'].append(path)
+        elif status[0] == 'D':
+            changes['deleted'].append(path)
+        else:
+            changes['modified'].append(path)
+        position += 2
+    return changes
+
+def last_commits(repo, paths, revision='HEAD', block_size=1 << 20):
+    """Return {path: commit} with the last commit that touched each of `paths` at `revision`.
+
+    Instead of a `git log -1` per file, one `git log --name-status` is streamed newest first
+    and stopped as soon as every path has been seen. Commits are dicts of COMMIT_FIELDS and
+    are shared between the paths they touched; paths that were never committed are left out.
+    """
+    pending = set(paths)
+    found = {}
+    if not pending:
+        return found
+    process = repo.git.log('--name-status', '--no-renames', '-z', f'--format={COMMIT_FORMAT}', revision,
+                           as_process=True)
+    commit, tail, status = None, b'', False
+    try:
+        for block in iter(lambda: process.stdout.read(block_size), b''):
+            # Tokens are NUL-terminated: a commit header, then a status and a path per file
+            tokens = (tail + block).split(b'\0')
+            tail = tokens.pop()
+            for token in tokens:
+                if status:
+                    status = False
+                    path = token.decode('utf-8', 'surrogateescape')
+                    if path in pending:
+                        pending.remove(path)
+                        found[path] = commit
+                elif token.startswith(b'\x1e'):
+                    commit = dict(zip(COMMIT_FIELDS, token[1:].decode('utf-8', 'replace').split('\x1f', 4)))
+                else:
+                    status = True
+            if not pending:
+                break
+        else:
+            # Raises GitCommandError when git failed
+            process.wait()
+    finally:
+        # Once every path is found the rest of the history is never read
+        if process.proc.poll() is None:
+            process.proc.kill()
+            process.proc.wait()
+    return found
+
+def dirty_paths(repo):
+    """Return the scanned paths whose working tree content is not what HEAD holds: uncommitted
+    changes to tracked files and untracked files."""
+    changed = repo.git.diff('HEAD', '--name-only', '--no-renames', '-z').split('\0')
+    untracked = repo.git.ls_files('--others', '--exclude-standard', '-z').split('\0')
+    return sorted({path for path in changed + untracked if os.path.splitext(path)[1] in LANGUAGES})
+
+def update_index(repo, store, workers=None):
+    """Bring the record store up to date with HEAD of `repo`.
+
+    Only files that changed since the last indexed commit are re-parsed; records of deleted
+    files and the old side of renames are tombstoned. Without a last indexed commit the whole
+    working tree is scanned. Files are read from the working tree, so paths with uncommitted
+    changes are remembered ('dirty_paths') and re-parsed on the next update, whatever HEAD is
+    then, so uncommitted content never outlives the next update. File records of
+    re-parsed files get the last commit that touched them ('commit', see last_commits); the
+    others keep theirs. Returns a summary of what was done.
+    """
+    root = repo.working_tree_dir
+    head = repo.head.commit.hexsha
+    last = store.get_state('last_indexed_commit')
+    previously_dirty = json.loads(store.get_state('dirty_paths') or '[]')
+    dirty = dirty_paths(repo)
+    summary = {'from': last, 'to': head, 'added': 0, 'modified': 0, 'deleted': 0, 'renamed': 0,
+               'files': 0, 'records': 0, 'chunks': 0, 'tombstoned': 0, 'commits': 0, 'dirty': len(dirty)}
+    if last == head and not previously_dirty and not dirty:
+        return summary
+
+    if last is None:
+        paths = None
+    else:
+        changes = diff_paths(repo, last, head) if last != head else {
+            'added': [], 'modified': [], 'deleted': [], 'renamed': []}
+        for key in ('added', 'modified', 'deleted', 'renamed'):
+            summary[key] = len(changes[key])
+        for path in changes['deleted']:
+            summary['tombstoned'] += store.tombstone(path, head)
+        for old_path, new_path in changes['renamed']:
+            summary['tombstoned'] += store.tombstone(old_path, head)
+        paths = changes['added'] + changes['modified'] + [new_path for old_path, new_path in changes['renamed']]
+        # Files that changed into something the scanner does not handle lose their records too
+        for path in paths:
+            if os.path.splitext(path)[1] not in LANGUAGES:
+                summary['tombstoned'] += store.tombstone(path, head)
+        # Paths dirty now or at the last update are re-read; those gone from the tree are dropped
+        for path in sorted(set(previously_dirty + dirty) - set(paths)):
+            if os.path.exists(os.path.join(root, path)):
+                paths.append(path)
+            else:
+                summary['tombstoned'] += store.tombstone(path, head)
+
+    tracked = repo.git.ls_files('-z').split('\0') if paths is None else paths
+    history = last_commits(repo, [path for path in tracked if os.path.splitext(path)[1] in LANGUAGES], head)
+    summary['commits'] = len({commit['hash'] for commit in history.values()})
+
+    for records in iter_scanned_files(root, paths=paths, workers=workers, scan=index_file):
+        path = records[0]['path']
+        if path in history:
+            records[0]['commit'] = history[path]
+        store.replace_file(path, records, head)
+        summary['files'] += 1
+        summary['records'] += len(records)
+        summary['chunks'] += sum(record['type'] == 'chunk' for record in records)
+
+    store.set_state('last_indexed_commit', head)
+    store.set_state('dirty_paths', json.dumps(dirty))
+    store.set_state('last_indexed_at', datetime.now(timezone.utc).isoformat())
+    store.commit()
+    return summary
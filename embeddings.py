@@ -0,0 +1,285 @@
+import argparse
+import fcntl
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+import numpy as np
+
+import tracing
+from code_chunker import count_tokens
+
+# Shared by every repository: entries are keyed by content, not by path
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE', os.path.expanduser('~/.cache/git-assistant/embeddings'))
+# 'openai' or 'hash'; defaults to OpenAI when an API key is configured
+EMBEDDER = os.getenv('EMBEDDER') or ('openai' if os.getenv('OPENAI_API_KEY') else 'hash')
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+EMBEDDING_DIMENSION = int(os.getenv('EMBEDDING_DIMENSION', '0')) or None
+EMBEDDING_CONCURRENCY = int(os.getenv('EMBEDDING_CONCURRENCY', '4'))
+
+class HashEmbedder:
+    """Deterministic local embedder using signed feature hashing of identifier parts.
+
+    Needs no network or model weights, so the cache and batching can be exercised offline.
+    Texts sharing identifiers get similar vectors, which is enough for smoke-testing search.
+    """
+
+    model = 'local-hash'
+    max_batch = 1024
+    max_batch_tokens = None
+    count_tokens = staticmethod(count_tokens)
+
+    TOKEN_PATTERN = re.compile(r'[A-Za-z][a-z]*|\d+')
+
+    def __init__(self, dimension=None):
+        self.dimension = dimension or 256
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in self.TOKEN_PATTERN.findall(text):
+                digest = int.from_bytes(hashlib.blake2b(token.lower().encode(), digest_size=8).digest(), 'little')
+                vectors[row, digest % self.dimension] += 1.0 if digest >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+class OpenAIEmbedder:
+    """Embedder backed by the OpenAI embeddings endpoint."""
+
+    # API limits: 2048 inputs and 300k tokens per request
+    max_batch = 2048
+    max_batch_tokens = 250_000
+
+    # Tokenizer of the OpenAI embedding models
+    ENCODING = 'cl100k_base'
+    DIMENSIONS = {'text-embedding-3-small': 1536, 'text-embedding-3-large': 3072, 'text-embedding-ada-002': 1536}
+
+    def __init__(self, model=None, dimension=None):
+        self.model = model or EMBEDDING_MODEL
+        self.dimension = dimension or self.DIMENSIONS.get(self.model, 1536)
+        self._client = None
+        self._encoding = None
+
+    def count_tokens(self, text):
+        """Count tokens with tiktoken when it is installed, else overestimate them.
+
+        Code tokenizes far finer than words ('_compute_amount_total' is about 5 tokens, not 1),
+        while BPE tokens of source code average 3 to 4 characters, so len(text) // 3 errs on
+        the high side; max_batch_tokens stays below the API limit for text denser than that.
+        """
+        if self._encoding is None:
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding(self.ENCODING)
+            except Exception:
+                # Not installed, or its vocabulary cannot be downloaded
+                self._encoding = False
+        if self._encoding:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // 3 + 1
+
+    @property
+    def client(self):
+        if self._client is None:
+            import openai
+            self._client = openai.OpenAI()
+        return self._client
+
+    def embed(self, texts):
+        arguments = {'model': self.model, 'input': list(texts)}
+        # Only the text-embedding-3 models can shorten their vectors
+        if self.dimension != self.DIMENSIONS.get(self.model):
+            arguments['dimensions'] = self.dimension
+        response = self.client.embeddings.create(**arguments)
+        data = sorted(response.data, key=lambda item: item.index)
+        return np.array([item.embedding for item in data], dtype=np.float32)
+
+EMBEDDERS = {'hash': HashEmbedder, 'openai': OpenAIEmbedder}
+
+def get_embedder(name=None, dimension=None):
+    """Return the embedder called `name` (default: the EMBEDDER setting)."""
+    return EMBEDDERS[name or EMBEDDER](dimension=dimension or EMBEDDING_DIMENSION)
+
+def embedder_for_model(model, dimension):
+    """Return the embedder that produces vectors of `model`, e.g. as recorded in an index header."""
+    if model == HashEmbedder.model:
+        return HashEmbedder(dimension)
+    return OpenAIEmbedder(model, dimension)
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by (chunk hash, model, dimension).
+
+    Vectors of one model and dimension are appended to a raw float32 file that is read through
+    a memory map; SQLite maps each key to its row. Vectors are written before their rows are
+    committed, so an interrupted write leaves only unreferenced bytes at the end of the file.
+    The cache is shared by every repository, so writers hold an exclusive lock on the vector
+    file from picking their rows until those rows are committed.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or EMBEDDING_CACHE_PATH
+        os.makedirs(self.path, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.path, 'embeddings.sqlite3'))
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                dimension INTEGER NOT NULL,
+                row INTEGER NOT NULL,
+                PRIMARY KEY (hash, model, dimension)
+            )
+        ''')
+        self.maps = {}
+
+    def vector_file(self, model, dimension):
+        return os.path.join(self.path, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', model)}-{dimension}.f32")
+
+    def matrix(self, model, dimension, rows):
+        """Return a read-only memory map of the vector file holding at least `rows` rows."""
+        matrix = self.maps.get((model, dimension))
+        if matrix is None or len(matrix) < rows:
+            path = self.vector_file(model, dimension)
+            available = os.path.getsize(path) // (4 * dimension) if os.path.exists(path) else 0
+            if not available:
+                return np.zeros((0, dimension), dtype=np.float32)
+            matrix = np.memmap(path, dtype=np.float32, mode='r', shape=(available, dimension))
+            self.maps[(model, dimension)] = matrix
+        return matrix
+
+    def rows(self, hashes, model, dimension):
+        """Return {hash: row} for the cached entries among `hashes`."""
+        rows = {}
+        hashes = list(hashes)
+        # Stay below SQLite's limit on bound parameters
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            rows.update(self.connection.execute(
+                f"SELECT hash, row FROM embeddings WHERE model = ? AND dimension = ? "
+                f"AND hash IN ({', '.join('?' * len(batch))})", [model, dimension, *batch]))
+        return rows
+
+    def get_many(self, hashes, model, dimension):
+        """Return (vectors, found): a matrix in the order of `hashes` and a mask of cache hits."""
+        hashes = list(hashes)
+        rows = self.rows(hashes, model, dimension)
+        vectors = np.zeros((len(hashes), dimension), dtype=np.float32)
+        found = np.array([digest in rows for digest in hashes], dtype=bool)
+        if rows:
+            matrix = self.matrix(model, dimension, max(rows.values()) + 1)
+            vectors[found] = matrix[[rows[digest] for digest in hashes if digest in rows]]
+        return vectors, found
+
+    def put_many(self, hashes, vectors, model, dimension):
+        """Append `vectors` for `hashes` to the cache."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        row_bytes = 4 * dimension
+        with open(self.vector_file(model, dimension), 'ab') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            # The lock is released when the file is closed
+            size = os.fstat(file.fileno()).st_size
+            # Pad a row left partial by an interrupted writer rather than cutting anything off
+            padding = -size % row_bytes
+            first = (size + padding) // row_bytes
+            file.write(bytes(padding) + vectors.tobytes())
+            file.flush()
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)',
+                [(digest, model, dimension, first + offset) for offset, digest in enumerate(hashes)])
+            self.connection.commit()
+
+    def close(self):
+        self.maps.clear()
+        self.connection.close()
+
+def batches(items, max_batch, max_batch_tokens=None, count=count_tokens):
+    """Pack (hash, text) items into lists no longer than `max_batch` items or `max_batch_tokens`
+    tokens as counted by `count`."""
+    batch, tokens = [], 0
+    for item in items:
+        size = count(item[1]) if max_batch_tokens else 0
+        if batch and (len(batch) == max_batch or (max_batch_tokens and tokens + size > max_batch_tokens)):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(item)
+        tokens += size
+    if batch:
+        yield batch
+
+def iter_missing(cache, embedder, chunks, summary, block_size=500):
+    """Yield the (hash, text) chunks the cache has no vector for, checking the cache in blocks."""
+    block = {}
+    for digest, text in chunks:
+        block[digest] = text
+        if len(block) == block_size:
+            yield from missing_in_block(cache, embedder, block, summary)
+            block = {}
+    yield from missing_in_block(cache, embedder, block, summary)
+
+def missing_in_block(cache, embedder, block, summary):
+    rows = cache.rows(block, embedder.model, embedder.dimension)
+    summary['chunks'] += len(block)
+    summary['hits'] += len(rows)
+    for digest, text in block.items():
+        if digest not in rows:
+            summary['misses'] += 1
+            yield digest, text
+
+def embed_missing(cache, embedder, chunks, concurrency=None):
+    """Embed the chunks the cache does not hold yet and store their vectors.
+
+    `chunks` is an iterable of (hash, text). Only misses are sent to the embedder, in batches
+    as large as it accepts, with at most `concurrency` requests in flight. Returns a summary.
+    """
+    concurrency = concurrency or EMBEDDING_CONCURRENCY
+    summary = {'chunks': 0, 'hits': 0, 'misses': 0, 'batches': 0}
+
+    def embed(batch):
+        with tracing.span('embed.batch', size=len(batch)):
+            return batch, embedder.embed([text for digest, text in batch])
+
+    def store(done):
+        # Vectors are written from this thread only, as each batch completes
+        for future in done:
+            batch, vectors = future.result()
+            cache.put_many([digest for digest, text in batch], vectors, embedder.model, embedder.dimension)
+            summary['batches'] += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+        for batch in batches(iter_missing(cache, embedder, chunks, summary),
+                             embedder.max_batch, embedder.max_batch_tokens, embedder.count_tokens):
+            pending.add(executor.submit(embed, batch))
+            if len(pending) >= concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                store(done)
+        store(as_completed(pending))
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Embed the chunks of an index, sending only cache misses to the embedder.')
+    parser.add_argument('index', help='Path of the index file written by index_update.')
+    parser.add_argument('--embedder', choices=sorted(EMBEDDERS), default=None, help=f'Embedder (default: {EMBEDDER}).')
+    parser.add_argument('--dimension', type=int, default=None, help='Vector dimension (default: the model default).')
+    parser.add_argument('--cache', default=None, help=f'Cache directory (default: {EMBEDDING_CACHE_PATH}).')
+    parser.add_argument('--concurrency', type=int, default=None, help='Maximum embedding requests in flight.')
+    args = parser.parse_args()
+
+    from code_index import RecordStore
+    store = RecordStore(args.index)
+    cache = EmbeddingCache(args.cache)
+    start = time.perf_counter()
+    try:
+        summary = embed_missing(cache, get_embedder(args.embedder, args.dimension), store.iter_chunks(),
+                                args.concurrency)
+    finally:
+        cache.close()
+        store.close()
+    print(f"{summary['chunks']} chunks: {summary['hits']} cached, {summary['misses']} embedded in "
+          f"{summary['batches']} batches ({time.perf_counter() - start:.2f}s)", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -1,248 +1,501 @@
 import os
-import yaml
-from github import Github, InputGitAuthor
-from github.GithubException import GithubException
-from datetime import datetime, timezone
+import sys
 import json
-import openai
-from typing_extensions import override
-from openai import AssistantEventHandler
-from dotenv import load_dotenv
+import argparse
+import asyncio
+import hashlib
+import contextlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-load_dotenv()
+import tracing
+
+# Read globals from env; .env only needs to be loaded when the environment is not set up already
+if not (os.getenv('OPENAI_API_KEY') and os.getenv('GITHUB_TOKEN')):
+    from dotenv import load_dotenv
+    load_dotenv()
 
-# Read globals from env
 GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
 GITHUB_USERNAME = os.getenv('GITHUB_USERNAME')
 REPO_NAME = os.getenv('REPO_NAME')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
-g = Github(GITHUB_TOKEN)
-
-openai.api_key = OPENAI_API_KEY
+# Local record of the assistant created for the current tool schema
+ASSISTANT_CACHE_PATH = os.getenv('GIT_ASSISTANT_CACHE', os.path.expanduser('~/.cache/git-assistant/assistant.json'))
 
-client = openai.OpenAI()
-
-assistant = client.beta.assistants.create(
-    name="Github assistant",
-    instructions="You control github api calls to manage a project and codebase.",
-    tools=[
-        {"type": "code_interpreter"},
-        {
-            "type": "function",
-            "function": {
-                "name": "git_add_files",
-                "description": "Add files to the Git staging area.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    "repository_path": {
-                        "type": "string",
-                        "description": "Local path to the Git repository."
-                    },
-                    "file_paths": {
-                        "type": "array",
-                        "items": { "type": "string" },
-                        "description": "List of file paths to add."
-                    }
-                    },
-                    "required": ["repository_path", "file_paths"]
-                }
+ASSISTANT_NAME = "Github assistant"
+ASSISTANT_INSTRUCTIONS = "You control github api calls to manage a project and codebase."
+ASSISTANT_MODEL = "gpt-4o"
+ASSISTANT_TOOLS = [
+    {"type": "code_interpreter"},
+    {
+        "type": "function",
+        "function": {
+            "name": "git_add_files",
+            "description": "Add files to the Git staging area.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                "repository_path": {
+                    "type": "string",
+                    "description": "Local path to the Git repository."
+                },
+                "file_paths": {
+                    "type": "array",
+                    "items": { "type": "string" },
+                    "description": "List of file paths to add."
                 }
+                },
+                "required": ["repository_path", "file_paths"]
+            }
+            }
 
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "git_commit",
-                "description": "Commit changes to the repository.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    "repository_path": { "type": "string", "description": "Local path to the Git repository." },
-                    "message": { "type": "string", "description": "Commit message." }
-                    },
-                    "required": ["repository_path", "message"]
-                }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "git_commit",
+            "description": "Commit changes to the repository.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                "repository_path": { "type": "string", "description": "Local path to the Git repository." },
+                "message": { "type": "string", "description": "Commit message." }
+                },
+                "required": ["repository_path", "message"]
             }
+        }
 
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "git_create_branch",
-                "description": "Create a new branch in the repository.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    "repository_path": { "type": "string", "description": "Local path to the Git repository." },
-                    "branch_name": { "type": "string", "description": "Name of the new branch." }
-                    },
-                    "required": ["repository_path", "branch_name"]
-                }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "git_create_branch",
+            "description": "Create a new branch in the repository.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                "repository_path": { "type": "string", "description": "Local path to the Git repository." },
+                "branch_name": { "type": "string", "description": "Name of the new branch." }
+                },
+                "required": ["repository_path", "branch_name"]
             }
+        }
 
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "git_checkout_branch",
-                "description": "Switch to a specified branch.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    "repository_path": { "type": "string", "description": "Local path to the Git repository." },
-                    "branch_name": { "type": "string", "description": "Name of the branch to checkout." }
-                    },
-                    "required": ["repository_path", "branch_name"]
-                }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "git_checkout_branch",
+            "description": "Switch to a specified branch.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                "repository_path": { "type": "string", "description": "Local path to the Git repository." },
+                "branch_name": { "type": "string", "description": "Name of the branch to checkout." }
+                },
+                "required": ["repository_path", "branch_name"]
             }
+        }
 
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "git_pull",
-                "description": "Pull changes from the remote repository.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    "repository_path": { "type": "string", "description": "Local path to the Git repository." },
-                    "remote_name": { "type": "string", "description": "Name of the remote (default 'origin')." },
-                    "branch_name": { "type": "string", "description": "Name of the branch to pull." }
-                    },
-                    "required": ["repository_path", "branch_name"]
-                }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "git_pull",
+            "description": "Pull changes from the remote repository.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                "repository_path": { "type": "string", "description": "Local path to the Git repository." },
+                "remote_name": { "type": "string", "description": "Name of the remote (default 'origin')." },
+                "branch_name": { "type": "string", "description": "Name of the branch to pull." }
+                },
+                "required": ["repository_path", "branch_name"]
             }
+        }
 
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "git_push",
-                "description": "Push local commits to the remote repository.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    "repository_path": { "type": "string", "description": "Local path to the Git repository." },
-                    "remote_name": { "type": "string", "description": "Name of the remote (default 'origin')." },
-                    "branch_name": { "type": "string", "description": "Name of the branch to push." }
-                    },
-                    "required": ["repository_path", "branch_name"]
-                }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "git_push",
+            "description": "Push local commits to the remote repository.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                "repository_path": { "type": "string", "description": "Local path to the Git repository." },
+                "remote_name": { "type": "string", "description": "Name of the remote (default 'origin')." },
+                "branch_name": { "type": "string", "description": "Name of the branch to push." }
+                },
+                "required": ["repository_path", "branch_name"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "git_show_file",
+            "description": "Read the contents of a file at a given revision.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                "repository_path": { "type": "string", "description": "Local path to the Git repository." },
+                "file_path": { "type": "string", "description": "Path of the file relative to the repository root." },
+                "revision": { "type": "string", "description": "Commit, branch or tag to read from (default 'HEAD')." }
+                },
+                "required": ["repository_path", "file_path"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "index_update",
+            "description": "Re-index only the files that changed since the last indexed commit, e.g. after a pull.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                "repository_path": { "type": "string", "description": "Local path to the Git repository." },
+                "index_path": { "type": "string", "description": "Path of the index file (default: inside the repository's .git directory)." }
+                },
+                "required": ["repository_path"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "git_clone_repository",
-                "description": "Clone a remote repository to a local directory.",
-                "parameters": {
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_code",
+            "description": "Search the indexed code of a repository by meaning and identifiers; returns the best matching chunks with their locations.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                "repository_path": { "type": "string", "description": "Local path to the Git repository." },
+                "query": { "type": "string", "description": "What to look for, e.g. 'confirm a sale order' or '_compute_amount_total'." },
+                "k": { "type": "integer", "description": "Number of results (default 10)." },
+                "filters": {
                     "type": "object",
+                    "description": "Restrict the search; every field takes a value or a list of values.",
                     "properties": {
-                    "repository_url": {
-                        "type": "string",
-                        "description": "URL of the remote repository to clone."
-                    },
-                    "local_path": {
-                        "type": "string",
-                        "description": "Local directory path where the repository will be cloned."
+                    "module": { "type": "string", "description": "Addon name, e.g. sale." },
+                    "model": { "type": "string", "description": "Odoo model, e.g. sale.order." },
+                    "inherit": { "type": "string", "description": "Inherited model." },
+                    "decorator": { "type": "string", "description": "Method decorator, e.g. api.depends." },
+                    "language": { "type": "string", "description": "python or xml." },
+                    "kind": { "type": "string", "description": "Chunk kind: class, method, function, fields, xml_record, ..." },
+                    "path": { "type": "string", "description": "File or directory path." }
                     }
-                    },
-                    "required": ["repository_url", "local_path"]
+                },
+                "mode": { "type": "string", "enum": ["hybrid", "vector", "lexical"], "description": "Ranking (default: hybrid)." },
+                "index_path": { "type": "string", "description": "Path of the index file (default: inside the repository's .git directory)." }
+                },
+                "required": ["repository_path", "query"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "git_clone_repository",
+            "description": "Clone a remote repository to a local directory.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                "repository_url": {
+                    "type": "string",
+                    "description": "URL of the remote repository to clone."
+                },
+                "local_path": {
+                    "type": "string",
+                    "description": "Local directory path where the repository will be cloned."
                 }
+                },
+                "required": ["repository_url", "local_path"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "git_create_local_repository",
-                "description": "Initialize a new Git repository in a specified directory.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    "directory_path": {
-                        "type": "string",
-                        "description": "Path to the directory where the repository will be initialized."
-                    }
-                    },
-                    "required": ["directory_path"]
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "git_create_local_repository",
+            "description": "Initialize a new Git repository in a specified directory.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                "directory_path": {
+                    "type": "string",
+                    "description": "Path to the directory where the repository will be initialized."
                 }
+                },
+                "required": ["directory_path"]
             }
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "github_create_repository",
-                "description": "Create a new repository on GitHub.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    "repository_name": {
-                        "type": "string",
-                        "description": "Name of the new GitHub repository."
-                    },
-                    "description": {
-                        "type": "string",
-                        "description": "Description of the repository."
-                    },
-                    "private": {
-                        "type": "boolean",
-                        "description": "Whether the repository should be private."
-                    },
-                    "auto_init": {
-                        "type": "boolean",
-                        "description": "Whether to initialize the repository with a README."
-                    }
-                    },
-                    "required": ["repository_name"]
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "github_create_repository",
+            "description": "Create a new repository on GitHub.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                "repository_name": {
+                    "type": "string",
+                    "description": "Name of the new GitHub repository."
+                },
+                "description": {
+                    "type": "string",
+                    "description": "Description of the repository."
+                },
+                "private": {
+                    "type": "boolean",
+                    "description": "Whether the repository should be private."
+                },
+                "auto_init": {
+                    "type": "boolean",
+                    "description": "Whether to initialize the repository with a README."
                 }
+                },
+                "required": ["repository_name"]
             }
         }
-    ],
-    model="gpt-4o",
-)
+    }
+]
 
-def git_add_files(params):
+
+@lru_cache(maxsize=None)
+def get_client():
+    """Return the OpenAI client, importing the SDK on first use."""
+    import openai
+    openai.api_key = OPENAI_API_KEY
+    return openai.OpenAI()
+
+@lru_cache(maxsize=None)
+def get_github():
+    """Return the authenticated Github instance, importing PyGithub on first use."""
+    from github import Github
+    return Github(GITHUB_TOKEN)
+
+def assistant_schema_hash():
+    """Hash of everything that defines the assistant."""
+    schema = {
+        "name": ASSISTANT_NAME,
+        "instructions": ASSISTANT_INSTRUCTIONS,
+        "model": ASSISTANT_MODEL,
+        "tools": ASSISTANT_TOOLS,
+    }
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode('utf-8')).hexdigest()
+
+def get_assistant_id():
+    """Return the ID of the assistant for the current tool schema.
+
+    The ID is cached in ASSISTANT_CACHE_PATH together with the schema hash. The cached assistant
+    is reused as is while the hash matches, updated in place when the schema changed, and only
+    created when there is no usable cached assistant.
+    """
+    schema_hash = assistant_schema_hash()
+    cached = {}
+    if os.path.exists(ASSISTANT_CACHE_PATH):
+        with open(ASSISTANT_CACHE_PATH) as file:
+            cached = json.load(file)
+    if cached.get("assistant_id") and cached.get("schema_hash") == schema_hash:
+        return cached["assistant_id"]
+
+    import openai
+    client = get_client()
+    definition = {
+        "name": ASSISTANT_NAME,
+        "instructions": ASSISTANT_INSTRUCTIONS,
+        "tools": ASSISTANT_TOOLS,
+        "model": ASSISTANT_MODEL,
+    }
+    assistant = None
+    if cached.get("assistant_id"):
+        try:
+            assistant = client.beta.assistants.update(cached["assistant_id"], **definition)
+        except openai.NotFoundError:
+            assistant = None
+    if assistant is None:
+        assistant = client.beta.assistants.create(**definition)
+
+    os.makedirs(os.path.dirname(ASSISTANT_CACHE_PATH) or '.', exist_ok=True)
+    with open(ASSISTANT_CACHE_PATH, 'w') as file:
+        json.dump({"assistant_id": assistant.id, "schema_hash": schema_hash}, file)
+    return assistant.id
+
+# Number of open Repo objects kept around between tool calls
+REPO_CACHE_SIZE = int(os.getenv('GIT_ASSISTANT_REPO_CACHE', '16'))
+
+_repo_cache = OrderedDict()
+_repo_cache_lock = threading.Lock()
+
+def repo_signature(git_dir):
+    """Return the (mtime, size) of HEAD and the index, used to notice changes made outside the cache."""
+    signature = []
+    for name in ('HEAD', 'index'):
+        try:
+            stat = os.stat(os.path.join(git_dir, name))
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+def get_repo(path):
+    """Return an open git.Repo for `path` from an LRU cache keyed by the resolved path.
+
+    A cached Repo keeps its persistent `git cat-file --batch` processes, so object reads reuse
+    them instead of spawning new git commands. It is dropped and reopened when HEAD or the
+    index changed on disk since it was last used.
+    """
     from git import Repo
-    repo = Repo(params['repository_path'])
+    key = os.path.realpath(path)
+    with _repo_cache_lock:
+        entry = _repo_cache.pop(key, None)
+        if entry:
+            repo, signature = entry
+            if repo_signature(repo.git_dir) != signature:
+                repo.close()
+                repo = None
+        else:
+            repo = None
+        if repo is None:
+            repo = Repo(key)
+            signature = repo_signature(repo.git_dir)
+        _repo_cache[key] = (repo, signature)
+        while len(_repo_cache) > REPO_CACHE_SIZE:
+            evicted, _ = _repo_cache.popitem(last=False)[1]
+            evicted.close()
+        return repo
+
+def refresh_repo_signature(path):
+    """Record the current HEAD and index state of a cached Repo after a tool changed them itself."""
+    key = os.path.realpath(path)
+    with _repo_cache_lock:
+        if key in _repo_cache:
+            repo, _ = _repo_cache[key]
+            _repo_cache[key] = (repo, repo_signature(repo.git_dir))
+
+@tracing.traced()
+def git_add_files(params):
+    repo = get_repo(params['repository_path'])
     repo.index.add(params['file_paths'])
     repo.index.write()
     return {"status": "Files added to staging area."}
 
+@tracing.traced()
 def git_commit(params):
-    from git import Repo
-    repo = Repo(params['repository_path'])
+    repo = get_repo(params['repository_path'])
     repo.index.commit(params['message'])
     return {"status": f"Committed changes with message: '{params['message']}'"}
 
 
+@tracing.traced()
 def git_create_branch(params):
-    from git import Repo
-    repo = Repo(params['repository_path'])
+    repo = get_repo(params['repository_path'])
     new_branch = repo.create_head(params['branch_name'])
     return {"status": f"Branch '{params['branch_name']}' created."}
 
+@tracing.traced()
 def git_checkout_branch(params):
-    from git import Repo
-    repo = Repo(params['repository_path'])
+    repo = get_repo(params['repository_path'])
     repo.git.checkout(params['branch_name'])
     return {"status": f"Checked out to branch '{params['branch_name']}'."}
 
+@tracing.traced()
 def git_pull(params):
-    from git import Repo
-    repo = Repo(params['repository_path'])
+    repo = get_repo(params['repository_path'])
     remote = params.get('remote_name', 'origin')
     repo.git.pull(remote, params['branch_name'])
     return {"status": f"Pulled latest changes from '{remote}/{params['branch_name']}'."}
 
+@tracing.traced()
 def git_push(params):
-    from git import Repo
-    repo = Repo(params['repository_path'])
+    repo = get_repo(params['repository_path'])
     remote = params.get('remote_name', 'origin')
     repo.git.push(remote, params['branch_name'])
     return {"status": f"Pushed local changes to '{remote}/{params['branch_name']}'."}
 
+@tracing.traced()
+def git_show_file(params):
+    repo = get_repo(params['repository_path'])
+    revision = params.get('revision', 'HEAD')
+    blob = repo.commit(revision).tree / params['file_path']
+    # Read through the Repo's persistent cat-file process
+    content = blob.data_stream.read().decode('utf-8', errors='replace')
+    return {"status": content}
+
+@tracing.traced()
+def index_update(params):
+    from code_index import RecordStore, default_index_path, update_index
+    from embeddings import EmbeddingCache, embed_missing, get_embedder
+    repo = get_repo(params['repository_path'])
+    store = RecordStore(params.get('index_path') or default_index_path(repo))
+    try:
+        summary = update_index(repo, store)
+        dedup = store.dedup_stats()
+        cache = EmbeddingCache()
+        try:
+            embedded = embed_missing(cache, get_embedder(), store.iter_chunks())
+        finally:
+            cache.close()
+    finally:
+        store.close()
+    chunks = (f"{dedup['chunks']} chunks, {dedup['unique']} unique (dedup ratio {dedup['ratio']:.2f}x), "
+              f"{embedded['misses']} newly embedded.")
+    if summary['dirty']:
+        chunks += f" {summary['dirty']} files with uncommitted changes will be re-read on the next update."
+    if summary['from'] == summary['to'] and not summary['files']:
+        return {"status": f"Index is already at {summary['to'][:12]}. {chunks}"}
+    if summary['from'] == summary['to']:
+        return {"status": f"Index is at {summary['to'][:12]}; re-parsed {summary['files']} files with "
+                          f"uncommitted changes. {chunks}"}
+    if summary['from'] is None:
+        return {"status": f"Indexed {summary['files']} files ({summary['records']} records) at {summary['to'][:12]}. {chunks}"}
+    return {"status": (
+        f"Updated index from {summary['from'][:12]} to {summary['to'][:12]}: "
+        f"{summary['added']} added, {summary['modified']} modified, {summary['deleted']} deleted, "
+        f"{summary['renamed']} renamed; re-parsed {summary['files']} files ({summary['records']} records), "
+        f"tombstoned {summary['tombstoned']} records. {chunks}"
+    )}
+
+_search_engines = {}
+_search_engines_lock = threading.Lock()
+
+def get_search_engine(index_path):
+    """Return the search engine of an index, reopened when its vector store was rebuilt."""
+    from search_server import SearchEngine
+    from vector_store import HEADER_FILE, default_store_path
+    signature = os.stat(os.path.join(default_store_path(index_path), HEADER_FILE)).st_mtime_ns
+    with _search_engines_lock:
+        engine, cached_signature = _search_engines.get(index_path, (None, None))
+        if cached_signature != signature:
+            engine = SearchEngine(index_path)
+            _search_engines[index_path] = (engine, signature)
+        return engine
+
+@tracing.traced()
+def search_code(params):
+    from code_index import default_index_path
+    index_path = params.get('index_path') or default_index_path(get_repo(params['repository_path']))
+    try:
+        engine = get_search_engine(index_path)
+    except FileNotFoundError:
+        return {"error": f"No vector store for {index_path}; run index_update and vector_store.py build first."}
+    results = engine.search_batch([{key: params.get(key) for key in ('query', 'k', 'filters', 'mode')}])[0]
+    if not results:
+        return {"status": "No matching code found."}
+    lines = []
+    for result in results:
+        for location in result['locations']:
+            lines.append(f"{result['score']:.3f}  {location['path']}:{location['line']}-{location['end_line']}  "
+                         f"{result['kind']} {result['name']}")
+    return {"status": "\n".join(lines)}
+
+@tracing.traced()
 def git_clone_repository(params):
     from git import Repo
     repository_url = params['repository_url']
@@ -253,6 +506,7 @@ def git_clone_repository(params):
     except Exception as e:
         return {"error": str(e)}
     
+@tracing.traced()
 def git_create_local_repository(params):
     from git import Repo
     directory_path = params['directory_path']
@@ -262,15 +516,14 @@ def git_create_local_repository(params):
     except Exception as e:
         return {"error": str(e)}
     
+@tracing.traced()
 def github_create_repository(params):
-    from github import Github
-    # Assume 'g' is an authenticated Github instance
     repository_name = params['repository_name']
     description = params.get('description', '')
     private = params.get('private', False)
     auto_init = params.get('auto_init', False)
     try:
-        user = g.get_user()
+        user = get_github().get_user()
         repo = user.create_repo(
             name=repository_name,
             description=description,
@@ -282,77 +535,197 @@ def github_create_repository(params):
         return {"error": str(e)}
 
 
-thread = client.beta.threads.create()
-message = client.beta.threads.messages.create(
-    thread_id=thread.id,
-    role="user",
-    content="Repo: odoo17-code-vector-db, local dir: Fetch and pull the master on "
-)
-
-class EventHandler(AssistantEventHandler):
-    @override
-    def on_event(self, event):
-        if event.event == 'thread.run.requires_action':
-            run_id = event.data.id
-            self.handle_requires_action(event.data, run_id)
-
-    def handle_requires_action(self, data, run_id):
-        tool_outputs = []
-
-        for tool in data.required_action.submit_tool_outputs.tool_calls:
-            params = json.loads(tool.function.arguments)
-            if tool.function.name == "git_add_files":
-                output = git_add_files(params)
-                tool_outputs.append({"tool_call_id": tool.id, "output": output['status'] if output.get('status') else output['error']})
-
-            elif tool.function.name == "git_commit":
-                output = git_commit(params)
-                tool_outputs.append({"tool_call_id": tool.id, "output": output['status'] if output.get('status') else output['error']})
-
-            elif tool.function.name == "git_create_branch":
-                output = git_create_branch(params)
-                tool_outputs.append({"tool_call_id": tool.id, "output": output['status'] if output.get('status') else output['error']})
-                
-            elif tool.function.name == "git_checkout_branch":
-                output = git_checkout_branch(params)
-                tool_outputs.append({"tool_call_id": tool.id, "output": output['status'] if output.get('status') else output['error']})
-                
-            elif tool.function.name == "git_pull":
-                output = git_pull(params)
-                tool_outputs.append({"tool_call_id": tool.id, "output": output['status'] if output.get('status') else output['error']})
-                
-            elif tool.function.name == "git_push":
-                output = git_push(params)
-                tool_outputs.append({"tool_call_id": tool.id, "output": output['status'] if output.get('status') else output['error']})
-                
-            elif tool.function.name == "git_clone_repository":
-                output = git_clone_repository(params)
-                tool_outputs.append({"tool_call_id": tool.id, "output": output['status'] if output.get('status') else output['error']})
-                
-            elif tool.function.name == "git_create_local_repository":
-                output = git_create_local_repository(params)
-                tool_outputs.append({"tool_call_id": tool.id, "output": output['status'] if output.get('status') else output['error']})
-                
-            elif tool.function.name == "github_create_repository":
-                output = github_create_repository(params)
-                tool_outputs.append({"tool_call_id": tool.id, "output": output['status'] if output.get('status') else output['error']})
-
-        self.submit_tool_outputs(tool_outputs, run_id)
-
-    def submit_tool_outputs(self, tool_outputs, run_id):
-        with client.beta.threads.runs.submit_tool_outputs_stream(
-            thread_id=self.current_run.thread_id,
-            run_id=self.current_run.id,
-            tool_outputs=tool_outputs,
-            event_handler=EventHandler(),
-        ) as stream:
-            for text in stream.text_deltas:
-                print(text, end="", flush=True)
-            print()
-
-with client.beta.threads.runs.stream(
-    thread_id=thread.id,
-    assistant_id=assistant.id,
-    event_handler=EventHandler()
-) as stream:
-    stream.until_done()
+
+TOOL_FUNCTIONS = {
+    "git_add_files": git_add_files,
+    "git_commit": git_commit,
+    "git_create_branch": git_create_branch,
+    "git_checkout_branch": git_checkout_branch,
+    "git_pull": git_pull,
+    "git_push": git_push,
+    "git_show_file": git_show_file,
+    "index_update": index_update,
+    "search_code": search_code,
+    "git_clone_repository": git_clone_repository,
+    "git_create_local_repository": git_create_local_repository,
+    "github_create_repository": github_create_repository,
+}
+
+# Number of tool calls that may run at the same time
+TOOL_WORKERS = int(os.getenv('GIT_ASSISTANT_TOOL_WORKERS', '4'))
+
+_repository_locks = {}
+_repository_locks_guard = threading.Lock()
+
+def repository_key(params):
+    """Return the resolved local repository path a tool call works on, if any."""
+    path = params.get('repository_path') or params.get('local_path') or params.get('directory_path')
+    return os.path.realpath(path) if path else None
+
+def repository_lock(key):
+    """Return the lock that serializes tool calls against one repository."""
+    with _repository_locks_guard:
+        return _repository_locks.setdefault(key, threading.Lock())
+
+def run_tool(name, params):
+    """Run a single tool function and return its output text and duration in seconds."""
+    start = time.perf_counter()
+    function = TOOL_FUNCTIONS.get(name)
+    if function is None:
+        output = {"error": f"Unknown tool '{name}'."}
+    else:
+        key = repository_key(params)
+        try:
+            with repository_lock(key) if key else contextlib.nullcontext():
+                output = function(params)
+                if params.get('repository_path'):
+                    refresh_repo_signature(params['repository_path'])
+        except Exception as e:
+            output = {"error": str(e)}
+    return (output['status'] if output.get('status') else output['error']), time.perf_counter() - start
+
+def group_tool_calls(tool_calls):
+    """Group (tool_call_id, name, params) tool calls by repository, keeping request order in each group."""
+    groups = {}
+    for position, (tool_call_id, name, params) in enumerate(tool_calls):
+        key = repository_key(params) or f'call:{position}'
+        groups.setdefault(key, []).append(position)
+    return list(groups.values())
+
+def format_tool_outputs(tool_calls, results):
+    """Build the tool outputs to submit, each ending with the time the call took."""
+    tool_outputs = []
+    for (tool_call_id, name, params), (output, seconds) in zip(tool_calls, results):
+        print(f"[{name}] {seconds * 1000:.0f} ms")
+        tool_outputs.append({"tool_call_id": tool_call_id, "output": f"{output} (took {seconds:.2f}s)"})
+    return tool_outputs
+
+async def run_tool_calls_async(tool_calls, executor):
+    """Run (tool_call_id, name, params) tool calls concurrently and return their outputs in order.
+
+    Calls against the same repository run one after another in the order they were requested;
+    calls against different repositories run in parallel on `executor`, off the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    results = [None] * len(tool_calls)
+
+    def run_group(positions):
+        for position in positions:
+            tool_call_id, name, params = tool_calls[position]
+            results[position] = run_tool(name, params)
+
+    await asyncio.gather(*(loop.run_in_executor(executor, run_group, positions)
+                           for positions in group_tool_calls(tool_calls)))
+    return format_tool_outputs(tool_calls, results)
+
+@lru_cache(maxsize=None)
+def get_async_client():
+    """Return the async OpenAI client, importing the SDK on first use."""
+    import openai
+    openai.api_key = OPENAI_API_KEY
+    return openai.AsyncOpenAI()
+
+# Run states that end a thread
+TERMINAL_RUN_EVENTS = {
+    'thread.run.completed': 'completed',
+    'thread.run.failed': 'failed',
+    'thread.run.cancelled': 'cancelled',
+    'thread.run.expired': 'expired',
+    'thread.run.incomplete': 'incomplete',
+}
+
+async def run_thread(client, assistant_id, prompt, executor):
+    """Drive one thread from prompt to final answer.
+
+    Each round streams the run until it either finishes or requires action; tool calls are then
+    run on the shared executor and their outputs submitted, which starts the next round.
+    Returns the final run status and the text the assistant produced.
+    """
+    thread = await client.beta.threads.create(messages=[{"role": "user", "content": prompt}])
+    stream_manager = client.beta.threads.runs.stream(thread_id=thread.id, assistant_id=assistant_id)
+    status = 'unknown'
+    text = []
+    while stream_manager is not None:
+        required_run = None
+        with tracing.span('assistant.round', thread_id=thread.id):
+            async with stream_manager as stream:
+                async for event in stream:
+                    if event.event == 'thread.message.delta':
+                        for block in event.data.delta.content or []:
+                            if block.type == 'text' and block.text and block.text.value:
+                                text.append(block.text.value)
+                    elif event.event == 'thread.run.requires_action':
+                        required_run = event.data
+                    elif event.event in TERMINAL_RUN_EVENTS:
+                        status = TERMINAL_RUN_EVENTS[event.event]
+        if required_run is None:
+            stream_manager = None
+        else:
+            tool_calls = [(tool.id, tool.function.name, json.loads(tool.function.arguments))
+                          for tool in required_run.required_action.submit_tool_outputs.tool_calls]
+            tool_outputs = await run_tool_calls_async(tool_calls, executor)
+            stream_manager = client.beta.threads.runs.submit_tool_outputs_stream(
+                thread_id=thread.id,
+                run_id=required_run.id,
+                tool_outputs=tool_outputs,
+            )
+    return status, ''.join(text)
+
+async def run_prompts(prompts, concurrency):
+    """Run every prompt in its own thread, at most `concurrency` at a time, printing answers as they finish."""
+    client = get_async_client()
+    assistant_id = get_assistant_id()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(index, prompt):
+        async with semaphore:
+            try:
+                # Threads interleave on the event loop's OS thread, so each is traced on a lane of its own
+                with tracing.lane(f'prompt {index}'):
+                    status, text = await run_thread(client, assistant_id, prompt, executor)
+            except Exception as e:
+                status, text = 'error', str(e)
+        print(f"=== [{index}] {status}: {prompt}")
+        print(text)
+        return status
+
+    with ThreadPoolExecutor(max_workers=TOOL_WORKERS) as executor:
+        return await asyncio.gather(*(run_one(index, prompt) for index, prompt in enumerate(prompts, 1)))
+
+DEFAULT_PROMPT = "Repo: odoo17-code-vector-db, local dir: Fetch and pull the master on "
+
+def read_prompts(path):
+    """Read one prompt per non-empty line from `path`, or from stdin when it is '-'."""
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path) as file:
+            lines = file.read().splitlines()
+    return [line.strip() for line in lines if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description='Run repository maintenance prompts through the assistant.')
+    parser.add_argument('prompts', nargs='?',
+                        help="File with one prompt per line, or '-' for stdin.")
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('GIT_ASSISTANT_CONCURRENCY', '8')),
+                        help='Number of threads run at the same time.')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Record spans and write them to FILE as Chrome trace-event JSON.')
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace)
+
+    if args.prompts:
+        prompts = read_prompts(args.prompts)
+    elif not sys.stdin.isatty():
+        prompts = read_prompts('-')
+    else:
+        prompts = [DEFAULT_PROMPT]
+    try:
+        statuses = asyncio.run(run_prompts(prompts, args.concurrency))
+    finally:
+        tracing.finish()
+    return 0 if all(status == 'completed' for status in statuses) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
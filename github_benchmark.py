@@ -0,0 +1,104 @@
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import yaml
+
+import github_setup
+from github_fake import FakeGitHub
+
+OWNER = 'benchmark-user'
+REPO = 'benchmark-repo'
+TASKS_PER_MILESTONE = 20
+LABELS = ['setup', 'planning', 'coding', 'testing', 'optimization', 'documentation']
+
+def synthetic_milestones(task_count):
+    """Build a milestones.yaml structure with `task_count` tasks."""
+    milestones = {}
+    for index in range(task_count):
+        title = f'Milestone {index // TASKS_PER_MILESTONE + 1:03d}'
+        milestone = milestones.setdefault(title, {
+            'due_on': f'2025-{index // TASKS_PER_MILESTONE % 12 + 1:02d}-01',
+            'description': f'Synthetic milestone {title}.',
+            'tasks': [],
+        })
+        milestone['tasks'].append({
+            'title': f'Task {index + 1:05d}',
+            'body': f'Synthetic task {index + 1} for benchmarking github_setup.py.',
+            'labels': [LABELS[index % len(LABELS)]],
+        })
+    return {'MILESTONES': milestones}
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def run_scenario(fake, **main_kwargs):
+    """Run github_setup.main() once against the fake and return its numbers."""
+    github_setup.session = github_setup.GitHubSession()
+    requests_before = fake.request_count
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        github_setup.main(**main_kwargs)
+    wall = time.perf_counter() - start
+    if 'An error occurred' in output.getvalue():
+        raise Exception(output.getvalue())
+    return {
+        'requests': fake.request_count - requests_before,
+        'wall': wall,
+        'p95': percentile(github_setup.session.latencies, 0.95),
+    }
+
+def benchmark(task_count, latency, rate_limit_every, pipelined=True):
+    """Run a cold run, a journaled re-run and a full re-plan for one milestones.yaml size."""
+    fake = FakeGitHub(OWNER, latency=latency, rate_limit_every=rate_limit_every)
+    base_url = fake.start()
+    github_setup.GITHUB_USERNAME = OWNER
+    github_setup.REPO_NAME = REPO
+    github_setup.GITHUB_REST_API_URL = base_url
+    github_setup.GITHUB_GRAPHQL_API_URL = f'{base_url}/graphql'
+    cwd = os.getcwd()
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            with open('milestones.yaml', 'w') as file:
+                yaml.safe_dump(synthetic_milestones(task_count), file)
+            results['cold'] = run_scenario(fake, pipelined=pipelined)
+            results['rerun'] = run_scenario(fake, pipelined=pipelined)
+            results['rerun --no-journal'] = run_scenario(fake, pipelined=pipelined, use_journal=False)
+            issues = len(fake.repo(REPO)['issues'])
+            if issues != task_count:
+                raise Exception(f'Expected {task_count} issues, found {issues}')
+    finally:
+        os.chdir(cwd)
+        fake.stop()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark github_setup.py against a local GitHub stand-in.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000],
+                        help='Numbers of tasks in the synthetic milestones.yaml files.')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='Injected latency per request in seconds.')
+    parser.add_argument('--rate-limit-every', type=int, default=0,
+                        help='Answer every Nth request with a 429 secondary rate limit.')
+    parser.add_argument('--sequential', action='store_true',
+                        help='Benchmark the non-pipelined mode.')
+    args = parser.parse_args()
+
+    print(f'{"tasks":>6} {"scenario":<20} {"requests":>9} {"wall s":>8} {"p95 ms":>8}')
+    for task_count in args.sizes:
+        results = benchmark(task_count, args.latency, args.rate_limit_every, pipelined=not args.sequential)
+        for scenario, numbers in results.items():
+            print(f'{task_count:>6} {scenario:<20} {numbers["requests"]:>9} '
+                  f'{numbers["wall"]:>8.2f} {numbers["p95"] * 1000:>8.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,366 @@
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+# Aliased mutations as built by github_setup.graphql_batch_mutation
+ALIASED_MUTATION = re.compile(r'(\w+): (\w+)\(input: \$(\w+)\)')
+
+def shifted_due_on(due_on):
+    """Return a due_on timestamp the way GitHub can echo it: midnight in a time zone west of
+    UTC, which lands on the previous UTC day."""
+    if not due_on:
+        return None
+    date = datetime.fromisoformat(due_on.replace('Z', '+00:00')).astimezone(timezone.utc).date()
+    return f'{date - timedelta(days=1)}T07:00:00Z'
+
+class FakeGitHub:
+    """In-process stand-in for the GitHub REST and GraphQL endpoints used by github_setup.py.
+
+    Runs an HTTP server on localhost in a background thread. Every request can be delayed by
+    `latency` seconds, every `rate_limit_every`-th request is answered with a 429 carrying
+    `Retry-After: rate_limit_retry_after`, and aliased mutation documents with more than
+    `max_aliases` aliases are rejected with MAX_NODE_LIMIT_EXCEEDED. Issue labels come in
+    pages of `labels_page_size`, and milestone due dates come back shifted like GitHub's.
+    """
+
+    def __init__(self, owner, latency=0.0, rate_limit_every=0, rate_limit_retry_after=0, max_aliases=100,
+                 labels_page_size=100):
+        self.owner = owner
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.rate_limit_retry_after = rate_limit_retry_after
+        self.max_aliases = max_aliases
+        self.labels_page_size = labels_page_size
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self.next_id = 0
+        self.user_id = self.new_id('U')
+        self.repos = {}
+        self.projects = {}
+        self.nodes = {}
+        self.server = None
+
+    def new_id(self, prefix):
+        self.next_id += 1
+        return f'{prefix}_{self.next_id}'
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """Start serving and return the base URL."""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.handle(self, 'GET')
+
+            def do_POST(self):
+                fake.handle(self, 'POST')
+
+            def do_PUT(self):
+                fake.handle(self, 'PUT')
+
+            def do_PATCH(self):
+                fake.handle(self, 'PATCH')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def handle(self, handler, method):
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = json.loads(handler.rfile.read(length) or b'null') if length else None
+        parsed = urlparse(handler.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.request_count += 1
+            if self.rate_limit_every and self.request_count % self.rate_limit_every == 0:
+                self.rate_limited_count += 1
+                status, payload, headers = 429, {'message': 'You have exceeded a secondary rate limit.'}, {
+                    'Retry-After': str(self.rate_limit_retry_after)}
+            elif parsed.path == '/graphql' and method == 'POST':
+                status, payload, headers = 200, self.graphql(body['query'], body.get('variables') or {}), {}
+            else:
+                status, payload, headers = self.rest(method, parsed.path, query, body)
+
+        data = json.dumps(payload).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    # Repository state
+
+    def repo(self, name):
+        return self.repos.get(name)
+
+    def create_repo(self, name):
+        self.repos[name] = {
+            'id': self.new_id('R'),
+            'name': name,
+            'readme': None,
+            'labels': {},
+            'milestones': [],
+            'issues': [],
+            'next_number': 1,
+        }
+        return self.repos[name]
+
+    def add_label(self, repo, name, color):
+        node_id = self.new_id('LA')
+        label = {'id': self.next_id, 'node_id': node_id, 'name': name, 'color': color}
+        repo['labels'][name] = label
+        self.nodes[node_id] = ('label', repo, label)
+        return label
+
+    def add_milestone(self, repo, title, description, due_on):
+        milestone = {
+            'number': len(repo['milestones']) + 1,
+            'node_id': self.new_id('MI'),
+            'title': title,
+            'description': description,
+            'due_on': shifted_due_on(due_on),
+        }
+        repo['milestones'].append(milestone)
+        self.nodes[milestone['node_id']] = ('milestone', repo, milestone)
+        return milestone
+
+    def add_issue(self, repo, title, body, label_names, milestone_title):
+        issue = {
+            'id': repo['next_number'],
+            'node_id': self.new_id('I'),
+            'number': repo['next_number'],
+            'title': title,
+            'body': body,
+            'labels': list(label_names),
+            'milestone': milestone_title,
+            'state': 'open',
+        }
+        repo['next_number'] += 1
+        repo['issues'].append(issue)
+        self.nodes[issue['node_id']] = ('issue', repo, issue)
+        return issue
+
+    def find_node(self, node_id):
+        return self.nodes.get(node_id, (None, None, None))
+
+    # REST
+
+    def rest(self, method, path, query, body):
+        match = re.fullmatch(r'/repos/([^/]+)/([^/]+)/(contents/README\.md|labels|milestones|issues)(?:/(\d+))?', path)
+        if not match or match.group(1) != self.owner or not self.repo(match.group(2)):
+            return 404, {'message': 'Not Found'}, {}
+        repo = self.repo(match.group(2))
+        resource, number = match.group(3), match.group(4)
+
+        if resource.startswith('contents'):
+            if method == 'GET':
+                if repo['readme'] is None:
+                    return 404, {'message': 'Not Found'}, {}
+                return 200, {'sha': repo['readme']['sha'], 'content': repo['readme']['content']}, {}
+            if repo['readme'] is not None and body.get('sha') != repo['readme']['sha']:
+                return 409, {'message': 'README.md does not match sha'}, {}
+            created = repo['readme'] is None
+            sha = hashlib.sha1(base64.b64decode(body['content'])).hexdigest()
+            repo['readme'] = {'sha': sha, 'content': body['content']}
+            return (201 if created else 200), {'content': {'sha': sha}}, {}
+
+        if resource == 'labels' and method == 'POST':
+            if body['name'] in repo['labels']:
+                return 422, {'message': 'Validation Failed', 'errors': [{'code': 'already_exists'}]}, {}
+            return 201, self.add_label(repo, body['name'], body.get('color', 'ededed')), {}
+
+        if resource == 'milestones' and method == 'POST':
+            if any(milestone['title'] == body['title'] for milestone in repo['milestones']):
+                return 422, {'message': 'Validation Failed', 'errors': [{'code': 'already_exists'}]}, {}
+            return 201, self.add_milestone(repo, body['title'], body.get('description', ''), body.get('due_on')), {}
+
+        if resource == 'milestones' and method == 'PATCH':
+            milestone = next((m for m in repo['milestones'] if m['number'] == int(number)), None)
+            if milestone is None:
+                return 404, {'message': 'Not Found'}, {}
+            for key in ('title', 'description', 'due_on'):
+                if key in body:
+                    milestone[key] = shifted_due_on(body[key]) if key == 'due_on' else body[key]
+            return 200, milestone, {}
+
+        if resource == 'issues' and method == 'POST':
+            issue = self.add_issue(repo, body['title'], body.get('body', ''), body.get('labels', []),
+                                   self.milestone_title(repo, body.get('milestone')))
+            return 201, self.rest_issue(issue), {}
+
+        if method == 'GET' and resource in ('milestones', 'issues'):
+            items = repo['milestones'] if resource == 'milestones' else [
+                self.rest_issue(issue) for issue in repo['issues']
+                if query.get('state', 'open') in ('all', issue['state'])]
+            return self.rest_page(path, query, items)
+
+        return 404, {'message': 'Not Found'}, {}
+
+    def milestone_title(self, repo, number):
+        for milestone in repo['milestones']:
+            if milestone['number'] == number:
+                return milestone['title']
+        return None
+
+    def rest_issue(self, issue):
+        return {
+            'id': issue['id'],
+            'node_id': issue['node_id'],
+            'number': issue['number'],
+            'title': issue['title'],
+            'body': issue['body'],
+            'state': issue['state'],
+            'labels': [{'name': name} for name in issue['labels']],
+            'milestone': {'title': issue['milestone']} if issue['milestone'] else None,
+        }
+
+    def rest_page(self, path, query, items):
+        per_page = min(int(query.get('per_page', 30)), 100)
+        page = int(query.get('page', 1))
+        headers = {}
+        if page * per_page < len(items):
+            next_query = urlencode({**query, 'page': page + 1})
+            headers['Link'] = f'<{self.url}{path}?{next_query}>; rel="next"'
+        return 200, items[(page - 1) * per_page:page * per_page], headers
+
+    # GraphQL
+
+    def graphql(self, query, variables):
+        aliases = ALIASED_MUTATION.findall(query)
+        if query.lstrip().startswith('mutation') and aliases:
+            if len(aliases) > self.max_aliases:
+                return {'errors': [{'type': 'MAX_NODE_LIMIT_EXCEEDED',
+                                    'message': f'Document has {len(aliases)} mutations; the limit is {self.max_aliases}.'}]}
+            data, errors = {}, []
+            for alias, field, variable in aliases:
+                try:
+                    data[alias] = self.mutation(field, variables[variable])
+                except KeyError as e:
+                    data[alias] = None
+                    errors.append({'path': [alias], 'type': 'NOT_FOUND', 'message': f'Could not resolve {e}'})
+            return {'data': data, 'errors': errors} if errors else {'data': data}
+
+        if 'createRepository' in query:
+            repo = self.repo(variables['name']) or self.create_repo(variables['name'])
+            return {'data': {'createRepository': {'repository': {'id': repo['id'], 'name': repo['name']}}}}
+        if 'createProjectV2' in query:
+            project_id = self.new_id('PVT')
+            self.projects[project_id] = {'title': variables['title'], 'items': []}
+            return {'data': {'createProjectV2': {'projectV2': {'id': project_id}}}}
+        if 'addProjectV2ItemById' in query:
+            return {'data': {'addProjectV2ItemById': self.mutation('addProjectV2ItemById', variables)}}
+        if 'viewer' in query:
+            return {'data': {'viewer': {'id': self.user_id}}}
+        if 'projectsV2(' in query:
+            nodes = [{'id': project_id, 'title': project['title']} for project_id, project in self.projects.items()
+                     if variables['projectName'] in project['title']]
+            return {'data': {'user': {'projectsV2': {'nodes': nodes}}}}
+        if 'items(first: 100' in query:
+            project = self.projects.get(variables['projectId'])
+            if project is None:
+                return {'data': {'node': None}}
+            nodes = [{'id': item_id, 'content': {'id': content_id}} for item_id, content_id in project['items']]
+            return {'data': {'node': {'items': self.connection(nodes, variables.get('cursor'))}}}
+        if '... on Issue' in query:
+            kind, repo, issue = self.find_node(variables['id'])
+            labels = [{'name': name} for name in issue['labels']] if kind == 'issue' else []
+            return {'data': {'node': {'labels': self.connection(labels, variables.get('cursor'),
+                                                                self.labels_page_size)}}}
+        if '$withLabels' in query:
+            return {'data': {'repository': self.remote_state(variables)}}
+        if 'label(name:' in query:
+            repo = self.repo(variables['repo'])
+            label = repo['labels'].get(variables['name']) if repo else None
+            return {'data': {'repository': {'label': {'id': label['node_id']} if label else None}}}
+        if 'repository(owner:' in query:
+            repo = self.repo(variables['name'])
+            return {'data': {'repository': {'id': repo['id']} if repo else None}}
+        return {'errors': [{'message': 'Query not supported by FakeGitHub'}]}
+
+    def mutation(self, field, data):
+        if field == 'createIssue':
+            repo = next(repo for repo in self.repos.values() if repo['id'] == data['repositoryId'])
+            labels = [self.find_node(label_id)[2]['name'] for label_id in data.get('labelIds', [])]
+            milestone = self.find_node(data['milestoneId'])[2]['title'] if data.get('milestoneId') else None
+            issue = self.add_issue(repo, data['title'], data.get('body', ''), labels, milestone)
+            return {'issue': {'id': issue['node_id'], 'number': issue['number']}}
+        if field == 'updateIssue':
+            kind, repo, issue = self.find_node(data['id'])
+            if kind != 'issue':
+                raise KeyError(data['id'])
+            if 'body' in data:
+                issue['body'] = data['body']
+            if 'labelIds' in data:
+                issue['labels'] = [self.find_node(label_id)[2]['name'] for label_id in data['labelIds']]
+            if 'milestoneId' in data:
+                issue['milestone'] = self.find_node(data['milestoneId'])[2]['title'] if data['milestoneId'] else None
+            return {'issue': {'id': issue['node_id'], 'number': issue['number']}}
+        if field == 'addProjectV2ItemById':
+            project = self.projects[data['projectId']]
+            for item_id, content_id in project['items']:
+                if content_id == data['contentId']:
+                    return {'item': {'id': item_id}}
+            if self.find_node(data['contentId'])[0] != 'issue':
+                raise KeyError(data['contentId'])
+            item_id = self.new_id('PVTI')
+            project['items'].append((item_id, data['contentId']))
+            return {'item': {'id': item_id}}
+        raise KeyError(field)
+
+    def remote_state(self, variables):
+        repo = self.repo(variables['repo'])
+        if repo is None:
+            return None
+        result = {}
+        if variables['withLabels']:
+            nodes = [{'id': label['node_id'], 'name': label['name']} for label in repo['labels'].values()]
+            result['labels'] = self.connection(nodes, variables.get('labelsCursor'))
+        if variables['withMilestones']:
+            nodes = [{'id': milestone['node_id'], 'number': milestone['number'], 'title': milestone['title'],
+                      'description': milestone['description'], 'dueOn': milestone['due_on']}
+                     for milestone in repo['milestones']]
+            result['milestones'] = self.connection(nodes, variables.get('milestonesCursor'))
+        if variables['withIssues']:
+            nodes = [{'id': issue['node_id'], 'number': issue['number'], 'title': issue['title'],
+                      'body': issue['body'],
+                      'milestone': {'title': issue['milestone']} if issue['milestone'] else None,
+                      'labels': self.connection([{'name': name} for name in issue['labels']], None,
+                                                self.labels_page_size)}
+                     for issue in repo['issues']]
+            result['issues'] = self.connection(nodes, variables.get('issuesCursor'))
+        return result
+
+    def connection(self, nodes, cursor, page_size=100):
+        start = int(cursor) if cursor else 0
+        end = start + page_size
+        return {
+            'pageInfo': {'hasNextPage': end < len(nodes), 'endCursor': str(end)},
+            'nodes': nodes[start:end],
+        }
@@ -1,11 +1,25 @@
+import argparse
 import os
 import yaml
 from github import Github, InputGitAuthor
 from github.GithubException import GithubException
 from datetime import datetime, timezone
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+import hashlib
+import json
+from urllib.parse import urlparse
+import random
+import sqlite3
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+import tracing
+
 load_dotenv()
 
 # Read globals from env
@@ -21,6 +35,52 @@ REPO_PRIVATE = False  # Set to True if you want a private repository
 PROJECT_NAME = 'Odoo17 Vector Database Project'
 PROJECT_BODY = 'Project board to track tasks and milestones.'
 
+README_CONTENT = '''# Odoo17 Code Vector Database
+
+## Project Description
+
+The **Odoo17 Code Vector Database** project aims to store the Odoo 17 codebase in a vector database enriched with comprehensive structural information and metadata. This initiative will enhance searchability, contextual understanding, and analytical capabilities, enabling efficient retrieval and analysis of code segments.
+
+**Objectives:**
+
+- **Semantic Search:** Enable code searches based on meaning and context rather than just keywords.
+- **Impact Analysis:** Understand the implications of code changes across the entire codebase.
+- **Refactoring Support:** Identify duplicate code or patterns that require optimization.
+- **Knowledge Sharing:** Facilitate onboarding and knowledge transfer within development teams.
+- **Automated Documentation:** Generate documentation from enriched code metadata.
+
+**Key Features:**
+
+- **Comprehensive Metadata Storage:** Store detailed structural information such as classes, functions, variables, and dependencies.
+- **Vector Embeddings:** Use state-of-the-art models to create vector representations of code for similarity searches.
+- **Efficient Retrieval Mechanisms:** Implement indexing and optimization strategies for fast and relevant search results.
+- **API Development:** Provide APIs for seamless integration with other tools and platforms.
+- **User Interface:** Optional development of a user-friendly interface for interacting with the vector database.
+
+## Project Timeline and Tasks
+
+[Refer to the project milestones and tasks in the GitHub Project Board.]
+
+## Team Roles and Responsibilities
+
+- **Project Lead:** Oversee project progression and coordinate between teams.
+- **Developers:** Implement code parsing, embeddings, and API development.
+- **Data Engineers:** Handle data extraction, storage, and database management.
+- **Testers/QA:** Perform testing and ensure quality standards.
+- **Technical Writers:** Prepare and maintain project documentation.
+
+## Tools and Technologies
+
+- **Programming Language:** Python
+- **Parsing Libraries:** `ast`, `PyParsing`, or similar libraries
+- **Vectorization Models:** CodeBERT, OpenAI Embeddings
+- **Vector Database:** Elasticsearch, Pinecone, or Weaviate
+- **API Framework:** FastAPI or Flask
+- **Version Control:** Git and GitHub
+- **Project Management:** GitHub Projects and Issues
+
+'''
+
 # GitHub API endpoints
 GITHUB_GRAPHQL_API_URL = 'https://api.github.com/graphql'
 GITHUB_REST_API_URL = 'https://api.github.com'
@@ -31,17 +91,312 @@ HEADERS = {
     'Content-Type': 'application/json',
 }
 
+# Local journal of what was last pushed, used to skip unchanged entities on re-runs
+JOURNAL_PATH = os.getenv('GITHUB_SETUP_JOURNAL', '.github_setup_journal.sqlite3')
+
+LABEL_COLOR = 'c5def5'
+
+# Transport settings
+MAX_WORKERS = int(os.getenv('GITHUB_MAX_WORKERS', '4'))
+MAX_RETRIES = int(os.getenv('GITHUB_MAX_RETRIES', '5'))
+BACKOFF_BASE = 1.0  # seconds
+BACKOFF_MAX = 120.0  # seconds
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Methods that can be sent twice safely. Other requests (POST, PATCH, GraphQL mutations) may
+# already have been applied when a 5xx or a dropped connection comes back, so they are only
+# retried on rate limits, which GitHub answers before doing anything.
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+class GitHubSession:
+    """Shared keep-alive session for GitHub API calls with rate-limit-aware retries.
+
+    At most `max_workers` requests are in flight at once. Rate-limited requests are retried
+    after `Retry-After` or `X-RateLimit-Reset`; idempotent requests are also retried with
+    exponential backoff on server errors and dropped connections.
+    Per-endpoint latency and retry counts are collected for `report()`.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_retries=MAX_RETRIES):
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.semaphore = threading.BoundedSemaphore(max_workers)
+        self.lock = threading.Lock()
+        self.stats = defaultdict(lambda: {'calls': 0, 'retries': 0, 'seconds': 0.0})
+        self.latencies = []
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def request(self, method, url, idempotent=None, **kwargs):
+        """Send a request, retrying on rate limits and, when it is `idempotent` (by default:
+        its method is), on server errors and dropped connections."""
+        endpoint = f'{method} {urlparse(url).path}'
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                with self.semaphore:
+                    response = self.session.request(method, url, **kwargs)
+                delay = self.retry_delay(response, attempt, idempotent)
+            except requests.ConnectionError as e:
+                # A connect timeout means the request was never sent
+                if attempt >= self.max_retries or not (idempotent or isinstance(e, requests.ConnectTimeout)):
+                    raise
+                response = None
+                delay = self.backoff(attempt)
+            self.record(endpoint, time.perf_counter() - start, retried=delay is not None)
+            if delay is None:
+                return response
+            time.sleep(delay)
+            attempt += 1
+
+    def retry_delay(self, response, attempt, idempotent=True):
+        """Return how long to wait before retrying `response`, or None if it should not be retried.
+
+        Waits for rate limits follow the headers in full, even past BACKOFF_MAX, since retrying
+        earlier only burns attempts.
+        """
+        if attempt >= self.max_retries:
+            return None
+        rate_limited = response.status_code == 429 or (
+            response.status_code == 403 and (
+                response.headers.get('X-RateLimit-Remaining') == '0'
+                or 'rate limit' in response.text.lower()))
+        if not rate_limited and (not idempotent or response.status_code not in RETRY_STATUS_CODES):
+            return None
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        reset = response.headers.get('X-RateLimit-Reset')
+        if rate_limited and response.headers.get('X-RateLimit-Remaining') == '0' and reset and reset.isdigit():
+            return max(int(reset) - time.time(), 0) + 1
+        return self.backoff(attempt)
+
+    def backoff(self, attempt):
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX))
+
+    def record(self, endpoint, seconds, retried):
+        with self.lock:
+            stats = self.stats[endpoint]
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            self.latencies.append(seconds)
+            if retried:
+                stats['retries'] += 1
+
+    def report(self):
+        """Print per-endpoint call counts, latency and retries."""
+        if not self.stats:
+            return
+        print('GitHub API usage:')
+        print(f'  {"endpoint":<60} {"calls":>6} {"retries":>8} {"avg ms":>8} {"total s":>8}')
+        for endpoint, stats in sorted(self.stats.items(), key=lambda item: -item[1]['seconds']):
+            average = stats['seconds'] / stats['calls'] * 1000
+            print(f'  {endpoint:<60} {stats["calls"]:>6} {stats["retries"]:>8} {average:>8.1f} {stats["seconds"]:>8.2f}')
+
+session = GitHubSession()
+
+class SyncJournal:
+    """SQLite record of the content hash and remote ID of every entity last pushed to GitHub.
+
+    Entries are committed as soon as an entity is known to be in sync, so an interrupted run
+    resumes with whatever was left over.
+    """
+
+    def __init__(self, scope, path=JOURNAL_PATH):
+        self.scope = scope
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS entities (
+                scope TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                remote_id TEXT,
+                pushed_at TEXT NOT NULL,
+                PRIMARY KEY (scope, kind, key)
+            )
+        ''')
+        self.connection.commit()
+        rows = self.connection.execute(
+            'SELECT kind, key, hash, remote_id FROM entities WHERE scope = ?', (scope,))
+        self.entries = {(kind, key): (digest, remote_id) for kind, key, digest, remote_id in rows}
+
+    def is_current(self, kind, key, digest):
+        """Return True if the entity was last pushed with the same content hash."""
+        entry = self.entries.get((kind, key))
+        return entry is not None and entry[0] == digest
+
+    def remote_id(self, kind, key):
+        entry = self.entries.get((kind, key))
+        return entry[1] if entry else None
+
+    def record(self, kind, key, digest, remote_id=None):
+        with self.lock:
+            self.entries[(kind, key)] = (digest, remote_id)
+            self.connection.execute(
+                'INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?)',
+                (self.scope, kind, key, digest, remote_id, datetime.now(timezone.utc).isoformat()))
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+def content_hash(value):
+    """Stable hash of a JSON-serializable value."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+def label_hash(name):
+    return content_hash({'name': name, 'color': LABEL_COLOR})
+
+def milestone_hash(title, milestone_data):
+    return content_hash({
+        'title': title,
+        'description': milestone_data.get('description', ''),
+        'due_on': milestone_data.get('due_on'),
+    })
+
+def task_hash(milestone_title, task):
+    return content_hash({
+        'title': task['title'],
+        'body': task.get('body', ''),
+        'labels': sorted(task.get('labels', [])),
+        'milestone': milestone_title,
+    })
+
+def pending_milestones(milestones, journal):
+    """Return the part of milestones.yaml that differs from what the journal says was pushed.
+
+    A milestone is kept when it changed itself or when any of its tasks (or their labels) did;
+    only the changed tasks are kept.
+    """
+    pending = {}
+    for milestone_title, milestone_data in milestones.items():
+        tasks = [task for task in milestone_data['tasks']
+                 if not journal.is_current('task', task['title'], task_hash(milestone_title, task))
+                 or not all(journal.is_current('label', name, label_hash(name)) for name in task.get('labels', []))]
+        if tasks or not journal.is_current('milestone', milestone_title, milestone_hash(milestone_title, milestone_data)):
+            pending[milestone_title] = {**milestone_data, 'tasks': tasks}
+    return pending
+
+@tracing.traced()
 def graphql_query(query, variables=None):
-    """Send a GraphQL query to the GitHub API."""
-    response = requests.post(
+    """Send a GraphQL query to the GitHub API. Only queries, not mutations, are retried on errors."""
+    response = session.post(
         GITHUB_GRAPHQL_API_URL,
         json={'query': query, 'variables': variables},
-        headers=HEADERS
+        idempotent=not query.lstrip().startswith('mutation'),
     )
     if response.status_code != 200:
         raise Exception(f"Query failed to run by returning code of {response.status_code}. {response.text}")
     return response.json()
 
+def paginate_graphql(query, variables, path):
+    """Yield the nodes of a GraphQL connection one page at a time.
+
+    `query` must accept a `$cursor: String` variable and select `pageInfo { hasNextPage endCursor }`
+    and `nodes` on the connection found by following `path` from `data`.
+    """
+    cursor = None
+    while True:
+        result = graphql_query(query, {**variables, 'cursor': cursor})
+        if result.get('errors'):
+            raise Exception(f"Query failed: {result['errors']}")
+        connection = result['data']
+        for key in path:
+            connection = connection.get(key) if connection else None
+        if not connection:
+            return
+        yield from connection['nodes']
+        if not connection['pageInfo']['hasNextPage']:
+            return
+        cursor = connection['pageInfo']['endCursor']
+
+def paginate_rest(url, params=None):
+    """Yield the items of a REST list endpoint, following `Link: rel="next"` headers."""
+    params = {'per_page': 100, **(params or {})}
+    while url:
+        with tracing.span('paginate_rest.page', url=url):
+            response = session.get(url, params=params)
+        if response.status_code != 200:
+            raise Exception(f"Failed to get {url}: {response.text}")
+        yield from response.json()
+        # The next link already carries the query string
+        url = response.links.get('next', {}).get('url')
+        params = None
+
+# Upper bound on the number of aliased mutations packed into one GraphQL document
+MUTATION_BATCH_SIZE = 50
+
+# GraphQL error types that mean the document as a whole was too expensive
+GRAPHQL_LIMIT_ERRORS = {'MAX_NODE_LIMIT_EXCEEDED', 'RESOURCE_LIMITS_EXCEEDED', 'EXCESSIVE_COMPLEXITY'}
+
+def graphql_batch_mutation(field, input_type, selection, inputs, batch_size=MUTATION_BATCH_SIZE):
+    """Run the `field` mutation once per input, packing several calls into one aliased document.
+
+    Returns a list of (data, error) tuples in the same order as `inputs`. Errors that GitHub
+    reports against a single alias are mapped back to that input only. When the whole document
+    is rejected for its cost the batch is split in half and retried. Other failures of the
+    whole document (server errors, timeouts) are reported against every input and not resent,
+    since GitHub may have applied the mutations anyway; the next run reconciles them.
+    """
+    results = [None] * len(inputs)
+    pending = [list(range(start, min(start + batch_size, len(inputs))))
+               for start in range(0, len(inputs), batch_size)]
+    while pending:
+        indexes = pending.pop(0)
+        aliases = {f'm{i}': i for i in indexes}
+        declarations = ', '.join(f'$input{i}: {input_type}!' for i in indexes)
+        body = '\n'.join(f'  m{i}: {field}(input: $input{i}) {selection}' for i in indexes)
+        query = f'mutation({declarations}) {{\n{body}\n}}'
+        variables = {f'input{i}': inputs[i] for i in indexes}
+        try:
+            result = graphql_query(query, variables)
+        except Exception as e:
+            result = {'errors': [{'message': str(e)}]}
+
+        alias_errors = {}
+        document_errors = []
+        for error in result.get('errors') or []:
+            path = error.get('path') or []
+            if path and path[0] in aliases:
+                alias_errors[path[0]] = error.get('message', str(error))
+            else:
+                document_errors.append(error)
+
+        if len(indexes) > 1 and any(error.get('type') in GRAPHQL_LIMIT_ERRORS for error in document_errors):
+            middle = len(indexes) // 2
+            pending[:0] = [indexes[:middle], indexes[middle:]]
+            continue
+
+        data = result.get('data') or {}
+        for alias, i in aliases.items():
+            if alias in alias_errors:
+                results[i] = (None, alias_errors[alias])
+            elif data.get(alias) is not None:
+                results[i] = (data[alias], None)
+            else:
+                message = '; '.join(error.get('message', str(error)) for error in document_errors)
+                results[i] = (None, message or f'No data returned for {field}')
+    return results
+
 def get_user_id():
     """Get the authenticated user's ID."""
     query = '''
@@ -90,11 +445,12 @@ def create_repository(name, description, is_private):
     print('Result:', result)
     return result['data']['createRepository']['repository']['id']
 
+@tracing.traced()
 def update_readme(owner, repo, content):
     """Update the README.md file."""
     # Get the SHA of the existing README.md if it exists
     url = f"{GITHUB_REST_API_URL}/repos/{owner}/{repo}/contents/README.md"
-    response = requests.get(url, headers=HEADERS)
+    response = session.get(url)
     if response.status_code == 200:
         sha = response.json()['sha']
         message = 'Update README.md with project description and timeline'
@@ -113,7 +469,7 @@ def update_readme(owner, repo, content):
     if sha:
         data['sha'] = sha
 
-    response = requests.put(url, json=data, headers=HEADERS)
+    response = session.put(url, json=data)
     if response.status_code not in [200, 201]:
         raise Exception(f"Failed to update README.md: {response.text}")
 
@@ -133,57 +489,71 @@ def get_label_id(owner, repo, name):
     label = result['data']['repository']['label']
     return label['id'] if label else None
 
+@tracing.traced()
 def create_label(owner, repo, name, color):
     """Create a label."""
     url = f"{GITHUB_REST_API_URL}/repos/{owner}/{repo}/labels"
     data = {'name': name, 'color': color}
-    response = requests.post(url, json=data, headers=HEADERS)
+    response = session.post(url, json=data)
     if response.status_code not in [200, 201]:
         if response.status_code == 422 and 'already_exists' in response.text:
             print(f'Label "{name}" already exists. Skipping.')
         else:
             raise Exception(f"Failed to create label {name}: {response.text}")
 
-def get_milestone_number(owner, repo, title):
-    """Get the number of a milestone."""
-    url = f"{GITHUB_REST_API_URL}/repos/{owner}/{repo}/milestones"
-    response = requests.get(url, headers=HEADERS)
-    if response.status_code != 200:
-        raise Exception(f"Failed to get milestones: {response.text}")
-    milestones = response.json()
-    for milestone in milestones:
-        if milestone['title'] == title:
-            return milestone['number']
-    return None
-
+@tracing.traced()
 def create_milestone(owner, repo, title, description, due_on):
     """Create a milestone."""
     url = f"{GITHUB_REST_API_URL}/repos/{owner}/{repo}/milestones"
     data = {'title': title, 'description': description}
     if due_on:
         data['due_on'] = due_on.isoformat()
-    response = requests.post(url, json=data, headers=HEADERS)
+    response = session.post(url, json=data)
     if response.status_code not in [200, 201]:
         raise Exception(f"Failed to create milestone {title}: {response.text}")
     return response.json()['number']
 
-def create_issue(owner, repo, title, body, labels, milestone_number):
-    """Create an issue."""
+@tracing.traced()
+def update_milestone(owner, repo, number, description, due_on):
+    """Update the description and due date of a milestone."""
+    url = f"{GITHUB_REST_API_URL}/repos/{owner}/{repo}/milestones/{number}"
+    data = {'description': description, 'due_on': due_on.isoformat() if due_on else None}
+    response = session.patch(url, json=data)
+    if response.status_code != 200:
+        raise Exception(f"Failed to update milestone {number}: {response.text}")
+
+def create_issues(repository_id, issues):
+    """Create issues in batches.
+
+    `issues` is a list of dicts with 'title', 'body', 'labelIds' and 'milestoneId'.
+    Returns a list of (issue, error) tuples in input order, where issue holds 'id' and 'number'.
+    """
+    inputs = []
+    for issue in issues:
+        data = {'repositoryId': repository_id, 'title': issue['title'], 'body': issue.get('body', '')}
+        if issue.get('labelIds'):
+            data['labelIds'] = issue['labelIds']
+        if issue.get('milestoneId'):
+            data['milestoneId'] = issue['milestoneId']
+        inputs.append(data)
+    results = graphql_batch_mutation('createIssue', 'CreateIssueInput', '{ issue { id number } }', inputs)
+    return [(data['issue'] if data else None, error) for data, error in results]
+
+def iter_issues(owner, repo, state='all'):
+    """Yield the issues of a repository, skipping pull requests."""
     url = f"{GITHUB_REST_API_URL}/repos/{owner}/{repo}/issues"
-    data = {
-        'title': title,
-        'body': body,
-        'labels': labels,
-        'milestone': milestone_number
-    }
-    response = requests.post(url, json=data, headers=HEADERS)
-    if response.status_code not in [200, 201]:
-        if response.status_code == 422 and 'already_exists' in response.text:
-            print(f'Issue "{title}" already exists. Skipping.')
-        else:
-            raise Exception(f"Failed to create issue {title}: {response.text}")
-    else:
-        return response.json()['number']
+    for issue in paginate_rest(url, {'state': state}):
+        if 'pull_request' not in issue:
+            yield issue
+
+def update_issues(updates):
+    """Update issues in batches.
+
+    `updates` is a list of dicts with 'id', 'body', 'labelIds' and 'milestoneId'.
+    Returns a list of (issue, error) tuples in input order.
+    """
+    results = graphql_batch_mutation('updateIssue', 'UpdateIssueInput', '{ issue { id number } }', updates)
+    return [(data['issue'] if data else None, error) for data, error in results]
 
 def get_project_id(owner_id, project_name):
     """Get the ID of a project."""
@@ -238,159 +608,505 @@ def add_issue_to_project(project_id, issue_id):
     result = graphql_query(query, variables)
     return result['data']['addProjectV2ItemById']['item']['id']
 
-def main():
-    try:
-        # Load milestones and tasks from YAML file
-        with open('milestones.yaml', 'r') as file:
-            data = yaml.safe_load(file)
-        MILESTONES = data['MILESTONES']
+def add_issues_to_project(project_id, issue_ids):
+    """Add issues to a project in batches.
 
-        # Extract all labels used in tasks
-        labels_in_tasks = set()
-        for milestone_data in MILESTONES.values():
-            for task in milestone_data['tasks']:
-                labels_in_tasks.update(task.get('labels', []))
+    Returns a list of (item_id, error) tuples in the same order as `issue_ids`.
+    """
+    inputs = [{'projectId': project_id, 'contentId': issue_id} for issue_id in issue_ids]
+    results = graphql_batch_mutation('addProjectV2ItemById', 'AddProjectV2ItemByIdInput', '{ item { id } }', inputs)
+    return [(data['item']['id'] if data else None, error) for data, error in results]
 
-        # Get the authenticated user ID
-        user_id = get_user_id()
-        print(f'Authenticated user ID: {user_id}')
+REMOTE_SECTIONS = ('labels', 'milestones', 'issues', 'project_items')
 
-        # Check if repository exists
-        repo_id = get_repository_id(GITHUB_USERNAME, REPO_NAME)
-        if repo_id:
-            print(f'Repository {REPO_NAME} already exists.')
-        else:
-            print(f'Creating repository {REPO_NAME}...')
-            repo_id = create_repository(REPO_NAME, REPO_DESCRIPTION, REPO_PRIVATE)
-            print('Repository created successfully.')
+REMOTE_STATE_QUERY = '''
+query($owner: String!, $repo: String!,
+      $withLabels: Boolean!, $labelsCursor: String,
+      $withMilestones: Boolean!, $milestonesCursor: String,
+      $withIssues: Boolean!, $issuesCursor: String) {
+  repository(owner: $owner, name: $repo) {
+    labels(first: 100, after: $labelsCursor) @include(if: $withLabels) {
+      pageInfo { hasNextPage endCursor }
+      nodes { id name }
+    }
+    milestones(first: 100, after: $milestonesCursor, states: [OPEN, CLOSED]) @include(if: $withMilestones) {
+      pageInfo { hasNextPage endCursor }
+      nodes { id number title description dueOn }
+    }
+    issues(first: 100, after: $issuesCursor, states: [OPEN, CLOSED],
+           orderBy: {field: CREATED_AT, direction: ASC}) @include(if: $withIssues) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        id
+        number
+        title
+        body
+        milestone { title }
+        labels(first: 100) {
+          pageInfo { hasNextPage endCursor }
+          nodes { name }
+        }
+      }
+    }
+  }
+}
+'''
 
-        # Update README.md
-        print('Updating README.md...')
-        readme_content = '''# Odoo17 Code Vector Database
+# The rest of the labels of an issue with more than a page of them
+ISSUE_LABELS_QUERY = '''
+query($id: ID!, $cursor: String) {
+  node(id: $id) {
+    ... on Issue {
+      labels(first: 100, after: $cursor) {
+        pageInfo { hasNextPage endCursor }
+        nodes { name }
+      }
+    }
+  }
+}
+'''
 
-## Project Description
+def fetch_remote_state(owner, repo, project_id=None, sections=REMOTE_SECTIONS):
+    """Fetch labels, milestones, issues and project items into dictionaries keyed by title.
 
-The **Odoo17 Code Vector Database** project aims to store the Odoo 17 codebase in a vector database enriched with comprehensive structural information and metadata. This initiative will enhance searchability, contextual understanding, and analytical capabilities, enabling efficient retrieval and analysis of code segments.
+    Every request asks for the next page of each repository connection that still has one,
+    so a repository with fewer than 100 of each costs a single request. Project items are
+    streamed separately and only their content IDs are kept.
+    """
+    state = {'labels': {}, 'milestones': {}, 'issues': {}, 'project_items': set()}
+    if 'project_items' in sections and project_id:
+        state['project_items'] = {item['content']['id'] for item in iter_project_items(project_id) if item['content']}
+    cursors = {section: None for section in sections if section != 'project_items'}
+    while cursors:
+        variables = {
+            'owner': owner, 'repo': repo,
+            'withLabels': 'labels' in cursors, 'labelsCursor': cursors.get('labels'),
+            'withMilestones': 'milestones' in cursors, 'milestonesCursor': cursors.get('milestones'),
+            'withIssues': 'issues' in cursors, 'issuesCursor': cursors.get('issues'),
+        }
+        result = graphql_query(REMOTE_STATE_QUERY, variables)
+        if result.get('errors'):
+            raise Exception(f"Failed to fetch remote state: {result['errors']}")
+        connections = result['data']['repository']
 
-**Objectives:**
+        for section in list(cursors):
+            connection = connections[section]
+            if connection is None:
+                del cursors[section]
+                continue
+            for node in connection['nodes']:
+                if section == 'labels':
+                    state['labels'][node['name']] = node
+                elif section == 'milestones':
+                    state['milestones'][node['title']] = node
+                else:
+                    if node['title'] in state['issues']:
+                        print(f'Duplicate issue title "{node["title"]}" (#{node["number"]}). Ignoring.')
+                        continue
+                    labels = node['labels']['nodes']
+                    if node['labels']['pageInfo']['hasNextPage']:
+                        labels = paginate_graphql(ISSUE_LABELS_QUERY, {'id': node['id']}, ['node', 'labels'])
+                    state['issues'][node['title']] = {
+                        'id': node['id'],
+                        'number': node['number'],
+                        'body': node['body'],
+                        'milestone': node['milestone']['title'] if node['milestone'] else None,
+                        'labels': sorted(label['name'] for label in labels),
+                    }
+            if connection['pageInfo']['hasNextPage']:
+                cursors[section] = connection['pageInfo']['endCursor']
+            else:
+                del cursors[section]
+    return state
 
-- **Semantic Search:** Enable code searches based on meaning and context rather than just keywords.
-- **Impact Analysis:** Understand the implications of code changes across the entire codebase.
-- **Refactoring Support:** Identify duplicate code or patterns that require optimization.
-- **Knowledge Sharing:** Facilitate onboarding and knowledge transfer within development teams.
-- **Automated Documentation:** Generate documentation from enriched code metadata.
+def parse_due_on(milestone_data):
+    """Convert a milestone's 'due_on' string to a datetime object."""
+    due_on_str = milestone_data.get('due_on', None)
+    if due_on_str:
+        return datetime.strptime(due_on_str, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    return None
 
-**Key Features:**
+def same_due_on(remote_due_on, due_on):
+    """Compare a remote milestone's dueOn timestamp with a due_on datetime from milestones.yaml.
 
-- **Comprehensive Metadata Storage:** Store detailed structural information such as classes, functions, variables, and dependencies.
-- **Vector Embeddings:** Use state-of-the-art models to create vector representations of code for similarity searches.
-- **Efficient Retrieval Mechanisms:** Implement indexing and optimization strategies for fast and relevant search results.
-- **API Development:** Provide APIs for seamless integration with other tools and platforms.
-- **User Interface:** Optional development of a user-friendly interface for interacting with the vector database.
+    GitHub stores due dates in the owner's time zone and can return them shifted into the
+    neighbouring UTC day, so dates one day apart count as the same.
+    """
+    if not remote_due_on or not due_on:
+        return not remote_due_on and not due_on
+    remote = datetime.fromisoformat(remote_due_on.replace('Z', '+00:00')).astimezone(timezone.utc)
+    return abs((remote.date() - due_on.astimezone(timezone.utc).date()).days) <= 1
 
-## Project Timeline and Tasks
+def build_plan(milestones, state):
+    """Diff milestones.yaml against the remote state and list the changes that are needed."""
+    plan = {
+        'create_labels': [],
+        'create_milestones': [],
+        'update_milestones': [],
+        'create_issues': [],
+        'update_issues': [],
+        'add_to_project': [],
+    }
+    labels_in_tasks = set()
+    for milestone_title, milestone_data in milestones.items():
+        remote_milestone = state['milestones'].get(milestone_title)
+        due_on = parse_due_on(milestone_data)
+        if remote_milestone is None:
+            plan['create_milestones'].append(milestone_title)
+        elif ((remote_milestone['description'] or '') != milestone_data.get('description', '')
+              or not same_due_on(remote_milestone['dueOn'], due_on)):
+            plan['update_milestones'].append(milestone_title)
 
-[Refer to the project milestones and tasks in the GitHub Project Board.]
+        for task in milestone_data['tasks']:
+            labels_in_tasks.update(task.get('labels', []))
+            remote_issue = state['issues'].get(task['title'])
+            if remote_issue is None:
+                plan['create_issues'].append((milestone_title, task))
+                continue
+            if (remote_issue['body'] != task.get('body', '')
+                    or remote_issue['milestone'] != milestone_title
+                    or remote_issue['labels'] != sorted(task.get('labels', []))):
+                plan['update_issues'].append((milestone_title, task))
+            if remote_issue['id'] not in state['project_items']:
+                plan['add_to_project'].append(task['title'])
 
-## Team Roles and Responsibilities
+    plan['create_labels'] = sorted(labels_in_tasks - set(state['labels']))
+    return plan
 
-- **Project Lead:** Oversee project progression and coordinate between teams.
-- **Developers:** Implement code parsing, embeddings, and API development.
-- **Data Engineers:** Handle data extraction, storage, and database management.
-- **Testers/QA:** Perform testing and ensure quality standards.
-- **Technical Writers:** Prepare and maintain project documentation.
+def print_plan(plan):
+    """Print the changes a plan would make."""
+    if not any(plan.values()):
+        print('Remote state is up to date. Nothing to do.')
+        return
+    for label_name in plan['create_labels']:
+        print(f'  + label "{label_name}"')
+    for milestone_title in plan['create_milestones']:
+        print(f'  + milestone "{milestone_title}"')
+    for milestone_title in plan['update_milestones']:
+        print(f'  ~ milestone "{milestone_title}"')
+    for milestone_title, task in plan['create_issues']:
+        print(f'  + issue "{task["title"]}"')
+    for milestone_title, task in plan['update_issues']:
+        print(f'  ~ issue "{task["title"]}"')
+    for issue_title in plan['add_to_project']:
+        print(f'  + project item "{issue_title}"')
 
-## Tools and Technologies
+def record_in_sync(journal, plan, state, milestones):
+    """Journal every entity the plan found to be already in sync with GitHub."""
+    planned_milestones = set(plan['create_milestones']) | set(plan['update_milestones'])
+    planned_tasks = {task['title'] for milestone_title, task in plan['create_issues'] + plan['update_issues']}
+    planned_tasks.update(plan['add_to_project'])
+    for label_name, label in state['labels'].items():
+        journal.record('label', label_name, label_hash(label_name), label['id'])
+    for milestone_title, milestone_data in milestones.items():
+        if milestone_title not in planned_milestones:
+            journal.record('milestone', milestone_title, milestone_hash(milestone_title, milestone_data),
+                           state['milestones'][milestone_title]['id'])
+        for task in milestone_data['tasks']:
+            if task['title'] not in planned_tasks:
+                journal.record('task', task['title'], task_hash(milestone_title, task),
+                               state['issues'][task['title']]['id'])
 
-- **Programming Language:** Python
-- **Parsing Libraries:** `ast`, `PyParsing`, or similar libraries
-- **Vectorization Models:** CodeBERT, OpenAI Embeddings
-- **Vector Database:** Elasticsearch, Pinecone, or Weaviate
-- **API Framework:** FastAPI or Flask
-- **Version Control:** Git and GitHub
-- **Project Management:** GitHub Projects and Issues
+def apply_plan(plan, state, milestones, repository_id, project_id, pipelined=True, ordered=True, journal=None):
+    """Run the creates and updates listed in a plan.
 
-'''
-        update_readme(GITHUB_USERNAME, REPO_NAME, readme_content)
-        print('README.md updated.')
-
-        # Create labels
+    With a `journal`, every entity is recorded as soon as it is in sync.
+    """
+    if plan['create_labels']:
         print('Creating labels...')
-        for label_name in labels_in_tasks:
-            create_label(GITHUB_USERNAME, REPO_NAME, label_name, 'c5def5')
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            list(pool.map(lambda label_name: create_label(GITHUB_USERNAME, REPO_NAME, label_name, LABEL_COLOR),
+                          plan['create_labels']))
         print('Labels processing completed.')
 
-        # Create milestones and issues
-        print('Creating milestones and issues...')
-        for milestone_title, milestone_data in MILESTONES.items():
-            # Check if milestone exists
-            milestone_number = get_milestone_number(GITHUB_USERNAME, REPO_NAME, milestone_title)
-            if milestone_number:
-                print(f'Milestone "{milestone_title}" already exists. Skipping creation.')
+    for milestone_title in plan['create_milestones']:
+        milestone_data = milestones[milestone_title]
+        create_milestone(GITHUB_USERNAME, REPO_NAME, milestone_title,
+                         milestone_data.get('description', ''), parse_due_on(milestone_data))
+        print(f'Created milestone: {milestone_title}')
+    for milestone_title in plan['update_milestones']:
+        milestone_data = milestones[milestone_title]
+        update_milestone(GITHUB_USERNAME, REPO_NAME, state['milestones'][milestone_title]['number'],
+                         milestone_data.get('description', ''), parse_due_on(milestone_data))
+        print(f'Updated milestone: {milestone_title}')
+
+    if plan['create_labels'] or plan['create_milestones']:
+        # Pick up the node IDs of the labels and milestones created above
+        refreshed = fetch_remote_state(GITHUB_USERNAME, REPO_NAME, sections=('labels', 'milestones'))
+        state['labels'].update(refreshed['labels'])
+        state['milestones'].update(refreshed['milestones'])
+
+    if journal:
+        for label_name in plan['create_labels']:
+            if label_name in state['labels']:
+                journal.record('label', label_name, label_hash(label_name), state['labels'][label_name]['id'])
+        for milestone_title in plan['create_milestones'] + plan['update_milestones']:
+            if milestone_title in state['milestones']:
+                journal.record('milestone', milestone_title, milestone_hash(milestone_title, milestones[milestone_title]),
+                               state['milestones'][milestone_title]['id'])
+
+    def issue_input(milestone_title, task):
+        return {
+            'title': task['title'],
+            'body': task.get('body', ''),
+            'labelIds': [state['labels'][name]['id'] for name in task.get('labels', []) if name in state['labels']],
+            'milestoneId': state['milestones'][milestone_title]['id'] if milestone_title in state['milestones'] else None,
+        }
+
+    # Tasks are journaled once their issue is both up to date and on the project board
+    tasks = {task['title']: (milestone_title, task)
+             for milestone_title, milestone_data in milestones.items() for task in milestone_data['tasks']}
+    failed_updates = set()
+
+    def record_task(issue_title, remote_id):
+        if journal:
+            milestone_title, task = tasks[issue_title]
+            journal.record('task', issue_title, task_hash(milestone_title, task), remote_id)
+
+    if plan['update_issues']:
+        print('Updating issues...')
+        updates = []
+        for milestone_title, task in plan['update_issues']:
+            update = issue_input(milestone_title, task)
+            update['id'] = state['issues'][update.pop('title')]['id']
+            updates.append(update)
+        for (milestone_title, task), (issue, error) in zip(plan['update_issues'], update_issues(updates)):
+            if error:
+                print(f'  Failed to update issue "{task["title"]}": {error}')
+                failed_updates.add(task['title'])
             else:
-                # Convert 'due_on' to datetime object
-                due_on_str = milestone_data.get('due_on', None)
-                if due_on_str:
-                    due_on = datetime.strptime(due_on_str, '%Y-%m-%d').replace(tzinfo=timezone.utc)
-                else:
-                    due_on = None
-                # Create milestone
-                milestone_number = create_milestone(
-                    GITHUB_USERNAME, REPO_NAME,
-                    milestone_title,
-                    milestone_data.get('description', ''),
-                    due_on
-                )
-                print(f'Created milestone: {milestone_title}')
-
-            # Create issues for the milestone
-            for task in milestone_data['tasks']:
-                issue_title = task['title']
-                # Check if issue exists
-                # For simplicity, we assume issues are unique by title
-                # You may need to implement additional checks
-                try:
-                    issue_number = create_issue(
-                        GITHUB_USERNAME, REPO_NAME,
-                        issue_title,
-                        task.get('body', ''),
-                        task.get('labels', []),
-                        milestone_number
-                    )
-                    print(f'  Created issue: {issue_title}')
-                except Exception as e:
-                    print(e)
-        print('Milestones and issues processing completed.')
-
-        # Create project (GitHub Projects Beta)
-        print('Creating or fetching project...')
-        project_id = get_project_id(user_id, PROJECT_NAME)
-        if project_id:
-            print(f'Project "{PROJECT_NAME}" already exists.')
+                print(f'  Updated issue #{issue["number"]}: {task["title"]}')
+                if task['title'] not in plan['add_to_project']:
+                    record_task(task['title'], issue['id'])
+
+    issues = [issue_input(milestone_title, task) for milestone_title, task in plan['create_issues']]
+    if issues:
+        print('Creating issues...')
+        if pipelined:
+            # Issues are streamed into the project as soon as each batch is created
+            results = provision_issues(repository_id, project_id, issues, ordered=ordered)
         else:
-            print(f'Creating project "{PROJECT_NAME}"')
-            project_id = create_project(user_id, PROJECT_NAME)
-            print(f'Project "{PROJECT_NAME}" created with ID: {project_id}')
+            results = create_issues(repository_id, issues)
+            attached = iter(add_issues_to_project(project_id, [created['id'] for created, error in results if created]))
+            for position, (created, error) in enumerate(results):
+                if created:
+                    item_id, error = next(attached)
+                    if error:
+                        results[position] = (None, f'Created issue #{created["number"]} but failed to add it to the project: {error}')
+        for issue, (created, error) in zip(issues, results):
+            if error:
+                print(f'  Failed to provision issue "{issue["title"]}": {error}')
+            else:
+                print(f'  Created issue #{created["number"]}: {issue["title"]}')
+                record_task(issue['title'], created['id'])
 
-        # Add issues to the project
+    if plan['add_to_project']:
         print('Adding issues to project...')
-        # Get all open issues
-        url = f"{GITHUB_REST_API_URL}/repos/{GITHUB_USERNAME}/{REPO_NAME}/issues"
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code != 200:
-            raise Exception(f"Failed to get issues: {response.text}")
-        issues = response.json()
-        for issue in issues:
-            issue_node_id = issue['node_id']
-            add_issue_to_project(project_id, issue_node_id)
-            print(f'  Added issue "{issue["title"]}" to project.')
+        issue_ids = [state['issues'][issue_title]['id'] for issue_title in plan['add_to_project']]
+        for issue_title, (item_id, error) in zip(plan['add_to_project'], add_issues_to_project(project_id, issue_ids)):
+            if error:
+                print(f'  Failed to add issue "{issue_title}" to project: {error}')
+            else:
+                print(f'  Added issue "{issue_title}" to project.')
+                if issue_title not in failed_updates:
+                    record_task(issue_title, state['issues'][issue_title]['id'])
         print('Issues added to project.')
 
+PROJECT_ITEMS_QUERY = '''
+query($projectId: ID!, $cursor: String) {
+  node(id: $projectId) {
+    ... on ProjectV2 {
+      items(first: 100, after: $cursor) {
+        pageInfo { hasNextPage endCursor }
+        nodes { id content { ... on Issue { id } ... on PullRequest { id } } }
+      }
+    }
+  }
+}
+'''
+
+def iter_project_items(project_id):
+    """Yield the items of a project."""
+    yield from paginate_graphql(PROJECT_ITEMS_QUERY, {'projectId': project_id}, ('node', 'items'))
+
+def attach_missing_issues(owner, repo, project_id, batch_size=MUTATION_BATCH_SIZE):
+    """Add every repository issue that is not on the project yet, in batches.
+
+    Issues are streamed page by page; only the content IDs of existing project items are kept
+    in memory. Yields (issue, item_id, error) tuples for the issues that were added.
+    """
+    attached = {item['content']['id'] for item in iter_project_items(project_id) if item['content']}
+    missing = (issue for issue in iter_issues(owner, repo) if issue['node_id'] not in attached)
+    while True:
+        batch = list(islice(missing, batch_size))
+        if not batch:
+            return
+        results = add_issues_to_project(project_id, [issue['node_id'] for issue in batch])
+        for issue, (item_id, error) in zip(batch, results):
+            yield issue, item_id, error
+
+def ensure_project(user_id):
+    """Return the ID of the project, creating it if it does not exist yet."""
+    print('Creating or fetching project...')
+    project_id = get_project_id(user_id, PROJECT_NAME)
+    if project_id:
+        print(f'Project "{PROJECT_NAME}" already exists.')
+    else:
+        print(f'Creating project "{PROJECT_NAME}"')
+        project_id = create_project(user_id, PROJECT_NAME)
+        print(f'Project "{PROJECT_NAME}" created with ID: {project_id}')
+    return project_id
+
+def provision_issues(repository_id, project_id, issues, ordered=True, batch_size=MUTATION_BATCH_SIZE):
+    """Create issues and stream their node IDs into the project as a pipeline.
+
+    Issues are created in batches; each finished batch is handed to a worker pool that adds it
+    to the project while the next batch is being created. GitHub numbers issues in the order
+    it receives them, so with `ordered` batches are submitted one at a time in input order.
+    Without it, batches are created concurrently as well.
+
+    Returns a list of (issue, error) tuples in input order.
+    """
+    batches = [issues[start:start + batch_size] for start in range(0, len(issues), batch_size)]
+    created = [None] * len(batches)
+    attached = [None] * len(batches)
+
+    def attach(created_batch):
+        positions = [position for position, (issue, error) in enumerate(created_batch) if issue]
+        items = add_issues_to_project(project_id, [created_batch[position][0]['id'] for position in positions])
+        return dict(zip(positions, items))
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        attach_futures = {}
+        if ordered:
+            for index, batch in enumerate(batches):
+                created[index] = create_issues(repository_id, batch)
+                attach_futures[pool.submit(attach, created[index])] = index
+        else:
+            create_futures = {pool.submit(create_issues, repository_id, batch): index
+                              for index, batch in enumerate(batches)}
+            for future in as_completed(create_futures):
+                index = create_futures[future]
+                created[index] = future.result()
+                attach_futures[pool.submit(attach, created[index])] = index
+        for future in as_completed(attach_futures):
+            attached[attach_futures[future]] = future.result()
+
+    results = []
+    for created_batch, attached_batch in zip(created, attached):
+        for position, (issue, error) in enumerate(created_batch):
+            if issue and attached_batch[position][1]:
+                error = f'Created issue #{issue["number"]} but failed to add it to the project: {attached_batch[position][1]}'
+                issue = None
+            results.append((issue, error))
+    return results
+
+def main(pipelined=True, ordered=True, plan_only=False, attach_all=False, use_journal=True):
+    journal = None
+    try:
+        # Load milestones and tasks from YAML file
+        with open('milestones.yaml', 'r') as file:
+            data = yaml.safe_load(file)
+        MILESTONES = data['MILESTONES']
+
+        # Skip everything the journal says was already pushed with the same content
+        if use_journal and not plan_only:
+            journal = SyncJournal(f'{GITHUB_USERNAME}/{REPO_NAME}')
+            MILESTONES = pending_milestones(MILESTONES, journal)
+            readme_current = journal.is_current('readme', 'README.md', content_hash(README_CONTENT))
+            if readme_current and not MILESTONES and not attach_all:
+                print('Nothing changed since the last run.')
+                return
+
+        # Check if repository exists
+        repo_id = journal.remote_id('repository', REPO_NAME) if journal else None
+        if not repo_id:
+            repo_id = get_repository_id(GITHUB_USERNAME, REPO_NAME)
+            if repo_id:
+                print(f'Repository {REPO_NAME} already exists.')
+            elif plan_only:
+                print(f'Repository {REPO_NAME} does not exist yet. Everything would be created.')
+                return
+            else:
+                print(f'Creating repository {REPO_NAME}...')
+                repo_id = create_repository(REPO_NAME, REPO_DESCRIPTION, REPO_PRIVATE)
+                print('Repository created successfully.')
+            if journal:
+                journal.record('repository', REPO_NAME, content_hash(REPO_NAME), repo_id)
+
+        # Update README.md
+        if journal and readme_current:
+            print('README.md is unchanged. Skipping.')
+        elif not plan_only:
+            print('Updating README.md...')
+            update_readme(GITHUB_USERNAME, REPO_NAME, README_CONTENT)
+            print('README.md updated.')
+            if journal:
+                journal.record('readme', 'README.md', content_hash(README_CONTENT))
+
+        project_id = journal.remote_id('project', PROJECT_NAME) if journal else None
+        if not project_id:
+            # Get the authenticated user ID
+            user_id = get_user_id()
+            print(f'Authenticated user ID: {user_id}')
+            if plan_only:
+                project_id = get_project_id(user_id, PROJECT_NAME)
+            else:
+                project_id = ensure_project(user_id)
+                if journal:
+                    journal.record('project', PROJECT_NAME, content_hash(PROJECT_NAME), project_id)
+
+        if MILESTONES:
+            # Diff milestones.yaml against what already exists on GitHub
+            print('Fetching remote state...')
+            state = fetch_remote_state(GITHUB_USERNAME, REPO_NAME, project_id)
+            plan = build_plan(MILESTONES, state)
+            print('Plan:')
+            print_plan(plan)
+            if plan_only:
+                return
+
+            if journal:
+                record_in_sync(journal, plan, state, MILESTONES)
+            apply_plan(plan, state, MILESTONES, repo_id, project_id, pipelined=pipelined, ordered=ordered,
+                       journal=journal)
+
+        if attach_all:
+            # Also pick up issues that are not tracked in milestones.yaml
+            print('Adding remaining repository issues to project...')
+            for issue, item_id, error in attach_missing_issues(GITHUB_USERNAME, REPO_NAME, project_id):
+                if error:
+                    print(f'  Failed to add issue "{issue["title"]}" to project: {error}')
+                else:
+                    print(f'  Added issue "{issue["title"]}" to project.')
+
         print('Setup completed successfully.')
 
     except Exception as ex:
         print(f'An error occurred: {ex}')
+    finally:
+        if journal:
+            journal.close()
+        session.report()
+        tracing.finish()
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Set up the GitHub repository, milestones, issues and project.')
+    parser.add_argument('--sequential', action='store_true',
+                        help='Create issues first and attach them to the project afterwards.')
+    parser.add_argument('--unordered', action='store_true',
+                        help='Create issue batches concurrently; issue numbers no longer follow YAML order.')
+    parser.add_argument('--plan', action='store_true',
+                        help='Only print the changes that would be made.')
+    parser.add_argument('--attach-all', action='store_true',
+                        help='Also add repository issues that are not in milestones.yaml to the project.')
+    parser.add_argument('--no-journal', action='store_true',
+                        help=f'Ignore {JOURNAL_PATH} and compare everything against GitHub.')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Record spans and write them to FILE as Chrome trace-event JSON.')
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace)
+    main(pipelined=not args.sequential, ordered=not args.unordered, plan_only=args.plan,
+         attach_all=args.attach_all, use_journal=not args.no_journal)
 
@@ -0,0 +1,380 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import tracing
+
+STRINGS_FILE = 'graph-strings.npy'
+HEADER_FILE = 'graph-header.json'
+
+# Edge types, each stored as CSR adjacency in both directions:
+#   inherits   model -> parent model it copies (_inherit with its own _name, or an extra mixin)
+#   delegates  model -> parent model it embeds (_inherits)
+#   extends    module -> model it defines or extends
+#   defines    model or class -> its methods and fields
+#   calls      method or function -> method or function it calls (approximate)
+#   comodel    relational field -> the model it points to
+#   inverse    One2many field -> the Many2one field it mirrors
+#   computes   field -> its compute method
+#   located    node -> 'path:line' of each definition
+RELATIONS = ('inherits', 'delegates', 'extends', 'defines', 'calls', 'comodel', 'inverse', 'computes', 'located')
+
+# Every Odoo model implicitly inherits the methods of this one
+BASE_MODEL = 'base'
+
+def class_model(record):
+    """Return (model, parents) of a class record: the Odoo model it defines or extends and the
+    models it inherits from; (None, []) for a plain Python class."""
+    inherit = record.get('inherit')
+    inherit = [inherit] if isinstance(inherit, str) else [parent for parent in inherit or [] if isinstance(parent, str)]
+    model = record.get('model') if isinstance(record.get('model'), str) else None
+    model = model or (inherit[0] if inherit else None)
+    return model, [parent for parent in inherit if parent != model]
+
+def csr(sources, targets, count):
+    """Return (offsets, targets) of the de-duplicated edges sources[i] -> targets[i] over `count` nodes."""
+    edges = np.unique(np.stack([sources, targets], axis=1), axis=0) if len(sources) else np.empty((0, 2), np.int64)
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edges[:, 0], minlength=count), out=offsets[1:])
+    return offsets, edges[:, 1].astype(np.int32)
+
+class GraphBuilder:
+    """Resolves scanner records into interned nodes and typed edges.
+
+    Nodes are strings: 'model:sale.order', 'module:sale', 'field:sale.order.partner_id',
+    'method:sale.order._action_confirm' for methods of models (every override of a method in
+    any addon is the same node), 'method:path:Class.name' for methods of plain classes and
+    'function:path:name' for module-level functions.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.edges = defaultdict(list)
+
+    def node(self, name):
+        return self.ids.setdefault(name, len(self.ids))
+
+    def edge(self, relation, source, target):
+        if source != target:
+            self.edges[relation].append((self.node(source), self.node(target)))
+
+    def build(self, records):
+        classes = {}
+        methods, fields = [], []
+        for record in records:
+            if record['type'] == 'class':
+                classes[(record['path'], record['qualname'])] = record
+            elif record['type'] == 'method':
+                methods.append(record)
+            elif record['type'] == 'field':
+                fields.append(record)
+
+        # Models, their parents and the addons that touch them
+        owners = {}
+        parents = defaultdict(list)
+        for key, record in classes.items():
+            model, inherit = class_model(record)
+            owners[key] = f'model:{model}' if model else f'class:{record["path"]}:{record["qualname"]}'
+            if not model:
+                continue
+            self.node(f'model:{model}')
+            for parent in inherit:
+                self.edge('inherits', f'model:{model}', f'model:{parent}')
+                parents[model].append(parent)
+            if isinstance(record.get('inherits'), dict):
+                for parent in record['inherits']:
+                    self.edge('delegates', f'model:{model}', f'model:{parent}')
+            if record.get('module'):
+                self.edge('extends', f'module:{record["module"]}', f'model:{model}')
+            self.edge('located', f'model:{model}', f'{record["path"]}:{record["line"]}')
+
+        # Methods, named after their model so overrides in other addons share one node
+        defined = defaultdict(set)
+        functions = defaultdict(set)
+        method_nodes = []
+        for record in methods:
+            owner = owners.get((record['path'], record['class_name'])) if record['class_name'] else None
+            if record['class_name'] is None:
+                name = f'function:{record["path"]}:{record["name"]}'
+                functions[record['path']].add(record['name'])
+            elif owner is None:
+                continue
+            elif owner.startswith('model:'):
+                name = f'method:{owner[6:]}.{record["name"]}'
+                defined[owner[6:]].add(record['name'])
+                self.edge('defines', owner, name)
+            else:
+                name = f'method:{record["path"]}:{record["qualname"]}'
+                defined[owner].add(record['name'])
+                self.edge('defines', owner, name)
+            self.edge('located', name, f'{record["path"]}:{record["line"]}')
+            method_nodes.append((name, owner, record))
+
+        resolved = {}
+
+        def resolve(model, method, skip_self=False):
+            """Return the model whose `method` a call on `model` reaches, searching its parents breadth first."""
+            key = (model, method, skip_self)
+            if key not in resolved:
+                queue, seen, found = [model], {model}, None
+                while queue and found is None:
+                    current = queue.pop(0)
+                    if method in defined.get(current, ()) and not (skip_self and current == model):
+                        found = current
+                    for parent in parents.get(current, ()):
+                        if parent not in seen:
+                            seen.add(parent)
+                            queue.append(parent)
+                if found is None and model != BASE_MODEL and method in defined.get(BASE_MODEL, ()):
+                    found = BASE_MODEL
+                resolved[key] = found
+            return resolved[key]
+
+        for name, owner, record in method_nodes:
+            for call in record.get('calls') or ():
+                receiver, dot, method = call.rpartition('.')
+                if not dot:
+                    if method in functions.get(record['path'], ()):
+                        self.edge('calls', name, f'function:{record["path"]}:{method}')
+                    continue
+                if owner is None:
+                    continue
+                if owner.startswith('class:'):
+                    if receiver == 'self' and method in defined.get(owner, ()):
+                        self.edge('calls', name, f'method:{owner[6:]}.{method}')
+                    continue
+                model = receiver[4:-1] if receiver.startswith('env[') else owner[6:]
+                target = resolve(model, method, skip_self=receiver == 'super')
+                if target is None and receiver == 'super':
+                    # An override calling the previous definition of the same model
+                    target = resolve(model, method)
+                if target:
+                    self.edge('calls', name, f'method:{target}.{method}')
+
+        # Fields and the models they point to
+        for record in fields:
+            owner = owners.get((record['path'], record['class_name']))
+            if owner is None or not owner.startswith('model:'):
+                continue
+            model = owner[6:]
+            name = f'field:{model}.{record["name"]}'
+            self.edge('defines', owner, name)
+            self.edge('located', name, f'{record["path"]}:{record["line"]}')
+            if record.get('comodel'):
+                self.edge('comodel', name, f'model:{record["comodel"]}')
+                if record.get('inverse'):
+                    self.edge('inverse', name, f'field:{record["comodel"]}.{record["inverse"]}')
+            if record.get('compute'):
+                target = resolve(model, record['compute'])
+                if target:
+                    self.edge('computes', name, f'method:{target}.{record["compute"]}')
+        return self
+
+@tracing.traced('graph.build')
+def write_graph_index(path, builder):
+    """Write the interned strings and the CSR arrays of every relation into directory `path`.
+
+    Strings are sorted (UTF-8 bytes) so a name is found by binary search, and node ids are
+    positions in that list.
+    """
+    os.makedirs(path, exist_ok=True)
+    names = list(builder.ids)
+    strings = np.array([name.encode() for name in names], dtype='S') if names else np.empty(0, dtype='S1')
+    order = np.argsort(strings, kind='stable')
+    rank = np.empty(len(names), dtype=np.int64)
+    rank[order] = np.arange(len(names))
+    np.save(os.path.join(path, STRINGS_FILE), strings[order])
+    counts = {}
+    for relation in RELATIONS:
+        edges = rank[np.asarray(builder.edges.get(relation, []), dtype=np.int64).reshape(-1, 2)]
+        for direction, (sources, targets) in (('forward', (edges[:, 0], edges[:, 1])),
+                                              ('reverse', (edges[:, 1], edges[:, 0]))):
+            offsets, targets = csr(sources, targets, len(names))
+            np.save(os.path.join(path, f'graph-{relation}-{direction}-offsets.npy'), offsets)
+            np.save(os.path.join(path, f'graph-{relation}-{direction}-targets.npy'), targets)
+        counts[relation] = len(targets)
+    with open(os.path.join(path, HEADER_FILE), 'w') as file:
+        json.dump({'nodes': len(names), 'edges': counts}, file, indent=2)
+    return len(names), counts
+
+def build_graph_index(records, path):
+    """Build the graph index at `path` from the records of a record store."""
+    return write_graph_index(path, GraphBuilder().build(record for record_id, record in records.iter_records()))
+
+class GraphIndex:
+    """Memory-mapped graph of models, methods, fields and modules with closure queries."""
+
+    def __init__(self, path):
+        self.path = path
+        self.strings = np.load(os.path.join(path, STRINGS_FILE), mmap_mode='r')
+        self.adjacency = {}
+
+    def csr(self, relation, reverse=False):
+        key = (relation, reverse)
+        if key not in self.adjacency:
+            direction = 'reverse' if reverse else 'forward'
+            self.adjacency[key] = tuple(
+                np.load(os.path.join(self.path, f'graph-{relation}-{direction}-{part}.npy'), mmap_mode='r')
+                for part in ('offsets', 'targets'))
+        return self.adjacency[key]
+
+    def id(self, name):
+        key = name.encode()
+        position = int(np.searchsorted(self.strings, key))
+        if position < len(self.strings) and self.strings[position] == key:
+            return position
+        return None
+
+    def name(self, node):
+        return self.strings[node].decode()
+
+    def names(self, nodes):
+        return [name.decode() for name in self.strings[np.asarray(nodes, dtype=np.int64)].tolist()]
+
+    def edges(self, relations, nodes, reverse=False):
+        """Return (sources, targets) of every edge of `relations` leaving `nodes`."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        sources, targets = [], []
+        for relation in relations:
+            offsets, adjacent = self.csr(relation, reverse)
+            starts = offsets[nodes]
+            lengths = offsets[nodes + 1] - starts
+            total = int(lengths.sum())
+            if not total:
+                continue
+            # Gather every [start, end) slice at once: positions start_i + 0 .. length_i - 1
+            positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+            sources.append(np.repeat(nodes, lengths))
+            targets.append(np.asarray(adjacent[positions], dtype=np.int64))
+        if not sources:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(sources), np.concatenate(targets)
+
+    def neighbors(self, relations, nodes, reverse=False):
+        """Return the sorted, unique nodes one edge of any of `relations` away from `nodes`."""
+        return np.unique(self.edges(relations, nodes, reverse)[1])
+
+    def closure(self, relations, start, reverse=False, depth=None):
+        """Return (nodes, hops) of everything reachable from node `start` over `relations`.
+
+        The start node itself is not included; `depth` limits the number of hops.
+        """
+        hops = np.full(len(self.strings), -1, dtype=np.int32)
+        hops[start] = 0
+        frontier = np.array([start], dtype=np.int64)
+        level = 0
+        while len(frontier) and (depth is None or level < depth):
+            level += 1
+            frontier = self.neighbors(relations, frontier, reverse)
+            frontier = frontier[hops[frontier] < 0]
+            hops[frontier] = level
+        hops[start] = -1
+        nodes = np.flatnonzero(hops > 0)
+        return nodes, hops[nodes]
+
+    def require(self, name):
+        node = self.id(name)
+        if node is None:
+            raise KeyError(f'{name} is not in the graph.')
+        return node
+
+    def locations(self, node):
+        return self.names(self.neighbors(['located'], [node]))
+
+    @tracing.traced('graph.query')
+    def query(self, kind, name, depth=None):
+        """Answer one of QUERIES for a model ('sale.order') or method ('sale.order._action_confirm').
+
+        Returns [(node name, hops)], nearest first.
+        """
+        if kind not in QUERIES:
+            raise ValueError(f'Unknown query {kind!r}; expected one of {", ".join(QUERIES)}.')
+        prefix, relations, reverse = QUERIES[kind]
+        start = self.require(f'{prefix}:{name}')
+        if kind == 'dependents':
+            nodes, hops = self.model_dependents(start, depth)
+        else:
+            nodes, hops = self.closure(relations, start, reverse, depth)
+        # Node ids follow the sorted strings, so this orders by hops, then name
+        order = np.lexsort((nodes, hops))
+        return list(zip(self.names(nodes[order]), hops[order].tolist()))
+
+    def model_dependents(self, start, depth=None):
+        """Everything that depends on a model: models inheriting or embedding it (transitively),
+        fields pointing to it and their models, addons extending it, and the callers of its
+        methods."""
+        models, depths = self.closure(['inherits', 'delegates'], start, reverse=True, depth=depth)
+        hops = np.full(len(self.strings), np.iinfo(np.int32).max, dtype=np.int32)
+        hops[start] = 0
+        hops[models] = depths
+        models = np.append(start, models)
+        sources, fields = self.edges(['comodel'], models, reverse=True)
+        np.minimum.at(hops, fields, hops[sources] + 1)
+        sources, owners = self.edges(['defines'], fields, reverse=True)
+        np.minimum.at(hops, owners, hops[sources])
+        sources, modules = self.edges(['extends'], models, reverse=True)
+        np.minimum.at(hops, modules, hops[sources] + 1)
+        callers = self.neighbors(['calls'], self.neighbors(['defines'], [start]), reverse=True)
+        hops[callers] = np.minimum(hops[callers], 1)
+        hops[start] = 0
+        nodes = np.flatnonzero((hops > 0) & (hops < np.iinfo(np.int32).max))
+        return nodes, hops[nodes]
+
+# query: (node prefix, relations followed, against the edge direction)
+QUERIES = {
+    'ancestors': ('model', ['inherits', 'delegates'], False),
+    'descendants': ('model', ['inherits', 'delegates'], True),
+    'dependents': ('model', None, True),
+    'callers': ('method', ['calls'], True),
+    'callees': ('method', ['calls'], False),
+    'impact': ('method', ['calls', 'computes'], True),
+}
+
+def default_graph_path(index_path):
+    return os.path.splitext(index_path)[0] + '.graph'
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the inheritance, call and relation graph.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='Build the graph from an index.')
+    build.add_argument('index', help='Path of the index file written by index_update.')
+    build.add_argument('--output', help='Graph directory (default: next to the index).')
+    query = subparsers.add_parser('query', help='Run a closure query.')
+    query.add_argument('index', help='Path of the index file written by index_update.')
+    query.add_argument('query', choices=QUERIES, help='What to compute.')
+    query.add_argument('name', help="Model ('sale.order') or method ('sale.order._action_confirm').")
+    query.add_argument('--depth', type=int, default=None, help='Maximum number of hops.')
+    query.add_argument('--graph', help='Graph directory (default: next to the index).')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from code_index import RecordStore
+        records = RecordStore(args.index)
+        start = time.perf_counter()
+        try:
+            nodes, edges = build_graph_index(records, args.output or default_graph_path(args.index))
+        finally:
+            records.close()
+        print(f'Wrote {nodes} nodes and {sum(edges.values())} edges in {time.perf_counter() - start:.2f}s: '
+              + ', '.join(f'{count} {relation}' for relation, count in edges.items()), file=sys.stderr)
+        return
+
+    start = time.perf_counter()
+    graph = GraphIndex(args.graph or default_graph_path(args.index))
+    try:
+        results = graph.query(args.query, args.name, args.depth)
+    except KeyError as error:
+        sys.exit(error.args[0])
+    elapsed = time.perf_counter() - start
+    for name, hops in results:
+        node = graph.id(name)
+        print(f"{hops}  {name}  {' '.join(graph.locations(node))}")
+    print(f'{len(results)} results in {elapsed * 1000:.1f}ms', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
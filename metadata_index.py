@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from odoo_xml import ModelLookup, class_model, qualify
+
+TERMS_FILE = 'metadata-terms.json'
+OFFSETS_FILE = 'metadata-offsets.npy'
+POSTINGS_FILE = 'metadata-postings.npy'
+
+# Filterable fields; a chunk can have several values per field
+FIELDS = ('module', 'model', 'inherit', 'decorator', 'language', 'kind', 'path')
+
+def normalize_value(field, value):
+    if field == 'decorator':
+        return value.lstrip('@').split('(', 1)[0]
+    if field == 'path':
+        return value.strip('/')
+    return value
+
+def path_prefixes(path):
+    """Yield 'a', 'a/b' and 'a/b/c.py' for the path 'a/b/c.py'."""
+    parts = path.split('/')
+    for end in range(1, len(parts) + 1):
+        yield '/'.join(parts[:end])
+
+def check_filters(filters):
+    """Return `filters` with each field mapped to a list of values, leaving out fields without values.
+
+    Raises ValueError for an unknown field or a value that is not a non-empty string.
+    """
+    checked = {}
+    for field, values in filters.items():
+        if field not in FIELDS:
+            raise ValueError(f'Unknown filter field {field!r}; expected one of {", ".join(FIELDS)}.')
+        values = [values] if isinstance(values, str) else values
+        if not isinstance(values, (list, tuple)) or not all(isinstance(value, str) and value for value in values):
+            raise ValueError(f'Values of filter {field!r} must be non-empty strings.')
+        if values:
+            checked[field] = list(values)
+    return checked
+
+def intersect(first, second):
+    """Intersection of two sorted arrays, probing the larger with the smaller one."""
+    if len(first) > len(second):
+        first, second = second, first
+    if not len(first):
+        return first
+    positions = np.minimum(np.searchsorted(second, first), len(second) - 1)
+    return first[second[positions] == first]
+
+class MetadataCollector:
+    """Resolves the metadata of chunk records from the other records of a record store.
+
+    Python chunks get their model, inherited models and decorators from the class and method
+    records of the same file; XML chunks get the model of the data record they hold.
+    """
+
+    def __init__(self, records):
+        self.classes = {}
+        self.decorators = defaultdict(set)
+        self.xml_models = defaultdict(set)
+        lookup = ModelLookup()
+        xml_records = []
+        for record in records:
+            if record['type'] == 'class':
+                self.classes[(record['path'], record['qualname'])] = record
+                lookup.add(record)
+            elif record['type'] == 'method' and record['decorators']:
+                names = {normalize_value('decorator', decorator) for decorator in record['decorators']}
+                self.decorators[(record['path'], record['qualname'])].update(names)
+                if record['class_name']:
+                    self.decorators[(record['path'], record['class_name'])].update(names)
+            elif record['type'] in ('view', 'action', 'rule', 'access', 'xml_id'):
+                xml_records.append(record)
+        # Data records name their model directly or through an ir.model reference
+        for record in xml_records:
+            lookup.join(record)
+            if record.get('model'):
+                self.xml_models[(record['path'], record['xml_id'])].add(record['model'])
+
+    def class_terms(self, path, qualname):
+        record = self.classes.get((path, qualname))
+        if record is None:
+            return
+        inherit = record.get('inherit')
+        inherit = [inherit] if isinstance(inherit, str) else inherit if isinstance(inherit, list) else []
+        model = class_model(record)
+        if model:
+            yield 'model', model
+        for parent in inherit:
+            yield 'inherit', parent
+        if isinstance(record.get('inherits'), dict):
+            for parent in record['inherits']:
+                yield 'inherit', parent
+
+    def terms(self, chunk):
+        """Yield the (field, value) pairs of a chunk record."""
+        path = chunk['path']
+        for field in ('module', 'language', 'kind'):
+            if chunk.get(field):
+                yield field, chunk[field]
+        for prefix in path_prefixes(path):
+            yield 'path', prefix
+        if chunk['kind'] == 'class':
+            qualname = chunk['name']
+        elif chunk['kind'] in ('method', 'fields'):
+            qualname = chunk.get('class_name')
+        else:
+            qualname = None
+        if qualname:
+            yield from self.class_terms(path, qualname)
+        # A class chunk carries its methods' decorators only when it holds the whole class
+        whole_class = chunk['kind'] == 'class' and chunk['end_line'] >= self.classes.get(
+            (path, chunk['name']), {}).get('end_line', chunk['end_line'])
+        if chunk['kind'] in ('method', 'function') or whole_class:
+            for decorator in self.decorators.get((path, chunk['name']), ()):
+                yield 'decorator', decorator
+        if chunk['kind'] == 'xml_record':
+            for model in self.xml_models.get((path, qualify(chunk['name'], chunk.get('module'))), ()):
+                yield 'model', model
+
+def write_metadata_index(path, postings):
+    """Write {term: row numbers} as a sorted term list plus CSR offsets and postings arrays."""
+    terms = sorted(postings)
+    lists = [np.unique(np.asarray(postings[term], dtype=np.int64)) for term in terms]
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(rows) for rows in lists], out=offsets[1:])
+    rows = np.concatenate(lists) if lists else np.empty(0, dtype=np.int64)
+    dtype = np.int32 if not len(rows) or rows.max() < 2**31 else np.int64
+    np.save(os.path.join(path, POSTINGS_FILE), rows.astype(dtype))
+    np.save(os.path.join(path, OFFSETS_FILE), offsets)
+    with open(os.path.join(path, TERMS_FILE), 'w') as file:
+        json.dump(terms, file)
+
+def build_metadata_index(records, store):
+    """Build the metadata index of vector store `store` from the records of a record store.
+
+    Every row of the store is a unique chunk text; it gets the terms of all chunk records with
+    that hash, so a deduplicated chunk matches every module it occurs in. Returns the number
+    of terms.
+    """
+    row_of_hash = {digest.decode(): row for row, digest in enumerate(store.ids)}
+    collector = MetadataCollector(record for record_id, record in records.iter_records())
+    postings = defaultdict(list)
+    for record_id, chunk in records.iter_records(record_type='chunk'):
+        row = row_of_hash.get(chunk['hash'])
+        if row is None:
+            continue
+        for field, value in collector.terms(chunk):
+            postings[f'{field}:{value}'].append(row)
+    write_metadata_index(store.path, postings)
+    return len(postings)
+
+class MetadataIndex:
+    """Inverted index from metadata terms to sorted row numbers of a vector store."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, TERMS_FILE)) as file:
+            self.terms = {term: position for position, term in enumerate(json.load(file))}
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE))
+        self.postings = np.load(os.path.join(path, POSTINGS_FILE), mmap_mode='r')
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(os.path.join(path, TERMS_FILE))
+
+    def posting(self, field, value):
+        position = self.terms.get(f'{field}:{normalize_value(field, value)}')
+        if position is None:
+            return np.empty(0, dtype=np.int64)
+        return np.asarray(self.postings[self.offsets[position]:self.offsets[position + 1]], dtype=np.int64)
+
+    def rows(self, filters):
+        """Return the sorted rows matching `filters`, or None when there is nothing to filter on.
+
+        `filters` maps a field to a value or a list of values. Values of one field are OR-ed,
+        fields are AND-ed; the shortest lists are intersected first. A field with an empty list
+        of values does not filter.
+        """
+        lists = []
+        for field, values in check_filters(filters).items():
+            postings = [self.posting(field, value) for value in values]
+            lists.append(postings[0] if len(postings) == 1 else np.unique(np.concatenate(postings)))
+        if not lists:
+            return None
+        lists.sort(key=len)
+        rows = lists[0]
+        for posting in lists[1:]:
+            if not len(rows):
+                break
+            rows = intersect(rows, posting)
+        return rows
+
+    def remap(self, path, order):
+        """Write this index for a copy of the store whose row i is old row order[i]."""
+        new_row = np.empty(len(order), dtype=np.int64)
+        new_row[order] = np.arange(len(order))
+        postings = {term: new_row[np.asarray(self.postings[self.offsets[position]:self.offsets[position + 1]])]
+                    for term, position in self.terms.items()}
+        write_metadata_index(path, postings)
+
+def record_matches(record, filters):
+    """Check the fields a single chunk record carries itself (module, language, kind, path).
+
+    A deduplicated row can occur in several places; this picks the occurrences in scope.
+    """
+    for field, values in filters.items():
+        values = [normalize_value(field, value) for value in ([values] if isinstance(values, str) else values)]
+        if not values:
+            continue
+        if field == 'path':
+            if not any(record['path'] == value or record['path'].startswith(value + '/') for value in values):
+                return False
+        elif field in ('module', 'language', 'kind') and record.get(field) not in values:
+            return False
+    return True
+
+def parse_filters(arguments):
+    """Turn ['module=sale', 'module=crm', 'decorator=api.depends'] into a filters dict."""
+    filters = defaultdict(list)
+    for argument in arguments or []:
+        field, separator, value = argument.partition('=')
+        if not separator:
+            raise ValueError(f'Filters look like field=value, got {argument!r}.')
+        filters[field].append(value)
+    return check_filters(filters)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the metadata filter index of a vector store.')
+    parser.add_argument('index', help='Path of the index file written by index_update.')
+    parser.add_argument('store', help='Vector store directory (see vector_store.py build).')
+    args = parser.parse_args()
+
+    from code_index import RecordStore
+    from vector_store import VectorStore
+    records = RecordStore(args.index)
+    start = time.perf_counter()
+    try:
+        terms = build_metadata_index(records, VectorStore(args.store))
+    finally:
+        records.close()
+    print(f'Indexed {terms} metadata terms in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+import argparse
+import ast
+import csv
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from multiprocessing import Pool
+
+from odoo_xml import iter_data_records
+
+# File types that get a file record; Python, XML and CSV files are also parsed
+LANGUAGES = {
+    '.py': 'python',
+    '.xml': 'xml',
+    '.csv': 'csv',
+    '.js': 'javascript',
+    '.scss': 'scss',
+    '.css': 'css',
+}
+
+SKIP_DIRECTORIES = {'.git', '__pycache__', 'node_modules', '.tox', '.venv'}
+
+# Odoo class attributes copied onto class records, and the keys they are stored under
+ODOO_CLASS_ATTRIBUTES = {
+    '_name': 'model',
+    '_inherit': 'inherit',
+    '_inherits': 'inherits',
+    '_description': 'description',
+    '_table': 'table',
+    '_order': 'order',
+    '_rec_name': 'rec_name',
+}
+
+def iter_source_files(root):
+    """Yield (relative path, addon name) for every source file below `root`.
+
+    The addon is the nearest enclosing directory that holds a __manifest__.py.
+    Directories are walked with scandir so the tree is never listed in full.
+    """
+    stack = [(root, None)]
+    while stack:
+        directory, addon = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        if any(entry.name == '__manifest__.py' for entry in entries):
+            addon = os.path.basename(directory)
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in SKIP_DIRECTORIES:
+                    subdirectories.append((entry.path, addon))
+            elif os.path.splitext(entry.name)[1] in LANGUAGES:
+                yield os.path.relpath(entry.path, root), addon
+        stack.extend(reversed(subdirectories))
+
+def literal(node):
+    """Return the Python value of a literal expression, or its source when it is not a literal."""
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return ast.unparse(node)
+
+def function_arguments(node):
+    arguments = node.args
+    names = [arg.arg for arg in arguments.posonlyargs + arguments.args]
+    if arguments.vararg:
+        names.append('*' + arguments.vararg.arg)
+    names.extend(arg.arg for arg in arguments.kwonlyargs)
+    if arguments.kwarg:
+        names.append('**' + arguments.kwarg.arg)
+    return names
+
+# Statement-list fields of compound statements; imports can only appear inside these
+STATEMENT_FIELDS = ('body', 'orelse', 'finalbody', 'handlers', 'cases')
+
+# Field types whose first argument is a comodel, and the keyword it can be given as instead
+RELATIONAL_FIELDS = {'Many2one', 'One2many', 'Many2many'}
+
+# Recordset methods that return (a variant of) the same recordset, so `self.sudo().foo()`
+# still calls a method of the current model
+RECORDSET_WRAPPERS = {'sudo', 'with_context', 'with_company', 'with_user', 'with_env', 'with_prefetch',
+                      'filtered', 'filtered_domain', 'sorted', 'exists', 'browse', 'ensure_one'}
+
+def keyword_value(node, name):
+    for keyword in node.keywords:
+        if keyword.arg == name:
+            return keyword.value
+    return None
+
+def string_argument(node, position, name):
+    """Return a call argument given by position (None for keyword only) or keyword when it is a string literal."""
+    value = node.args[position] if position is not None and len(node.args) > position else keyword_value(node, name)
+    return value.value if isinstance(value, ast.Constant) and isinstance(value.value, str) else None
+
+def field_record(statement, base, class_name):
+    """Return a field record for `name = fields.Type(...)`, or None for any other statement."""
+    if not (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+            and isinstance(statement.targets[0], ast.Name) and isinstance(statement.value, ast.Call)):
+        return None
+    function = statement.value.func
+    if not (isinstance(function, ast.Attribute) and isinstance(function.value, ast.Name)
+            and function.value.id == 'fields'):
+        return None
+    call = statement.value
+    relational = function.attr in RELATIONAL_FIELDS
+    return dict(base, type='field', name=statement.targets[0].id, field_type=function.attr, class_name=class_name,
+                comodel=string_argument(call, 0, 'comodel_name') if relational else None,
+                inverse=string_argument(call, 1, 'inverse_name') if function.attr == 'One2many' else None,
+                related=string_argument(call, None, 'related'), compute=string_argument(call, None, 'compute'),
+                line=statement.lineno)
+
+def call_receiver(node, aliases):
+    """Classify the receiver of a method call: 'self', 'super', 'env[model]' or None."""
+    while (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+           and node.func.attr in RECORDSET_WRAPPERS):
+        node = node.func.value
+    if isinstance(node, ast.Name) and node.id in aliases:
+        return 'self'
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'super':
+        return 'super'
+    if (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Attribute) and node.value.attr == 'env'
+            and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str)):
+        return f'env[{node.slice.value}]'
+    return None
+
+def method_calls(node):
+    """Return the calls a function makes that can be resolved statically, approximately.
+
+    Calls look like 'self.name', 'super.name', 'env[model].name' or a bare function 'name'.
+    Loop variables over self (`for order in self:`) count as self.
+    """
+    aliases = {'self', 'cls'}
+    calls = {}
+    for child in ast.walk(node):
+        if isinstance(child, ast.For) and isinstance(child.target, ast.Name) and call_receiver(child.iter, aliases):
+            aliases.add(child.target.id)
+        elif isinstance(child, ast.Call):
+            if isinstance(child.func, ast.Attribute):
+                receiver = call_receiver(child.func.value, aliases)
+                if receiver and child.func.attr not in RECORDSET_WRAPPERS:
+                    calls[f'{receiver}.{child.func.attr}'] = None
+            elif isinstance(child.func, ast.Name):
+                calls[child.func.id] = None
+    return list(calls)
+
+def python_records(tree, base):
+    """Yield import, class, inheritance, field, method and decorator records for a parsed module.
+
+    Only statement lists are walked, never expressions, which keeps the walk a fraction of
+    the size of ast.walk().
+    """
+    def visit(body, class_name, in_function):
+        for node in body:
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    yield dict(base, type='import', name=alias.name, names=[], alias=alias.asname, line=node.lineno)
+            elif isinstance(node, ast.ImportFrom):
+                yield dict(base, type='import', name='.' * node.level + (node.module or ''),
+                           names=[alias.name for alias in node.names], alias=None, line=node.lineno)
+            elif isinstance(node, ast.ClassDef) and not in_function:
+                yield from class_records(node, class_name)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and not in_function:
+                qualname = f'{class_name}.{node.name}' if class_name else node.name
+                yield dict(base, type='method', name=node.name, qualname=qualname, class_name=class_name,
+                           arguments=function_arguments(node),
+                           returns=ast.unparse(node.returns) if node.returns else None,
+                           decorators=[ast.unparse(d) for d in node.decorator_list],
+                           is_async=isinstance(node, ast.AsyncFunctionDef), calls=method_calls(node),
+                           line=node.lineno, end_line=node.end_lineno, docstring=ast.get_docstring(node))
+                yield from decorators(node, class_name, qualname)
+                yield from visit(node.body, class_name, True)
+            else:
+                for field in STATEMENT_FIELDS:
+                    statements = getattr(node, field, None)
+                    if statements:
+                        yield from visit(statements, class_name, in_function)
+
+    def class_records(node, class_name):
+        qualname = f'{class_name}.{node.name}' if class_name else node.name
+        record = dict(base, type='class', name=node.name, qualname=qualname,
+                      bases=[ast.unparse(b) for b in node.bases],
+                      decorators=[ast.unparse(d) for d in node.decorator_list],
+                      line=node.lineno, end_line=node.end_lineno, docstring=ast.get_docstring(node))
+        for statement in node.body:
+            if (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+                    and isinstance(statement.targets[0], ast.Name)
+                    and statement.targets[0].id in ODOO_CLASS_ATTRIBUTES):
+                record[ODOO_CLASS_ATTRIBUTES[statement.targets[0].id]] = literal(statement.value)
+        yield record
+        for statement in node.body:
+            field = field_record(statement, base, qualname)
+            if field:
+                yield field
+
+        for base_class in record['bases']:
+            yield dict(base, type='inheritance', kind='python', class_name=qualname, parent=base_class,
+                       line=node.lineno)
+        inherit = record.get('inherit')
+        for parent in [inherit] if isinstance(inherit, str) else inherit or []:
+            yield dict(base, type='inheritance', kind='_inherit', class_name=qualname, parent=parent,
+                       model=record.get('model') or parent, line=node.lineno)
+        inherits = record.get('inherits')
+        if isinstance(inherits, dict):
+            for parent, field in inherits.items():
+                yield dict(base, type='inheritance', kind='_inherits', class_name=qualname, parent=parent,
+                           field=field, model=record.get('model'), line=node.lineno)
+        yield from decorators(node, qualname, None)
+        yield from visit(node.body, qualname, False)
+
+    def decorators(node, class_name, function_name):
+        for decorator in node.decorator_list:
+            target = decorator.func if isinstance(decorator, ast.Call) else decorator
+            yield dict(base, type='decorator', name=ast.unparse(target), expression=ast.unparse(decorator),
+                       class_name=class_name, function=function_name, line=decorator.lineno)
+
+    yield from visit(tree.body, None, False)
+
+def count_lines(file):
+    """Return (size, lines) of a binary file object, reading it in fixed-size blocks."""
+    size = lines = 0
+    last = b'\n'
+    for block in iter(lambda: file.read(1 << 20), b''):
+        size += len(block)
+        lines += block.count(b'\n')
+        last = block[-1:]
+    return size, lines + (last != b'\n')
+
+# Data files are streamed rather than read whole; l10n data can run to tens of megabytes
+DATA_LANGUAGES = ('xml', 'csv')
+
+def scan_file(job):
+    """Scan one file and return its records. `job` is (root, relative path, addon)."""
+    root, path, addon = job
+    language = LANGUAGES[os.path.splitext(path)[1]]
+    base = {'path': path, 'module': addon}
+    try:
+        with open(os.path.join(root, path), 'rb') as file:
+            if language in DATA_LANGUAGES:
+                size, loc = count_lines(file)
+            else:
+                source = file.read()
+                size = len(source)
+                loc = source.count(b'\n') + (1 if source and not source.endswith(b'\n') else 0)
+    except OSError as e:
+        return [dict(base, type='file', name=os.path.basename(path), language=language, error=str(e))]
+    file_record = dict(base, type='file', name=os.path.basename(path), language=language, size=size, loc=loc)
+    if language in DATA_LANGUAGES:
+        try:
+            return [file_record, *iter_data_records(root, path, addon)]
+        except (ET.ParseError, csv.Error, UnicodeDecodeError) as e:
+            file_record['error'] = f'{type(e).__name__}: {e}'
+            return [file_record]
+    if language != 'python':
+        return [file_record]
+    try:
+        tree = ast.parse(source, filename=path)
+    except (SyntaxError, ValueError) as e:
+        file_record['error'] = f'{type(e).__name__}: {e}'
+        return [file_record]
+    return [file_record, *python_records(tree, base)]
+
+def scan_file_jsonl(job):
+    """Scan one file and return its records as JSON lines, so encoding happens in the workers."""
+    records = scan_file(job)
+    return len(records), ''.join(json.dumps(record, default=str) + '\n' for record in records)
+
+def addon_for_path(root, path):
+    """Return the addon owning `path` (relative to `root`), looking for __manifest__.py upwards."""
+    directory = os.path.dirname(path)
+    while directory:
+        if os.path.exists(os.path.join(root, directory, '__manifest__.py')):
+            return os.path.basename(directory)
+        directory = os.path.dirname(directory)
+    return None
+
+# Below this many files the process pool costs more than it saves
+POOL_THRESHOLD = 32
+
+def iter_scanned_files(root, paths=None, workers=None, chunksize=32, scan=scan_file):
+    """Yield the record list of each scanned file, for every source file or only `paths`.
+
+    `scan` is the per-file function run in the workers; it must be picklable.
+    """
+    if paths is None:
+        jobs = ((root, path, addon) for path, addon in iter_source_files(root))
+    else:
+        paths = [path for path in paths if os.path.splitext(path)[1] in LANGUAGES]
+        jobs = [(root, path, addon_for_path(root, path)) for path in paths]
+        if len(jobs) < POOL_THRESHOLD:
+            yield from map(scan, jobs)
+            return
+    with Pool(workers) as pool:
+        yield from pool.imap_unordered(scan, jobs, chunksize=chunksize)
+
+def iter_records(root, workers=None, chunksize=32):
+    """Yield the records of every source file below `root`, scanning files on a process pool."""
+    for records in iter_scanned_files(root, workers=workers, chunksize=chunksize):
+        yield from records
+
+def scan_to_jsonl(root, output, workers=None, chunksize=32):
+    """Scan `root` and write its records to the `output` file object. Returns (files, records)."""
+    jobs = ((root, path, addon) for path, addon in iter_source_files(root))
+    files = records = 0
+    with Pool(workers) as pool:
+        for count, lines in pool.imap_unordered(scan_file_jsonl, jobs, chunksize=chunksize):
+            files += 1
+            records += count
+            output.write(lines)
+    return files, records
+
+def main():
+    parser = argparse.ArgumentParser(description='Scan an Odoo checkout and emit metadata records as JSON lines.')
+    parser.add_argument('root', help='Path to the Odoo checkout or addons directory.')
+    parser.add_argument('-o', '--output', default='-', help="Output file, or '-' for stdout.")
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: CPU count).')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.output == '-':
+        files, records = scan_to_jsonl(args.root, sys.stdout, args.workers)
+    else:
+        with open(args.output, 'w') as output:
+            files, records = scan_to_jsonl(args.root, output, args.workers)
+    seconds = time.perf_counter() - start
+    print(f'Scanned {files} files, {records} records in {seconds:.2f}s ({files / seconds:.0f} files/s)',
+          file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+
+# Elements directly below <odoo>/<openerp>/<data> that define records
+RECORD_TAGS = {'record', 'template', 'menuitem', 'act_window', 'report', 'function', 'delete'}
+
+CONTAINER_TAGS = {'odoo', 'openerp', 'data'}
+
+def class_model(record):
+    """Return the model a scanned Python class defines or extends, or None when it is unclear.
+
+    That is its `_name`, or else its only `_inherit` model, given as a string or a one-element list.
+    """
+    model = record.get('model')
+    if isinstance(model, str):
+        return model
+    inherit = record.get('inherit')
+    if isinstance(inherit, list) and len(inherit) == 1:
+        inherit = inherit[0]
+    return inherit if isinstance(inherit, str) else None
+
+class ModelLookup:
+    """Precomputed model name lookups, built once from the scanner's Python class records.
+
+    `classes` maps a model name to the classes that define or extend it; `external_ids` maps
+    the ir.model XML IDs Odoo generates (model_sale_order) back to model names.
+    """
+
+    def __init__(self):
+        self.classes = defaultdict(list)
+        self.external_ids = {}
+
+    @classmethod
+    def from_records(cls, records):
+        lookup = cls()
+        for record in records:
+            lookup.add(record)
+        return lookup
+
+    def add(self, record):
+        if record.get('type') != 'class':
+            return
+        model = class_model(record)
+        if model is None:
+            return
+        self.classes[model].append(f"{record['path']}:{record['qualname']}")
+        self.external_ids['model_' + model.replace('.', '_')] = model
+
+    def resolve_ref(self, ref):
+        """Return the model name for an ir.model reference such as 'sale.model_sale_order'."""
+        if not ref:
+            return None
+        return self.external_ids.get(ref.rsplit('.', 1)[-1])
+
+    def join(self, record):
+        """Fill in `model` from `model_ref` where needed and attach the defining Python classes."""
+        if not record.get('model') and record.get('model_ref'):
+            record['model'] = self.resolve_ref(record['model_ref'])
+        model = record.get('model')
+        record['python_classes'] = self.classes.get(model, []) if model else []
+        return record
+
+def qualify(xml_id, addon):
+    """Return the fully qualified XML ID (module.name)."""
+    if not xml_id or '.' in xml_id or not addon:
+        return xml_id
+    return f'{addon}.{xml_id}'
+
+def field_values(element):
+    """Return {field name: value} for the <field> children of a <record>."""
+    values = {}
+    for field in element.findall('field'):
+        name = field.get('name')
+        if field.get('ref') is not None:
+            values[name] = {'ref': field.get('ref')}
+        elif field.get('eval') is not None:
+            values[name] = {'eval': field.get('eval')}
+        elif len(field):
+            values[name] = {'tag': field[0].tag}
+        else:
+            values[name] = (field.text or '').strip()
+    return values
+
+def ref_value(value):
+    return value.get('ref') if isinstance(value, dict) else None
+
+def text_value(value):
+    return value if isinstance(value, str) else None
+
+def element_records(element, base, addon):
+    """Yield the records described by one top-level data element."""
+    tag = element.tag
+    xml_id = qualify(element.get('id'), addon)
+
+    if tag == 'record':
+        model = element.get('model')
+        values = field_values(element)
+        yield dict(base, type='xml_id', xml_id=xml_id, model=model)
+        if model == 'ir.ui.view':
+            arch = values.get('arch')
+            yield dict(base, type='view', xml_id=xml_id, name=text_value(values.get('name')),
+                       model=text_value(values.get('model')),
+                       view_type=arch.get('tag') if isinstance(arch, dict) else text_value(values.get('type')),
+                       inherit_id=qualify(ref_value(values.get('inherit_id')), addon),
+                       priority=text_value(values.get('priority')), mode=text_value(values.get('mode')))
+        elif model and model.startswith('ir.actions.'):
+            yield dict(base, type='action', xml_id=xml_id, action_type=model, name=text_value(values.get('name')),
+                       model=text_value(values.get('res_model')) or text_value(values.get('model')),
+                       model_ref=ref_value(values.get('model_id')) or ref_value(values.get('binding_model_id')),
+                       view_mode=text_value(values.get('view_mode')),
+                       state=text_value(values.get('state')))
+        elif model == 'ir.rule':
+            groups = values.get('groups')
+            yield dict(base, type='rule', xml_id=xml_id, name=text_value(values.get('name')),
+                       model_ref=ref_value(values.get('model_id')),
+                       domain=text_value(values.get('domain_force')),
+                       groups=groups.get('eval') if isinstance(groups, dict) else None,
+                       global_rule=values.get('global', {}).get('eval') if isinstance(values.get('global'), dict) else None,
+                       perms={perm: values[perm].get('eval') for perm in
+                              ('perm_read', 'perm_write', 'perm_create', 'perm_unlink')
+                              if isinstance(values.get(perm), dict)})
+        elif model == 'ir.cron':
+            yield dict(base, type='action', xml_id=xml_id, action_type=model, name=text_value(values.get('name')),
+                       model_ref=ref_value(values.get('model_id')), code=text_value(values.get('code')),
+                       interval=text_value(values.get('interval_type')))
+
+    elif tag == 'template':
+        yield dict(base, type='xml_id', xml_id=xml_id, model='ir.ui.view')
+        yield dict(base, type='view', xml_id=xml_id, name=element.get('name'), model=None, view_type='qweb',
+                   inherit_id=qualify(element.get('inherit_id'), addon), priority=element.get('priority'),
+                   mode='primary' if element.get('primary') else None)
+
+    elif tag == 'menuitem':
+        yield dict(base, type='xml_id', xml_id=xml_id, model='ir.ui.menu')
+        yield dict(base, type='menu', xml_id=xml_id, name=element.get('name'),
+                   parent=qualify(element.get('parent'), addon), action=qualify(element.get('action'), addon),
+                   groups=element.get('groups'))
+        # Nested menuitems inherit their parent from the enclosing element
+        for child in element.findall('menuitem'):
+            child.set('parent', child.get('parent') or element.get('id'))
+            yield from element_records(child, base, addon)
+
+    elif tag in ('act_window', 'report'):
+        action_type = 'ir.actions.act_window' if tag == 'act_window' else 'ir.actions.report'
+        yield dict(base, type='xml_id', xml_id=xml_id, model=action_type)
+        yield dict(base, type='action', xml_id=xml_id, action_type=action_type,
+                   name=element.get('name') or element.get('string'),
+                   model=element.get('res_model') or element.get('model'), view_mode=element.get('view_mode'))
+
+def iter_xml_records(root, path, addon):
+    """Stream the records of one Odoo data XML file.
+
+    The file is read with iterparse; every top-level data element is turned into records as
+    soon as it is complete and then removed from the tree, so memory does not grow with the
+    size of the file.
+    """
+    base = {'path': path, 'module': addon}
+    stack = []
+    for event, element in ET.iterparse(os.path.join(root, path), events=('start', 'end')):
+        if event == 'start':
+            stack.append(element)
+            continue
+        stack.pop()
+        if not stack or stack[-1].tag not in CONTAINER_TAGS:
+            continue
+        if element.tag in RECORD_TAGS:
+            yield from element_records(element, base, addon)
+        # Finished children of <odoo>/<data> are dropped, records or not
+        stack[-1].remove(element)
+
+def iter_csv_records(root, path, addon):
+    """Stream the rows of an Odoo data CSV file.
+
+    ir.model.access.csv rows become access records; any other CSV is named after the model it
+    loads and its rows become XML ID records.
+    """
+    base = {'path': path, 'module': addon}
+    model = os.path.splitext(os.path.basename(path))[0]
+    with open(os.path.join(root, path), newline='', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            xml_id = qualify(row.get('id'), addon)
+            if model == 'ir.model.access':
+                yield dict(base, type='access', xml_id=xml_id, name=row.get('name'),
+                           model_ref=row.get('model_id:id') or row.get('model_id/id'),
+                           group=qualify(row.get('group_id:id') or row.get('group_id/id'), addon) or None,
+                           perms={perm: row.get(perm) == '1' for perm in
+                                  ('perm_read', 'perm_write', 'perm_create', 'perm_unlink')})
+            elif xml_id:
+                yield dict(base, type='xml_id', xml_id=xml_id, model=model)
+
+def iter_data_records(root, path, addon):
+    """Stream the records of an XML or CSV data file."""
+    if path.endswith('.xml'):
+        yield from iter_xml_records(root, path, addon)
+    elif path.endswith('.csv'):
+        yield from iter_csv_records(root, path, addon)
+
+def iter_joined_records(root, scan_records, workers=None):
+    """Yield the XML/CSV records of `root`, joined onto the Python classes from `scan_records`.
+
+    `scan_records` is an iterable of scanner records (for instance a JSON lines scan); only its
+    class records are used, to build the lookup table once.
+    """
+    from odoo_scanner import iter_scanned_files
+    lookup = ModelLookup.from_records(scan_records)
+    for records in iter_scanned_files(root, workers=workers):
+        for record in records:
+            if record['type'] in ('xml_id', 'view', 'action', 'rule', 'menu', 'access'):
+                yield lookup.join(record)
+
+def read_jsonl(path):
+    with open(path) as file:
+        for line in file:
+            yield json.loads(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract views, actions, XML IDs and security rules from Odoo data files.')
+    parser.add_argument('root', help='Path to the Odoo checkout or addons directory.')
+    parser.add_argument('--scan', help='JSON lines output of odoo_scanner.py, used to join records onto models.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: CPU count).')
+    args = parser.parse_args()
+
+    if args.scan:
+        scan_records = read_jsonl(args.scan)
+    else:
+        from odoo_scanner import iter_records
+        scan_records = iter_records(args.root, workers=args.workers)
+    for record in iter_joined_records(args.root, scan_records, workers=args.workers):
+        sys.stdout.write(json.dumps(record) + '\n')
+
+if __name__ == '__main__':
+    main()
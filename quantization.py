@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import tracing
+from vector_store import HEADER_FILE, VectorStore, top_k
+
+CODES_FILE = 'codes.npy'
+CODEBOOK_FILE = 'codebook.npz'
+
+CODECS = ('int8', 'pq')
+
+# Candidates per query that ADC hands to the float re-rank
+DEFAULT_RERANK = int(os.getenv('QUANTIZATION_RERANK', '100'))
+
+def kmeans_l2(sample, clusters, iterations, rng):
+    """Plain (Euclidean) k-means; returns (clusters, dimension) float32 centroids."""
+    centroids = sample[rng.choice(len(sample), clusters, replace=len(sample) < clusters)].copy()
+    for iteration in range(iterations):
+        # argmin |x - c|^2 == argmax x.c - |c|^2 / 2
+        labels = np.argmax(sample @ centroids.T - 0.5 * np.einsum('ij,ij->i', centroids, centroids), axis=1)
+        counts = np.bincount(labels, minlength=clusters)
+        filled = counts > 0
+        order = np.argsort(labels, kind='stable')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        centroids[filled] = np.add.reduceat(sample[order], starts, axis=0) / counts[filled, None]
+    return centroids.astype(np.float32)
+
+class Int8Codec:
+    """Per-dimension affine scalar quantization to one byte per component.
+
+    x ~ offset + scale * code, so q.x ~ q.offset + (q * scale).code: the inner product is one
+    matrix product on the codes plus a per-query constant.
+    """
+
+    name = 'int8'
+
+    def __init__(self, offset, scale):
+        self.offset = offset
+        self.scale = scale
+
+    @classmethod
+    def train(cls, vectors, block_rows=65536, **options):
+        low = np.full(vectors.shape[1], np.inf, dtype=np.float32)
+        high = np.full(vectors.shape[1], -np.inf, dtype=np.float32)
+        for start in range(0, len(vectors), block_rows):
+            block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+            low = np.minimum(low, block.min(axis=0))
+            high = np.maximum(high, block.max(axis=0))
+        return cls(low, np.maximum(high - low, 1e-12) / 255)
+
+    def encode(self, block):
+        return np.clip(np.rint((block - self.offset) / self.scale), 0, 255).astype(np.uint8)
+
+    def code_shape(self, count, dimension):
+        return (count, dimension)
+
+    def write(self, codes, start, block):
+        codes[start:start + len(block)] = self.encode(block)
+
+    def take(self, codes, selection):
+        return codes[selection]
+
+    def prepare(self, queries):
+        return queries * self.scale, queries @ self.offset
+
+    def scores(self, prepared, codes):
+        scaled, constant = prepared
+        return scaled @ codes.astype(np.float32).T + constant[:, None]
+
+    def arrays(self):
+        return {'offset': self.offset, 'scale': self.scale}
+
+    def options(self):
+        return {}
+
+class PQCodec:
+    """Product quantization: `m` subspaces, each coded as one of 256 centroids (one byte).
+
+    Search uses asymmetric distance computation: per query, a table of the query's inner
+    product with every centroid of every subspace, summed over the codes of each row. Codes are
+    stored subspace-major, (m, rows), and the tables centroid-major, so every lookup gathers a
+    contiguous row of per-query values instead of single elements.
+    """
+
+    name = 'pq'
+
+    def __init__(self, codebooks):
+        self.codebooks = codebooks
+        self.m = len(codebooks)
+
+    @classmethod
+    def train(cls, vectors, m=None, iterations=10, sample_size=None, seed=0, **options):
+        dimension = vectors.shape[1]
+        m = m or max(1, dimension // 8)
+        if dimension % m:
+            raise ValueError(f'PQ subspaces ({m}) must divide the dimension ({dimension}).')
+        rng = np.random.default_rng(seed)
+        rows = np.sort(rng.choice(len(vectors), min(len(vectors), sample_size or 64 * 256), replace=False))
+        sample = np.asarray(vectors[rows], dtype=np.float32).reshape(len(rows), m, dimension // m)
+        return cls(np.stack([kmeans_l2(np.ascontiguousarray(sample[:, part]), 256, iterations, rng)
+                             for part in range(m)]))
+
+    def encode(self, block):
+        block = block.reshape(len(block), self.m, -1)
+        codes = np.empty((len(block), self.m), dtype=np.uint8)
+        for part, centroids in enumerate(self.codebooks):
+            codes[:, part] = np.argmax(block[:, part] @ centroids.T
+                                       - 0.5 * np.einsum('ij,ij->i', centroids, centroids), axis=1)
+        return codes
+
+    def code_shape(self, count, dimension):
+        return (self.m, count)
+
+    def write(self, codes, start, block):
+        codes[:, start:start + len(block)] = self.encode(block).T
+
+    def take(self, codes, selection):
+        return codes[:, selection]
+
+    def prepare(self, queries):
+        # (m, 256, queries) lookup table of partial inner products
+        return np.ascontiguousarray(np.einsum('qms,mcs->mcq', queries.reshape(len(queries), self.m, -1),
+                                              self.codebooks))
+
+    def scores(self, table, codes):
+        scores = np.zeros((codes.shape[1], table.shape[2]), dtype=np.float32)
+        for part in range(self.m):
+            scores += np.take(table[part], codes[part], axis=0)
+        return scores.T
+
+    def arrays(self):
+        return {'codebooks': self.codebooks}
+
+    def options(self):
+        return {'m': self.m}
+
+def load_codec(path, header):
+    arrays = np.load(os.path.join(path, CODEBOOK_FILE))
+    if header['type'] == 'int8':
+        return Int8Codec(arrays['offset'], arrays['scale'])
+    if header['type'] == 'pq':
+        return PQCodec(arrays['codebooks'])
+    raise ValueError(f"Unsupported codec {header['type']!r}.")
+
+@tracing.traced('quantization.build')
+def quantize_store(store, codec_name, block_rows=65536, **options):
+    """Train `codec_name` on `store`, write its codes next to the vectors and record it in the header.
+
+    The float vectors stay on disk for the re-rank; only the codes need to be memory resident.
+    """
+    if codec_name not in CODECS:
+        raise ValueError(f'Unsupported codec {codec_name!r}; expected one of {", ".join(CODECS)}.')
+    codec = (Int8Codec if codec_name == 'int8' else PQCodec).train(store.vectors, **options)
+    codes = np.lib.format.open_memmap(os.path.join(store.path, CODES_FILE), mode='w+', dtype=np.uint8,
+                                      shape=codec.code_shape(len(store), store.dimension))
+    for start in range(0, len(store), block_rows):
+        codec.write(codes, start, np.asarray(store.vectors[start:start + block_rows], dtype=np.float32))
+    codes.flush()
+    del codes
+    np.savez(os.path.join(store.path, CODEBOOK_FILE), **codec.arrays())
+    header = dict(store.header, codec=dict(codec.options(), type=codec.name))
+    with open(os.path.join(store.path, HEADER_FILE), 'w') as file:
+        json.dump(header, file, indent=2)
+
+class QuantizedStore(VectorStore):
+    """Vector store searched on its quantized codes, with a float re-rank of the best candidates."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        if 'codec' not in self.header:
+            raise ValueError(f'{path} has no quantized codes; run quantization.py first.')
+        self.codec = load_codec(path, self.header['codec'])
+        # Codes are read into memory: they are what every query scans
+        self.codes = np.load(os.path.join(path, CODES_FILE))
+
+    def memory_bytes(self):
+        return self.codes.nbytes + sum(array.nbytes for array in self.codec.arrays().values())
+
+    def exact_search(self, queries, k=10):
+        return super().search(queries, k)
+
+    @tracing.traced('quantization.search')
+    def search(self, queries, k=10, rerank=None, rows=None):
+        """Return (ids, scores) of the `k` best rows for each query, best first.
+
+        All codes, or the codes of `rows` only, are scored with asymmetric distance computation;
+        the `rerank` best candidates per query are then re-scored exactly against the float
+        vectors.
+        """
+        queries = self.prepare_queries(queries)
+        count = len(self) if rows is None else len(rows)
+        k = min(k, count)
+        prepared = self.codec.prepare(queries)
+        best_rows, best_scores = self.top_k_rows(
+            lambda selection: self.codec.scores(prepared, self.codec.take(self.codes, selection)),
+            len(queries), min(max(rerank or DEFAULT_RERANK, k), count), 16384, rows)
+
+        # Float re-rank, touching only the candidate rows of the memory-mapped matrix
+        flat = best_rows.ravel()
+        order = np.argsort(flat)
+        vectors = np.empty((len(flat), self.dimension), dtype=np.float32)
+        vectors[order] = self.vectors[flat[order]]
+        exact = np.einsum('qcd,qd->qc', vectors.reshape(len(queries), -1, self.dimension), queries)
+        keep = top_k(exact, k)
+        exact = np.take_along_axis(exact, keep, axis=1)
+        rows = np.take_along_axis(best_rows, keep, axis=1)
+        order = np.argsort(-exact, axis=1, kind='stable')
+        rows = np.take_along_axis(rows, order, axis=1)
+        return self.ids_of(rows), np.take_along_axis(exact, order, axis=1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Add int8 or product-quantized codes to a vector store.')
+    parser.add_argument('store', help='Vector store directory (see vector_store.py build).')
+    parser.add_argument('--codec', choices=CODECS, default='int8', help='Quantization codec.')
+    parser.add_argument('--m', type=int, default=None, help='PQ subspaces (default: dimension / 8).')
+    args = parser.parse_args()
+
+    store = VectorStore(args.store)
+    start = time.perf_counter()
+    quantize_store(store, args.codec, **({'m': args.m} if args.m else {}))
+    quantized = QuantizedStore(args.store)
+    print(f'Encoded {len(store)} vectors as {args.codec} in {time.perf_counter() - start:.2f}s: '
+          f'{quantized.memory_bytes() / 2**20:.1f} MiB of codes vs {store.vectors.nbytes / 2**20:.1f} MiB of vectors',
+          file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
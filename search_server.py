@@ -0,0 +1,372 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import tracing
+from bm25_index import FUSION_DEPTH, BM25Index, reciprocal_rank_fusion
+from metadata_index import MetadataIndex, check_filters, record_matches
+from vector_store import HEADER_FILE, VectorStore, default_store_path
+
+SEARCH_HOST = os.getenv('SEARCH_HOST', '127.0.0.1')
+SEARCH_PORT = int(os.getenv('SEARCH_PORT', '8000'))
+
+# Requests coalesced into one embedding call and one matrix search, and how long a batch
+# that is not full waits for more
+SEARCH_BATCH_SIZE = int(os.getenv('SEARCH_BATCH_SIZE', '64'))
+SEARCH_BATCH_WAIT_MS = float(os.getenv('SEARCH_BATCH_WAIT_MS', '1'))
+
+# Query embeddings kept in memory, keyed by normalized query text
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', '4096'))
+
+MODES = ('hybrid', 'vector', 'lexical')
+MAX_K = 100
+
+# Request latencies kept for the percentiles reported by /stats
+LATENCY_WINDOW = 10000
+
+def normalize_query(text):
+    return ' '.join(text.split())
+
+def open_store(path):
+    """Open the vector store at `path` with the search its header says it was built for."""
+    with open(os.path.join(path, HEADER_FILE)) as file:
+        header = json.load(file)
+    if header.get('index', {}).get('type') == 'ivf':
+        from ann_index import IVFIndex
+        return IVFIndex(path)
+    if 'codec' in header:
+        from quantization import QuantizedStore
+        return QuantizedStore(path)
+    return VectorStore(path)
+
+class QueryCache:
+    """LRU cache of query embeddings; safe to share between threads."""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, texts):
+        """Return ({text: vector} for the cached texts, [texts that are not cached])."""
+        found, missing = {}, []
+        with self.lock:
+            for text in dict.fromkeys(texts):
+                vector = self.entries.get(text)
+                if vector is None:
+                    missing.append(text)
+                else:
+                    self.entries.move_to_end(text)
+                    found[text] = vector
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, texts, vectors):
+        with self.lock:
+            for text, vector in zip(texts, vectors):
+                self.entries[text] = vector
+                self.entries.move_to_end(text)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+class SearchEngine:
+    """Answers batches of search requests against one vector store and its record store.
+
+    Shared by the HTTP server, which feeds it micro-batches, and the assistant's search_code
+    tool. A request is a dict with `query` and optionally `k`, `filters` (see metadata_index)
+    and `mode` (one of MODES; hybrid when the store has a BM25 index).
+    """
+
+    def __init__(self, index_path, store_path=None, cache_size=None):
+        from embeddings import embedder_for_model
+        self.index_path = index_path
+        self.store = open_store(store_path or default_store_path(index_path))
+        path = self.store.path
+        self.lexical = BM25Index(path) if BM25Index.exists(path) else None
+        self.metadata = MetadataIndex(path) if MetadataIndex.exists(path) else None
+        self.embedder = embedder_for_model(self.store.header['model'], self.store.dimension)
+        self.query_cache = QueryCache(cache_size or QUERY_CACHE_SIZE)
+        self.local = threading.local()
+
+    def records(self):
+        # SQLite connections belong to the thread that opened them
+        records = getattr(self.local, 'records', None)
+        if records is None:
+            from code_index import RecordStore
+            records = self.local.records = RecordStore(self.index_path)
+        return records
+
+    def prepare(self, request):
+        """Validate a request and fill in its defaults; raises ValueError for a bad one."""
+        query = normalize_query(request.get('query') or '')
+        if not query:
+            raise ValueError('The query is empty.')
+        mode = request.get('mode') or ('hybrid' if self.lexical else 'vector')
+        if mode not in MODES:
+            raise ValueError(f'Unsupported mode {mode!r}; expected one of {", ".join(MODES)}.')
+        if mode != 'vector' and self.lexical is None:
+            raise ValueError(f'{self.store.path} has no BM25 index; use mode vector.')
+        filters = check_filters(request.get('filters') or {})
+        if filters and self.metadata is None:
+            raise ValueError(f'{self.store.path} has no metadata index to filter on.')
+        return {'query': query, 'k': max(1, min(int(request.get('k') or 10), MAX_K)), 'filters': filters,
+                'mode': mode}
+
+    def embed(self, texts):
+        """Return the embeddings of `texts`, embedding the ones not cached in one call."""
+        vectors, missing = self.query_cache.get_many(texts)
+        if missing:
+            with tracing.span('search.embed', size=len(missing)):
+                fresh = self.embedder.embed(missing)
+            self.query_cache.put_many(missing, fresh)
+            vectors.update(zip(missing, fresh))
+        return np.stack([vectors[text] for text in texts])
+
+    @tracing.traced('search.batch')
+    def search_batch(self, requests):
+        """Answer a list of requests; returns one list of results per request.
+
+        All queries share one embedding call, and requests with the same filters share one
+        matrix search. A result is a chunk: its score, kind, name and the locations where
+        its text occurs.
+        """
+        requests = [self.prepare(request) for request in requests]
+        semantic = [request['query'] for request in requests if request['mode'] != 'lexical']
+        vectors = dict(zip(semantic, self.embed(semantic))) if semantic else {}
+        groups = {}
+        for position, request in enumerate(requests):
+            groups.setdefault(json.dumps(request['filters'], sort_keys=True), []).append(position)
+        rankings = [None] * len(requests)
+        for positions in groups.values():
+            rows = self.metadata.rows(requests[positions[0]]['filters']) if requests[positions[0]]['filters'] else None
+            depths = {position: requests[position]['k'] if requests[position]['mode'] != 'hybrid'
+                      else max(requests[position]['k'], FUSION_DEPTH) for position in positions}
+            ranked = {position: [] for position in positions}
+            semantic = [position for position in positions if requests[position]['mode'] != 'lexical']
+            if semantic:
+                ids, scores = self.store.search(np.stack([vectors[requests[position]['query']] for position in semantic]),
+                                                max(depths[position] for position in semantic), rows=rows)
+                for position, row_ids, row_scores in zip(semantic, ids, scores):
+                    ranked[position].append([(digest, float(score)) for digest, score in zip(row_ids, row_scores)
+                                             if np.isfinite(score)])
+            for position in positions:
+                request = requests[position]
+                if request['mode'] != 'vector':
+                    lexical_rows, lexical_scores = self.lexical.search(request['query'], depths[position], rows=rows)
+                    ranked[position].append(list(zip(self.store.ids[lexical_rows], lexical_scores.tolist())))
+                if request['mode'] == 'hybrid':
+                    rankings[position] = reciprocal_rank_fusion([[digest for digest, score in ranking]
+                                                                 for ranking in ranked[position]], request['k'])
+                else:
+                    rankings[position] = ranked[position][0][:request['k']]
+        return self.resolve(rankings, [request['filters'] for request in requests])
+
+    def resolve(self, rankings, filters):
+        """Turn rankings of [(chunk hash, score)] into results with the in-scope locations of each chunk.
+
+        The records of every ranked chunk are read in one query.
+        """
+        records = self.records().chunk_records(digest.decode() for ranking in rankings for digest, score in ranking)
+        results = []
+        for ranking, scope in zip(rankings, filters):
+            results.append([])
+            for digest, score in ranking:
+                matches = [record for record in records[digest.decode()] if record_matches(record, scope)]
+                if not matches:
+                    continue
+                results[-1].append({
+                    'hash': digest.decode(),
+                    'score': round(score, 4),
+                    'kind': matches[0]['kind'],
+                    'name': matches[0]['name'],
+                    'locations': [{'path': record['path'], 'line': record['line'], 'end_line': record['end_line'],
+                                   'module': record.get('module')} for record in matches],
+                })
+        return results
+
+    def stats(self):
+        return {'documents': len(self.store), 'query_cache': {
+            'size': len(self.query_cache.entries), 'hits': self.query_cache.hits, 'misses': self.query_cache.misses}}
+
+class MicroBatcher:
+    """Coalesces concurrent calls into batches for a function that takes a list of items.
+
+    A batch takes everything queued when the previous one finished, up to `max_batch` items,
+    and waits at most `max_wait` seconds for more when it is not full. Under load batches grow
+    by themselves; a lone request is delayed by no more than `max_wait`. The function runs on
+    `executor`, one batch at a time, so the event loop keeps accepting requests meanwhile.
+    """
+
+    def __init__(self, function, executor, max_batch=None, max_wait=None):
+        self.function = function
+        self.executor = executor
+        self.max_batch = max_batch or SEARCH_BATCH_SIZE
+        self.max_wait = (SEARCH_BATCH_WAIT_MS if max_wait is None else max_wait) / 1000
+        self.queue = None
+        self.worker = None
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.worker = loop.create_task(self.run())
+        future = loop.create_future()
+        self.queue.put_nowait((item, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batch_sizes.append(len(batch))
+            try:
+                results = await loop.run_in_executor(self.executor, self.function, [item for item, future in batch])
+            except Exception as error:
+                results = [error] * len(batch)
+            for (item, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self):
+        sizes = list(self.batch_sizes)
+        return {'batches': len(sizes), 'mean_batch': round(sum(sizes) / len(sizes), 2) if sizes else 0}
+
+def latency_stats(latencies):
+    if not latencies:
+        return {}
+    milliseconds = [seconds * 1000 for seconds in latencies]
+    return {'requests': len(milliseconds), 'p50_ms': round(tracing.percentile(milliseconds, 0.5), 2),
+            'p99_ms': round(tracing.percentile(milliseconds, 0.99), 2)}
+
+def create_app(engine, max_batch=None, max_wait=None):
+    """Build the FastAPI application: POST /search and GET /stats."""
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import JSONResponse
+    from pydantic import BaseModel
+
+    class SearchRequest(BaseModel):
+        query: str
+        k: int = 10
+        filters: dict[str, str | list[str]] = {}
+        mode: str | None = None
+
+    app = FastAPI(title='Odoo code search')
+    batcher = MicroBatcher(engine.search_batch, ThreadPoolExecutor(max_workers=1), max_batch, max_wait)
+    latencies = deque(maxlen=LATENCY_WINDOW)
+
+    @app.post('/search')
+    async def search(request: SearchRequest):
+        start = time.perf_counter()
+        try:
+            prepared = engine.prepare(request.model_dump())
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+        results = await batcher.submit(prepared)
+        latencies.append(time.perf_counter() - start)
+        # Results are plain JSON types already; skip FastAPI's recursive encoder
+        return JSONResponse({'results': results})
+
+    @app.get('/stats')
+    async def stats():
+        return dict(engine.stats(), **batcher.stats(), **latency_stats(latencies))
+
+    return app
+
+def sample_queries(engine, count, seed=0):
+    """Draw benchmark queries from the indexed chunks: 'kind name' of random rows."""
+    rng = random.Random(seed)
+    queries = []
+    for row in rng.sample(range(len(engine.store)), min(count, len(engine.store))):
+        for record in engine.records().iter_chunk_records(engine.store.ids[row].decode()):
+            queries.append(f"{record['kind']} {record['name']}")
+            break
+    return queries
+
+async def run_load(engine, queries, requests, concurrency, max_batch, max_wait, mode=None):
+    """Issue `requests` searches from `concurrency` clients through a micro-batcher.
+
+    Returns (QPS, latency stats, batcher stats).
+    """
+    batcher = MicroBatcher(engine.search_batch, ThreadPoolExecutor(max_workers=1), max_batch, max_wait)
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def client(seed):
+        rng = random.Random(seed)
+        for _ in remaining:
+            start = time.perf_counter()
+            await batcher.submit(engine.prepare({'query': rng.choice(queries), 'mode': mode}))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(seed) for seed in range(concurrency)))
+    batcher.worker.cancel()
+    return requests / (time.perf_counter() - start), latency_stats(latencies), batcher.stats()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve code search over HTTP, or benchmark it in-process.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve = subparsers.add_parser('serve', help='Run the FastAPI search server.')
+    benchmark = subparsers.add_parser('benchmark', help='Measure QPS and latency with and without micro-batching.')
+    for subparser in (serve, benchmark):
+        subparser.add_argument('index', help='Path of the index file written by index_update.')
+        subparser.add_argument('--store', help='Vector store directory (default: next to the index).')
+        subparser.add_argument('--batch-size', type=int, default=None, help='Largest micro-batch.')
+        subparser.add_argument('--batch-wait', type=float, default=None,
+                               help='Milliseconds a batch that is not full waits for more requests.')
+    serve.add_argument('--host', default=SEARCH_HOST, help='Interface to listen on.')
+    serve.add_argument('--port', type=int, default=SEARCH_PORT, help='Port to listen on.')
+    benchmark.add_argument('--requests', type=int, default=5000, help='Number of searches.')
+    benchmark.add_argument('--concurrency', type=int, default=64, help='Concurrent clients.')
+    benchmark.add_argument('--queries', type=int, default=1000, help='Distinct queries drawn from the index.')
+    benchmark.add_argument('--mode', choices=MODES, default=None, help='Search mode.')
+    args = parser.parse_args()
+
+    engine = SearchEngine(args.index, args.store)
+    if args.command == 'serve':
+        import uvicorn
+        uvicorn.run(create_app(engine, args.batch_size, args.batch_wait), host=args.host, port=args.port,
+                    log_level='warning')
+        return
+
+    queries = sample_queries(engine, args.queries)
+    print(f'{len(engine.store)} chunks, {len(queries)} distinct queries, {args.concurrency} clients', file=sys.stderr)
+    print(f'{"batching":<12} {"QPS":>8} {"p50 ms":>8} {"p99 ms":>8} {"mean batch":>11}')
+    for label, batch_size in (('off', 1), ('on', args.batch_size)):
+        engine.query_cache = QueryCache(engine.query_cache.size)
+        qps, latencies, batches = asyncio.run(run_load(engine, queries, args.requests, args.concurrency, batch_size,
+                                                       args.batch_wait, args.mode))
+        print(f"{label:<12} {qps:>8.0f} {latencies['p50_ms']:>8.2f} {latencies['p99_ms']:>8.2f} "
+              f"{batches['mean_batch']:>11.2f}")
+
+if __name__ == '__main__':
+    main()
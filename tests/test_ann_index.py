@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from ann_index import IVFIndex, build_ivf
+from vector_store import VectorStore, write_vector_store
+
+COUNT = 2000
+DIMENSION = 16
+CLUSTERS = 32
+
+@pytest.fixture(scope='module')
+def index(tmp_path_factory):
+    # Tight clusters, so probing the few lists nearest a query finds all of its neighbours
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((CLUSTERS, DIMENSION))
+    vectors = (centers[rng.integers(CLUSTERS, size=COUNT)]
+               + 0.05 * rng.standard_normal((COUNT, DIMENSION))).astype(np.float32)
+    ids = np.array([f'{row:040x}'.encode() for row in range(COUNT)], dtype='S')
+    path = tmp_path_factory.mktemp('store')
+    write_vector_store(str(path / 'store'), ids, [vectors], COUNT, DIMENSION)
+    build_ivf(VectorStore(str(path / 'store')), str(path / 'ivf'), nlist=32)
+    return IVFIndex(str(path / 'ivf'))
+
+@pytest.fixture(scope='module')
+def queries(index):
+    rng = np.random.default_rng(1)
+    return np.asarray(index.vectors[::250]) + 0.05 * rng.standard_normal((8, DIMENSION)).astype(np.float32)
+
+def test_filtered_search_matches_exact_search(index, queries):
+    # Large enough to take the probing path, sparse enough that probes miss some allowed rows
+    rows = np.arange(0, COUNT, 3)
+    ids, scores = index.search(queries, 10, nprobe=4, rows=rows)
+    exact_ids, exact_scores = index.exact_search(queries, 10, rows)
+    allowed = set(index.ids[rows].tolist())
+    assert all(item in allowed for item in ids.ravel().tolist())
+    assert np.array_equal(ids, exact_ids)
+    assert np.allclose(scores, exact_scores)
+
+def test_short_filtered_probes_fall_back_to_exact_search(index, queries):
+    rows = np.arange(0, COUNT, 7)
+    ids, scores = index.search(queries, 50, nprobe=1, rows=rows)
+    exact_ids, exact_scores = index.exact_search(queries, 50, rows)
+    assert np.array_equal(ids, exact_ids)
+    assert np.allclose(scores, exact_scores)
+
+def test_k_larger_than_probed_rows(index, queries):
+    ids, scores = index.search(queries, 200, nprobe=1)
+    assert ids.shape == scores.shape == (len(queries), 200)
+    found = np.isfinite(scores)
+    # The probed list is returned best first and the rest is padding
+    assert found.any(axis=1).all() and not found.all()
+    for row_scores, row_found in zip(scores, found):
+        assert np.all(np.diff(row_scores[row_found]) <= 0)
+        assert not row_found[np.argmin(row_found):].any()
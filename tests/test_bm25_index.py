@@ -0,0 +1,23 @@
+import numpy as np
+
+from bm25_index import BM25Index, tokenize, write_bm25_index
+from vector_store import write_vector_store
+
+def test_tokenize_splits_snake_and_camel_case():
+    assert list(tokenize('_compute_amount_total')) == ['compute_amount_total', 'compute', 'amount', 'total']
+    assert list(tokenize('HTTPServer')) == ['httpserver', 'http', 'server']
+
+def test_tokenize_keeps_non_ascii_identifiers_whole():
+    assert list(tokenize('größe_berechnen')) == ['größe_berechnen', 'größe', 'berechnen']
+    assert list(tokenize('Société')) == ['société']
+    assert list(tokenize('ÜberGröße')) == ['übergröße', 'über', 'größe']
+
+def test_search_finds_non_ascii_identifiers(tmp_path):
+    documents = ['def größe_berechnen(self): pass', 'class Société: pass', 'def compute_total(self): pass']
+    ids = np.array([f'{row:040x}'.encode() for row in range(len(documents))], dtype='S')
+    path = str(tmp_path / 'store')
+    write_vector_store(path, ids, [np.eye(len(documents), 4, dtype=np.float32)], len(documents), 4)
+    write_bm25_index(path, enumerate(documents), len(documents))
+    index = BM25Index(path)
+    assert index.search('größe', 2)[0].tolist() == [0]
+    assert index.search('société', 2)[0].tolist() == [1]
@@ -0,0 +1,34 @@
+from code_chunker import Chunker, chunk_file, xml_spans
+
+RECORD = '''    <record id="partner_{0}"
+            model="res.partner">
+        <field name="name">Partner {0}</field>
+    </record>
+'''
+
+def test_xml_records_are_streamed():
+    lines = ['<odoo>\n', '  <data>\n'] + [RECORD.format(i) for i in range(1000)] + ['  </data>\n', '</odoo>\n']
+    source = ''.join(lines).encode()
+    chunker = Chunker([], {}, 512, 64)
+    kept = []
+
+    def feed():
+        for line in source.splitlines(keepends=True):
+            kept.append(len(chunker.lines))
+            yield line
+
+    xml_spans(chunker, feed())
+    assert [chunk['name'] for chunk in chunker.chunks] == [f'partner_{i}' for i in range(1000)]
+    assert chunker.chunks[-1]['text'] == RECORD.format(999)
+    assert chunker.chunks[-1]['line'] == 2 + 4 * 999 + 1
+    assert max(kept) <= 6
+
+def test_only_access_rules_of_csv_files_are_chunked(tmp_path):
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'data' / 'res.partner.csv').write_text('id,name\n' + ''.join(f'p{i},P{i}\n' for i in range(5000)))
+    (tmp_path / 'security').mkdir()
+    (tmp_path / 'security' / 'ir.model.access.csv').write_text(
+        'id,name,model_id:id,group_id:id,perm_read\naccess_partner,partner,model_res_partner,,1\n')
+    assert chunk_file((str(tmp_path), 'data/res.partner.csv', 'a')) == []
+    [chunk] = chunk_file((str(tmp_path), 'security/ir.model.access.csv', 'a'))
+    assert chunk['kind'] == 'text' and 'access_partner' in chunk['text']
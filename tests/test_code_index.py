@@ -0,0 +1,38 @@
+import os
+import subprocess
+
+import git
+
+from code_index import RecordStore, update_index
+
+def run_git(root, *arguments):
+    subprocess.run(['git', '-C', str(root), '-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                    *arguments], check=True, capture_output=True)
+
+def chunk_texts(store):
+    return sorted(store.chunk_text(record['hash']) for record_id, record in store.iter_records(record_type='chunk'))
+
+def test_uncommitted_changes_are_reread_on_the_next_update(tmp_path):
+    root = tmp_path / 'repo'
+    root.mkdir()
+    run_git(root, 'init', '-q')
+    (root / 'a.py').write_text('committed = 1\n')
+    run_git(root, 'add', '.')
+    run_git(root, 'commit', '-qm', 'init')
+    store = RecordStore(str(tmp_path / 'index.sqlite3'))
+    try:
+        (root / 'a.py').write_text('committed = 1\ndirty = 1\n')
+        (root / 'untracked.py').write_text('untracked = 1\n')
+        summary = update_index(git.Repo(root), store)
+        assert summary['dirty'] == 2
+        assert chunk_texts(store) == ['committed = 1\ndirty = 1\n', 'untracked = 1\n']
+
+        # Same HEAD, clean tree: the dirty content must not stay in the index
+        run_git(root, 'checkout', 'a.py')
+        os.remove(root / 'untracked.py')
+        summary = update_index(git.Repo(root), store)
+        assert summary['dirty'] == 0
+        assert chunk_texts(store) == ['committed = 1\n']
+        assert update_index(git.Repo(root), store)['files'] == 0
+    finally:
+        store.close()
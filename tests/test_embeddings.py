@@ -0,0 +1,36 @@
+from multiprocessing import Pool
+
+import numpy as np
+
+from embeddings import EmbeddingCache
+
+DIMENSION = 8
+# Many small writes from several processes, so their appends interleave
+BATCHES = 1000
+ITEMS = 1
+
+def vector_of(digest):
+    return np.random.default_rng(int(digest, 16)).standard_normal(DIMENSION).astype(np.float32)
+
+def write(job):
+    path, writer = job
+    cache = EmbeddingCache(path)
+    try:
+        for batch in range(BATCHES):
+            hashes = [f'{writer:02x}{batch:04x}{item:02x}' for item in range(ITEMS)]
+            cache.put_many(hashes, np.array([vector_of(digest) for digest in hashes]), 'test', DIMENSION)
+    finally:
+        cache.close()
+
+def test_concurrent_writers_keep_every_vector(tmp_path):
+    with Pool(8) as pool:
+        pool.map(write, [(str(tmp_path), writer) for writer in range(8)])
+    cache = EmbeddingCache(str(tmp_path))
+    try:
+        hashes = [f'{writer:02x}{batch:04x}{item:02x}'
+                  for writer in range(8) for batch in range(BATCHES) for item in range(ITEMS)]
+        vectors, found = cache.get_many(hashes, 'test', DIMENSION)
+        assert found.all()
+        assert np.array_equal(vectors, np.array([vector_of(digest) for digest in hashes]))
+    finally:
+        cache.close()
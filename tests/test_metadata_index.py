@@ -0,0 +1,25 @@
+import pytest
+
+from metadata_index import MetadataIndex, parse_filters, record_matches, write_metadata_index
+
+@pytest.fixture
+def index(tmp_path):
+    write_metadata_index(str(tmp_path), {'module:sale': [1, 3, 5], 'module:crm': [2, 3], 'kind:method': [3, 4, 5]})
+    return MetadataIndex(str(tmp_path))
+
+def test_fields_without_values_do_not_filter(index):
+    assert index.rows({'module': []}) is None
+    assert index.rows({'module': ['sale'], 'kind': []}).tolist() == [1, 3, 5]
+    assert index.rows({'module': ['sale', 'crm'], 'kind': 'method'}).tolist() == [3, 5]
+    assert record_matches({'path': 'sale/models/x.py', 'module': 'sale'}, {'module': [], 'path': ['sale']})
+
+def test_bad_filters_are_rejected(index):
+    with pytest.raises(ValueError):
+        index.rows({'addon': ['sale']})
+    with pytest.raises(ValueError):
+        index.rows({'module': [None]})
+    with pytest.raises(ValueError):
+        parse_filters(['module='])
+    with pytest.raises(ValueError):
+        parse_filters(['addon=sale'])
+    assert parse_filters(['module=sale', 'module=crm']) == {'module': ['sale', 'crm']}
@@ -0,0 +1,15 @@
+from odoo_xml import ModelLookup
+
+def class_record(qualname, **fields):
+    return dict(type='class', path='sale/models/sale.py', qualname=qualname, **fields)
+
+def test_classes_resolve_to_their_model():
+    lookup = ModelLookup.from_records([
+        class_record('SaleOrder', model='sale.order'),
+        class_record('SaleOrderString', inherit='sale.order'),
+        class_record('SaleOrderList', inherit=['sale.order']),
+        class_record('Mixed', inherit=['mail.thread', 'mail.activity.mixin']),
+    ])
+    assert lookup.classes == {'sale.order': ['sale/models/sale.py:SaleOrder', 'sale/models/sale.py:SaleOrderString',
+                                             'sale/models/sale.py:SaleOrderList']}
+    assert lookup.resolve_ref('sale.model_sale_order') == 'sale.order'
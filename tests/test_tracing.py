@@ -0,0 +1,23 @@
+import asyncio
+
+import tracing
+
+def test_concurrent_tasks_are_traced_on_their_own_lanes(monkeypatch):
+    monkeypatch.setattr(tracing, '_enabled', True)
+    monkeypatch.setattr(tracing, '_events', [])
+
+    async def run(index):
+        with tracing.lane(f'prompt {index}'):
+            for _ in range(2):
+                with tracing.span('round', index=index):
+                    await asyncio.sleep(0.001 * index)
+
+    async def main():
+        await asyncio.gather(*(run(index) for index in range(1, 4)))
+
+    asyncio.run(main())
+    names = {event['tid']: event['args']['name'] for event in tracing._events if event['ph'] == 'M'}
+    spans = [event for event in tracing._events if event['ph'] == 'X']
+    assert len(set(names)) == 3
+    assert all(names[event['tid']] == f"prompt {event['args']['index']}" for event in spans)
+    assert tracing.summary()['round'][0] == 6
@@ -0,0 +1,151 @@
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+# Tracing is off unless TRACE or TRACE_FILE is set, or enable() is called
+TRACE_FILE = os.getenv('TRACE_FILE')
+
+_enabled = bool(os.getenv('TRACE') or TRACE_FILE)
+_events = []
+_pid = os.getpid()
+_origin = time.perf_counter()
+# Trace thread id of the lane() the current task runs in; spans elsewhere use the OS thread id
+_lane = contextvars.ContextVar('tracing_lane', default=None)
+_lane_ids = itertools.count(1)
+
+class _Span:
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        event = {
+            'name': self.name,
+            'ph': 'X',
+            'ts': (self.start - _origin) * 1e6,
+            'dur': (end - self.start) * 1e6,
+            'pid': _pid,
+            'tid': _lane.get() or threading.get_ident(),
+        }
+        if self.args or exc_type:
+            event['args'] = dict(self.args, error=exc_type.__name__) if exc_type else self.args
+        # list.append is atomic, so spans from worker threads need no lock
+        _events.append(event)
+        return False
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+class _Lane:
+    __slots__ = ('name', 'token')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        tid = next(_lane_ids)
+        _events.append({'name': 'thread_name', 'ph': 'M', 'pid': _pid, 'tid': tid, 'args': {'name': self.name}})
+        self.token = _lane.set(tid)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _lane.reset(self.token)
+        return False
+
+def enable(trace_file=None):
+    """Turn tracing on, optionally writing a Chrome trace to `trace_file` at finish()."""
+    global _enabled, TRACE_FILE
+    _enabled = True
+    if trace_file:
+        TRACE_FILE = trace_file
+
+def is_enabled():
+    return _enabled
+
+def span(name, **args):
+    """Context manager timing the enclosed block as span `name`. A shared no-op when tracing is off."""
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(name, args)
+
+def lane(name):
+    """Context manager giving the spans of the enclosed block a trace thread of their own, named `name`.
+
+    Chrome nests spans by thread id, so asyncio tasks interleaving on one OS thread each need a
+    lane; the lane is inherited by tasks started inside the block, not by executor threads.
+    """
+    if not _enabled:
+        return _NO_SPAN
+    return _Lane(name)
+
+def traced(name=None):
+    """Decorator recording every call of the function as a span."""
+    def decorator(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Span(span_name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def write_chrome_trace(path):
+    """Write the recorded spans as Chrome trace-event JSON (chrome://tracing, Perfetto)."""
+    with open(path, 'w') as file:
+        json.dump({'traceEvents': list(_events), 'displayTimeUnit': 'ms'}, file)
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def summary():
+    """Return {span name: (count, total ms, p50 ms, p95 ms)}, slowest total first."""
+    durations = defaultdict(list)
+    for event in list(_events):
+        if event['ph'] != 'X':
+            continue
+        durations[event['name']].append(event['dur'] / 1000)
+    rows = {name: (len(values), sum(values), percentile(values, 0.5), percentile(values, 0.95))
+            for name, values in durations.items()}
+    return dict(sorted(rows.items(), key=lambda item: -item[1][1]))
+
+def print_summary():
+    rows = summary()
+    if not rows:
+        return
+    print('Trace summary:')
+    print(f'  {"span":<40} {"count":>6} {"total ms":>10} {"p50 ms":>8} {"p95 ms":>8}')
+    for name, (count, total, p50, p95) in rows.items():
+        print(f'  {name:<40} {count:>6} {total:>10.1f} {p50:>8.1f} {p95:>8.1f}')
+
+def finish():
+    """Print the summary table and write the Chrome trace if a trace file is configured."""
+    if not _enabled:
+        return
+    print_summary()
+    if TRACE_FILE:
+        write_chrome_trace(TRACE_FILE)
+        print(f'Trace written to {TRACE_FILE}')
@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import tracing
+
+HEADER_FILE = 'header.json'
+VECTORS_FILE = 'vectors.npy'
+IDS_FILE = 'ids.npy'
+
+FORMAT_VERSION = 1
+DTYPES = ('float32', 'float16')
+METRICS = ('cosine', 'ip')
+
+# Rows are scored in blocks of about this many bytes of float32, bounding temporary memory
+SEARCH_BLOCK_BYTES = 64 << 20
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+def top_k(scores, k):
+    """Return the column indices of the `k` highest scores of each row, in no particular order."""
+    if scores.shape[1] <= k:
+        return np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    return np.argpartition(scores, -k, axis=1)[:, -k:]
+
+def write_vector_store(path, ids, blocks, count, dimension, dtype='float32', metric='cosine', **header):
+    """Write a vector store directory.
+
+    `blocks` yields float32 matrices whose rows follow `ids`; they are written straight into
+    the memory-mapped output, so the full matrix never has to fit in memory. For the cosine
+    metric rows are normalized on the way in and search reduces to an inner product.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f'Unsupported dtype {dtype!r}; expected one of {", ".join(DTYPES)}.')
+    if metric not in METRICS:
+        raise ValueError(f'Unsupported metric {metric!r}; expected one of {", ".join(METRICS)}.')
+    os.makedirs(path, exist_ok=True)
+    if os.path.exists(os.path.join(path, HEADER_FILE)):
+        os.remove(os.path.join(path, HEADER_FILE))
+    vectors = np.lib.format.open_memmap(os.path.join(path, VECTORS_FILE), mode='w+', dtype=dtype,
+                                        shape=(count, dimension))
+    row = 0
+    for block in blocks:
+        if metric == 'cosine':
+            block = normalize_rows(block)
+        vectors[row:row + len(block)] = block
+        row += len(block)
+    if row != count:
+        raise ValueError(f'Expected {count} vectors, got {row}.')
+    vectors.flush()
+    del vectors
+    np.save(os.path.join(path, IDS_FILE), np.asarray(ids, dtype='S'))
+    # The header goes last: a directory without one is an incomplete build
+    with open(os.path.join(path, HEADER_FILE), 'w') as file:
+        json.dump(dict(header, version=FORMAT_VERSION, count=count, dimension=dimension, dtype=dtype,
+                       metric=metric), file, indent=2)
+
+class VectorStore:
+    """Read-only, memory-mapped vector store with exact top-k search.
+
+    Opening a store maps its files without reading them, so startup does not depend on the
+    index size, and worker processes that open the same store share its pages through the
+    OS page cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, HEADER_FILE)) as file:
+            self.header = json.load(file)
+        if self.header.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector store version {self.header.get('version')} in {path}.")
+        self.metric = self.header['metric']
+        self.dimension = self.header['dimension']
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode='r')
+        self.ids = np.load(os.path.join(path, IDS_FILE), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def prepare_queries(self, queries):
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if queries.shape[1] != self.dimension:
+            raise ValueError(f'Query dimension {queries.shape[1]} does not match the store ({self.dimension}).')
+        return normalize_rows(queries) if self.metric == 'cosine' else queries
+
+    @tracing.traced('vector_store.search')
+    def search(self, queries, k=10, rows=None):
+        """Return (ids, scores) of the `k` best rows for each query, best first.
+
+        `queries` is one vector or a matrix of them; the results are (queries, k) arrays. The
+        store is scored block by block with one matrix product per block for all queries.
+        `rows`, a sorted array of row numbers (see metadata_index), restricts the search to
+        those rows before scoring.
+        """
+        queries = self.prepare_queries(queries)
+        block_rows = max(1, SEARCH_BLOCK_BYTES // (4 * self.dimension))
+        rows, scores = self.top_k_rows(
+            lambda selection: queries @ np.asarray(self.vectors[selection], dtype=np.float32).T,
+            len(queries), k, block_rows, rows)
+        return self.ids_of(rows), scores
+
+    def ids_of(self, rows):
+        """Return the ids of a matrix of row numbers."""
+        return self.ids[rows.ravel()].reshape(rows.shape)
+
+    def top_k_rows(self, score, query_count, k, block_rows, rows=None):
+        """Run `score(selection)` over all rows, or only `rows`, in blocks and keep the `k` best per query.
+
+        `selection` is a slice or an array of row numbers; `score` returns a (queries, rows)
+        matrix for it. Returns (row numbers, scores), best first.
+        """
+        count = len(self) if rows is None else len(rows)
+        k = min(k, count)
+        best_scores = np.empty((query_count, 0), dtype=np.float32)
+        best_rows = np.empty((query_count, 0), dtype=np.int64)
+        for start in range(0, count, block_rows):
+            if rows is None:
+                selection = slice(start, start + block_rows)
+                block_row_numbers = np.arange(start, min(start + block_rows, count))
+            else:
+                selection = block_row_numbers = rows[start:start + block_rows]
+            scores = score(selection)
+            columns = top_k(scores, k)
+            scores = np.concatenate([best_scores, np.take_along_axis(scores, columns, axis=1)], axis=1)
+            candidates = np.concatenate([best_rows, block_row_numbers[columns]], axis=1)
+            keep = top_k(scores, k)
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+            best_rows = np.take_along_axis(candidates, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+def build_from_index(store, cache, embedder, path, dtype='float32', metric='cosine', block_size=4096):
+    """Build a vector store at `path` from the chunks of a record store and their cached vectors.
+
+    Chunks without a cached vector are left out; run embeddings.embed_missing() first.
+    Returns the number of vectors written.
+    """
+    hashes = store.chunk_hashes()
+    cached = cache.rows(hashes, embedder.model, embedder.dimension)
+    hashes = [digest for digest in hashes if digest in cached]
+
+    def blocks():
+        for start in range(0, len(hashes), block_size):
+            yield cache.get_many(hashes[start:start + block_size], embedder.model, embedder.dimension)[0]
+
+    write_vector_store(path, hashes, blocks(), len(hashes), embedder.dimension, dtype=dtype, metric=metric,
+                       model=embedder.model)
+    return len(hashes)
+
+def default_store_path(index_path):
+    return os.path.splitext(index_path)[0] + '.vectors'
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query a memory-mapped vector store of indexed chunks.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='Build the store from an index and the embedding cache.')
+    build.add_argument('index', help='Path of the index file written by index_update.')
+    build.add_argument('--output', help='Store directory (default: next to the index).')
+    build.add_argument('--dtype', choices=DTYPES, default='float32', help='Storage type of the vectors.')
+    build.add_argument('--metric', choices=METRICS, default='cosine', help='Similarity metric.')
+    build.add_argument('--embedder', default=None, help='Embedder whose vectors to use (default: EMBEDDER).')
+    build.add_argument('--cache', default=None, help='Embedding cache directory.')
+    search = subparsers.add_parser('search', help='Search the store for chunks similar to a query.')
+    search.add_argument('index', help='Path of the index file written by index_update.')
+    search.add_argument('query', help='Query text.')
+    search.add_argument('-k', type=int, default=10, help='Number of results.')
+    search.add_argument('--store', help='Store directory (default: next to the index).')
+    search.add_argument('--filter', action='append', metavar='FIELD=VALUE',
+                        help='Restrict the search, e.g. module=sale or decorator=api.depends (repeatable).')
+    search.add_argument('--mode', choices=('hybrid', 'vector', 'lexical'), default=None,
+                        help='Ranking: vector, BM25 or both fused (default: hybrid when the store has a BM25 index).')
+    args = parser.parse_args()
+
+    from code_index import RecordStore
+    from bm25_index import BM25Index, build_bm25_index, hybrid_search
+    from embeddings import EmbeddingCache, embedder_for_model, get_embedder
+    from metadata_index import MetadataIndex, build_metadata_index, parse_filters, record_matches
+    records = RecordStore(args.index)
+    try:
+        if args.command == 'build':
+            cache = EmbeddingCache(args.cache)
+            start = time.perf_counter()
+            path = args.output or default_store_path(args.index)
+            try:
+                count = build_from_index(records, cache, get_embedder(args.embedder), path, args.dtype, args.metric)
+            finally:
+                cache.close()
+            terms = build_metadata_index(records, VectorStore(path))
+            vocabulary = build_bm25_index(records, VectorStore(path))
+            print(f'Wrote {count} vectors, {terms} metadata terms and {vocabulary} BM25 terms '
+                  f'in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+        else:
+            start = time.perf_counter()
+            vectors = VectorStore(args.store or default_store_path(args.index))
+            opened = time.perf_counter()
+            filters = parse_filters(args.filter)
+            rows = MetadataIndex(vectors.path).rows(filters) if filters else None
+            mode = args.mode or ('hybrid' if BM25Index.exists(vectors.path) else 'vector')
+            if mode == 'lexical':
+                lexical_rows, scores = BM25Index(vectors.path).search(args.query, args.k, rows=rows)
+                results = zip(vectors.ids[lexical_rows], scores)
+            else:
+                query_vector = embedder_for_model(vectors.header['model'], vectors.dimension).embed([args.query])
+                if mode == 'hybrid':
+                    results = hybrid_search(vectors, BM25Index(vectors.path), args.query, query_vector, args.k, rows)
+                else:
+                    ids, scores = vectors.search(query_vector, args.k, rows=rows)
+                    results = zip(ids[0], scores[0])
+            for digest, score in results:
+                for record in records.iter_chunk_records(digest.decode()):
+                    if not record_matches(record, filters):
+                        continue
+                    print(f"{score:.3f}  {record['path']}:{record['line']}  {record['kind']} {record['name']}")
+            print(f'Opened {len(vectors)} vectors in {(opened - start) * 1000:.1f}ms, '
+                  f'searched in {(time.perf_counter() - opened) * 1000:.1f}ms', file=sys.stderr)
+    finally:
+        records.close()
+
+if __name__ == '__main__':
+    main()